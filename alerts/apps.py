@@ -6,4 +6,5 @@ class AlertsConfig(AppConfig):
     name = "alerts"
 
     def ready(self):
+        import alerts.checks  # noqa: F401
         import alerts.signals  # noqa: F401
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from alerts.models import Beneficiary
+from alerts.utils import normalize_telephone
+
+BeneficiaryRef = namedtuple(
+    "BeneficiaryRef", ["beneficiary_id", "organization_id", "enabled"]
+)
+
+# Cached for telephones without an enabled beneficiary, so unknown senders
+# don't hit the database on every message either.
+NO_BENEFICIARY = BeneficiaryRef(None, None, False)
+
+
+class LRUCache:
+    """Thread safe, size bounded LRU cache whose entries expire after `timeout` seconds
+
+    Lives in the memory of a single worker process.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+beneficiaries = LRUCache(
+    settings.BENEFICIARY_LOCAL_CACHE_SIZE, settings.BENEFICIARY_LOCAL_CACHE_TIMEOUT
+)
+
+
+def _beneficiary_key(telephone):
+    return f"beneficiary-telephone:{telephone}"
+
+
+def resolve_beneficiary(telephone):
+    """Maps a telephone to the BeneficiaryRef of its enabled beneficiary
+
+    The telephone is normalized to E.164, then looked up in the worker LRU, the
+    shared cache and finally the database. Returns NO_BENEFICIARY when there is
+    no enabled beneficiary for the telephone.
+    """
+    telephone = normalize_telephone(telephone)
+    if not telephone:
+        return NO_BENEFICIARY
+    ref = beneficiaries.get(telephone)
+    if ref is not None:
+        return ref
+
+    key = _beneficiary_key(telephone)
+    cached = cache.get(key)
+    if cached is not None:
+        ref = BeneficiaryRef(*cached)
+    else:
+        row = (
+            Beneficiary.objects.filter(telephone_e164=telephone, enabled=True)
+            .values_list("id", "organization_id")
+            .first()
+        )
+        ref = BeneficiaryRef(*row, True) if row else NO_BENEFICIARY
+        cache.set(key, tuple(ref), settings.BENEFICIARY_CACHE_TIMEOUT)
+
+    beneficiaries.set(telephone, ref)
+    return ref
+
+
+def invalidate_beneficiary(*telephones):
+    """Drops the cached resolution of the given E.164 telephones from both tiers
+    once the current transaction commits, so a concurrent lookup can't cache
+    the old row again after they are dropped"""
+    transaction.on_commit(partial(_invalidate_beneficiaries, telephones), robust=True)
+
+
+def _invalidate_beneficiaries(telephones):
+    cache.delete_many([_beneficiary_key(telephone) for telephone in telephones])
+    for telephone in telephones:
+        beneficiaries.delete(telephone)
+
+
+recent_message_sids = LRUCache(
+    settings.TWILIO_LOCAL_MESSAGE_SIDS_SIZE, settings.TWILIO_MESSAGE_SID_TIMEOUT
+)
+
+
+def _message_sid_key(message_sid):
+    return f"twilio-message-sid:{message_sid}"
+
+
+def claim_message_sid(message_sid):
+    """Marks a Twilio MessageSid as received
+
+    Returns False when the MessageSid was already claimed, either by this worker
+    or by any other one sharing the cache, within TWILIO_MESSAGE_SID_TIMEOUT.
+    """
+    if recent_message_sids.get(message_sid):
+        return False
+    claimed = cache.add(
+        _message_sid_key(message_sid), True, settings.TWILIO_MESSAGE_SID_TIMEOUT
+    )
+    recent_message_sids.set(message_sid, True)
+    return claimed
+
+
+def release_message_sid(message_sid):
+    """Forgets a claimed MessageSid, so a retry of a failed message is processed"""
+    cache.delete(_message_sid_key(message_sid))
+    recent_message_sids.delete(message_sid)
+
+
+# Cache backends whose entries aren't seen by other worker processes
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def cache_is_shared():
+    """Whether every worker process sees the same default cache"""
+    backend = settings.CACHES["default"]["BACKEND"]
+    return settings.WEB_CONCURRENCY <= 1 or backend not in PROCESS_LOCAL_CACHES
+
+
+def _data_version_key(organization_id):
+    return f"data-version:{organization_id}"
+
+
+def data_version(organization_id):
+    """Returns the current version of the alerts, beneficiaries and types of the
+    organization, which changes whenever any of them does"""
+    key = _data_version_key(organization_id)
+    version = cache.get(key)
+    if version is None:
+        # Clock based, so a version lost from the cache is never handed out again
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(*organization_ids):
+    """Changes the data version of the given organizations once the current
+    transaction commits, so no request can read the new version before the data"""
+    transaction.on_commit(partial(_bump_data_versions, set(organization_ids)))
+
+
+def _bump_data_versions(organization_ids):
+    for organization_id in organization_ids:
+        key = _data_version_key(organization_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, time.time_ns(), None):
+                cache.incr(key)
@@ -0,0 +1,30 @@
+"""
+System checks of the settings the alerts app relies on.
+"""
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+from alerts.cache import cache_is_shared
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """The summary of alerts/summary.py and the data versions behind the ETags
+    of alerts/etags.py live in the cache, so with several worker processes it
+    must be one they all share"""
+    if not cache_is_shared():
+        backend = settings.CACHES["default"]["BACKEND"]
+        return [
+            Error(
+                f"The default cache {backend} is local to each process, but "
+                f"WEB_CONCURRENCY runs {settings.WEB_CONCURRENCY} worker processes.",
+                hint=(
+                    "Set CACHE_BACKEND to django.core.cache.backends.redis."
+                    "RedisCache along with REDIS_HOST and REDIS_PORT, or run a "
+                    "single worker process."
+                ),
+                id="alerts.E001",
+            )
+        ]
+    return []
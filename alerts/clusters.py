@@ -0,0 +1,190 @@
+"""
+Map clusters of alerts for /alerts/clusters/, aggregated by the database.
+
+At a zoom level the map is split into square clusters of `cluster_size` grid
+cells per side (see alerts/geo.py), about CLUSTER_PIXELS wide on screen, and a
+single GROUP BY over the cells of the alerts returns the count and centroid of
+each of them.
+
+Clusters are computed and cached in blocks of BLOCK_SIZE x BLOCK_SIZE aligned
+clusters, keyed by the data version of the organization (see
+alerts.cache.data_version), the filters and the zoom level. Panning the map
+only queries the blocks that come into view, and cached blocks are reused until
+an alert, beneficiary or type of the organization changes.
+"""
+
+import hashlib
+import math
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Value
+
+from alerts.cache import data_version
+from alerts.geo import (
+    CELLS_PER_DEGREE,
+    COLUMNS,
+    ROWS,
+    grid_column,
+    grid_ranges,
+    grid_row,
+    in_cells,
+)
+
+# Approximate width of a cluster on screen, with 256 pixels wide map tiles
+CLUSTER_PIXELS = 64
+TILE_PIXELS = 256
+
+BLOCK_SIZE = 8
+# Blocks a single request may cover
+MAX_BLOCKS = 256
+
+
+def cluster_size(zoom):
+    """Grid cells per side of the clusters of the zoom level"""
+    degrees = 360 / 2**zoom * CLUSTER_PIXELS / TILE_PIXELS
+    return max(1, math.floor(degrees * CELLS_PER_DEGREE))
+
+
+def _blocks(first, last, size):
+    return range(first // (size * BLOCK_SIZE), last // (size * BLOCK_SIZE) + 1)
+
+
+def cluster_blocks(min_latitude, min_longitude, max_latitude, max_longitude, size):
+    """(row, column) of the blocks of clusters of `size` covering the bbox"""
+    rows = _blocks(grid_row(min_latitude), grid_row(max_latitude), size)
+    first_column = grid_column(min_longitude)
+    last_column = grid_column(max_longitude)
+    if first_column <= last_column:
+        columns = list(_blocks(first_column, last_column, size))
+    else:
+        columns = [
+            *_blocks(first_column, COLUMNS - 1, size),
+            *_blocks(0, last_column, size),
+        ]
+    return [(row, column) for row in rows for column in columns]
+
+
+def _block_key(organization_id, version, filters, size, block):
+    return "alert-clusters:{}:{}:{}:{}:{}:{}".format(
+        organization_id, version, filters, size, *block
+    )
+
+
+def _filters_digest(filters):
+    query = urlencode(sorted(filters), doseq=True).encode()
+    return hashlib.md5(query, usedforsecurity=False).hexdigest()
+
+
+def _bounds(first, last, size, limit):
+    return first * size * BLOCK_SIZE, min((last + 1) * size * BLOCK_SIZE, limit) - 1
+
+
+def _merge(ranges):
+    merged = []
+    for first, last in ranges:
+        if merged and merged[-1][1] + 1 >= first:
+            merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def _compute_blocks(queryset, size, blocks):
+    """Returns the clusters of each of the blocks, which share their row,
+    computed with one query"""
+    first_row, last_row = _bounds(blocks[0][0], blocks[0][0], size, ROWS)
+    columns = sorted(column for row, column in blocks)
+    column_ranges = _merge(
+        [_bounds(column, column, size, COLUMNS) for column in columns]
+    )
+    cell_row = F("cell") / Value(COLUMNS)
+    cell_column = F("cell") - cell_row * Value(COLUMNS)
+    rows = (
+        queryset.filter(in_cells(grid_ranges(first_row, last_row, column_ranges)))
+        .annotate(
+            cluster_row=cell_row / Value(size),
+            cluster_column=cell_column / Value(size),
+        )
+        .values("cluster_row", "cluster_column")
+        .annotate(
+            count=Count("id"), latitude=Avg("latitude"), longitude=Avg("longitude")
+        )
+        .order_by()
+    )
+
+    clusters = {block: [] for block in blocks}
+    for row in rows:
+        block = (row["cluster_row"] // BLOCK_SIZE, row["cluster_column"] // BLOCK_SIZE)
+        # Wide rows are scanned whole, see grid_ranges
+        if block in clusters:
+            clusters[block].append(_cluster(row, size))
+    return clusters
+
+
+def _cluster(row, size):
+    min_latitude = row["cluster_row"] * size / CELLS_PER_DEGREE - 90
+    min_longitude = row["cluster_column"] * size / CELLS_PER_DEGREE - 180
+    degrees = size / CELLS_PER_DEGREE
+    return {
+        "latitude": round(float(row["latitude"]), 6),
+        "longitude": round(float(row["longitude"]), 6),
+        "count": row["count"],
+        "bbox": [
+            round(min_longitude, 6),
+            round(min_latitude, 6),
+            round(min(min_longitude + degrees, 180), 6),
+            round(min(min_latitude + degrees, 90), 6),
+        ],
+    }
+
+
+def get_clusters(queryset, organization_id, filters, bbox, zoom):
+    """Returns the clusters of the alerts of the queryset, which belong to the
+    organization and are filtered by the (name, value) `filters`, whose cells
+    intersect the bbox at the zoom level"""
+    size = cluster_size(zoom)
+    version = data_version(organization_id)
+    digest = _filters_digest(filters)
+    blocks = cluster_blocks(*bbox, size)
+    keys = {
+        block: _block_key(organization_id, version, digest, size, block)
+        for block in blocks
+    }
+    cached = cache.get_many(keys.values())
+    clusters = {block: cached[key] for block, key in keys.items() if key in cached}
+
+    # One query per row of missing blocks, e.g. the ones that came into view
+    missing = defaultdict(list)
+    for block in blocks:
+        if block not in clusters:
+            missing[block[0]].append(block)
+    for row_blocks in missing.values():
+        computed = _compute_blocks(queryset, size, row_blocks)
+        cache.set_many(
+            {keys[block]: computed[block] for block in computed},
+            settings.ALERTS_CLUSTERS_TIMEOUT,
+        )
+        clusters.update(computed)
+
+    min_latitude, min_longitude, max_latitude, max_longitude = bbox
+    return [
+        cluster
+        for block in blocks
+        for cluster in clusters[block]
+        if _intersects(cluster["bbox"], min_latitude, max_latitude)
+        and _intersects_longitude(cluster["bbox"], min_longitude, max_longitude)
+    ]
+
+
+def _intersects(cluster_bbox, min_latitude, max_latitude):
+    return cluster_bbox[1] <= max_latitude and cluster_bbox[3] >= min_latitude
+
+
+def _intersects_longitude(cluster_bbox, min_longitude, max_longitude):
+    west, east = cluster_bbox[0], cluster_bbox[2]
+    if min_longitude <= max_longitude:
+        return west <= max_longitude and east >= min_longitude
+    return east >= min_longitude or west <= max_longitude
@@ -0,0 +1,152 @@
+"""
+Coalescing of repeated panic messages.
+
+A beneficiary in distress often triggers the device several times in a row.
+Messages received while the beneficiary has a new (state N) alert created less
+than ALERTS_COALESCE_WINDOW seconds before are folded into that alert, which
+takes the latest location and counts the message in `hits`, instead of
+inserting (and broadcasting) another alert. Any other message, after the
+window or once an operator attended the alert, creates a new alert.
+
+Every message is also appended to the track of the alert that holds it, see
+save_positions. Positions keep the message_sid of their message, unique like
+the one of alerts, so a retried message is never folded twice.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from alerts.geo import grid_cell
+from alerts.models import Alert, AlertPosition, Beneficiary
+
+# Sent with `alerts` after folding messages into them with update(), which
+# skips post_save
+alerts_coalesced = Signal()
+
+
+def _position(alert):
+    return AlertPosition(
+        timestamp=alert.datetime,
+        latitude=float(alert.latitude),
+        longitude=float(alert.longitude),
+        message_sid=alert.message_sid or "",
+    )
+
+
+def _fold(target, alerts):
+    for alert in alerts:
+        alert.folded_into = target
+        target.latitude = alert.latitude
+        target.longitude = alert.longitude
+        target.hits += 1
+        target.received_positions.append(_position(alert))
+
+
+def _split(target, alerts, window):
+    """Splits the alerts, sorted by datetime, into the ones received within the
+    window of target and the rest"""
+    count = 0
+    while count < len(alerts) and alerts[count].datetime - target.datetime <= window:
+        count += 1
+    return alerts[:count], alerts[count:]
+
+
+def received_message_sids(message_sids):
+    """Returns the (alert id, organization id) of the alert holding each of the
+    given message_sids that was already received, as the message that created
+    the alert or as one folded into it"""
+    message_sids = [message_sid for message_sid in message_sids if message_sid]
+    if not message_sids:
+        return {}
+    received = {
+        message_sid: (alert_id, organization_id)
+        for message_sid, alert_id, organization_id in AlertPosition.objects.filter(
+            message_sid__in=message_sids
+        ).values_list("message_sid", "alert_id", "alert__organization_id")
+    }
+    # Alerts created before positions kept their message_sid
+    received.update(
+        (message_sid, (alert_id, organization_id))
+        for message_sid, alert_id, organization_id in Alert.objects.filter(
+            message_sid__in=message_sids
+        ).values_list("message_sid", "id", "organization_id")
+    )
+    return received
+
+
+def coalesce_alerts(alerts):
+    """Folds unsaved alerts into the new alert of their beneficiary created
+    within the window, or into the first of them received within the window of
+    each other
+
+    Must run inside a transaction, in which the returned alerts left to insert
+    should also be saved: the beneficiaries are locked until it ends so that
+    concurrent workers don't both insert a new alert for the same beneficiary.
+    Returns the alerts left to insert and the open alerts that were updated,
+    whose tracks must then be saved with save_positions.
+    """
+    for alert in alerts:
+        alert.received_positions = [_position(alert)]
+
+    if not settings.ALERTS_COALESCE_WINDOW or not alerts:
+        return alerts, []
+    window = timedelta(seconds=settings.ALERTS_COALESCE_WINDOW)
+
+    received = {}
+    for alert in sorted(alerts, key=lambda alert: alert.datetime):
+        received.setdefault(alert.beneficiary_id, []).append(alert)
+
+    list(
+        Beneficiary.objects.select_for_update()
+        .filter(pk__in=received)
+        .values_list("pk", flat=True)
+    )
+    since = min(alert.datetime for alert in alerts) - window
+    open_alerts = {
+        alert.beneficiary_id: alert
+        for alert in Alert.objects.filter(
+            beneficiary_id__in=received, state="N", datetime__gte=since
+        ).order_by("datetime", "id")
+    }
+
+    pending, updated = [], []
+    for beneficiary_id, messages in received.items():
+        target = open_alerts.get(beneficiary_id)
+        if target is not None:
+            folded, rest = _split(target, messages, window)
+            target.received_positions = []
+            _fold(target, folded)
+            # Conditional on the state, in case an operator attended it meanwhile
+            if folded and Alert.objects.filter(pk=target.pk, state="N").update(
+                latitude=target.latitude,
+                longitude=target.longitude,
+                cell=grid_cell(target.latitude, target.longitude),
+                hits=F("hits") + len(folded),
+                updated_at=timezone.now(),
+            ):
+                updated.append(target)
+                messages = rest
+        while messages:
+            target = messages[0]
+            folded, messages = _split(target, messages[1:], window)
+            _fold(target, folded)
+            pending.append(target)
+
+    if updated:
+        alerts_coalesced.send(sender=Alert, alerts=updated)
+    return pending, updated
+
+
+def save_positions(alerts):
+    """Appends the positions folded by coalesce_alerts into the given alerts,
+    once saved, to their tracks with a single insert"""
+    positions = []
+    for alert in alerts:
+        for position in alert.__dict__.pop("received_positions", []):
+            position.alert_id = alert.pk
+            positions.append(position)
+    AlertPosition.objects.bulk_create(positions)
@@ -1,19 +1,33 @@
-import json
+from urllib.parse import parse_qs
 
 from asgiref.sync import async_to_sync
 from channels.generic.websocket import WebsocketConsumer
 
+from backend.renderers import dumps, packb
+
+# Subprotocol (or ?format= value) asking for MessagePack binary frames
+MSGPACK_SUBPROTOCOL = "msgpack"
+
 
 class AlertConsumer(WebsocketConsumer):
     def connect(self):
         self.user = self.scope["user"]
         self.organization_group = self.scope["url_route"]["kwargs"]["organization_id"]
 
+        # Messages are sent as JSON text frames unless the client asks for
+        # MessagePack binary frames with the subprotocol or ?format=msgpack
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        subprotocol = None
+        if MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", []):
+            subprotocol = MSGPACK_SUBPROTOCOL
+        frame_format = query.get("format", [None])[0]
+        self.binary = subprotocol is not None or frame_format == MSGPACK_SUBPROTOCOL
+
         if self.user.organization.id == self.organization_group:
             async_to_sync(self.channel_layer.group_add)(
                 str(self.organization_group), self.channel_name
             )
-            self.accept()
+            self.accept(subprotocol)
         else:
             self.close()
 
@@ -21,7 +35,15 @@ class AlertConsumer(WebsocketConsumer):
         pass
 
     def alert_message(self, event, type="alert_message"):
-        message = event["message"]
+        self.send_message(event["message"])
 
+    def alerts_changed(self, event):
+        """Alerts updated together, e.g. by alerts/transition/"""
+        self.send_message(event["message"])
+
+    def send_message(self, message):
         # Send message to WebSocket
-        self.send(text_data=json.dumps(message))
+        if self.binary:
+            self.send(bytes_data=packb(message))
+        else:
+            self.send(text_data=dumps(message).decode())
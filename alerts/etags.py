@@ -0,0 +1,51 @@
+"""
+Conditional GET for the list endpoints polled by the dashboards.
+
+ETags are derived from the data version of the user's organization (see
+alerts.cache.data_version), so a request whose If-None-Match is still current
+is answered with 304 Not Modified after a single cache read, without querying
+the alerts. With several worker processes the versions must live in a shared
+cache (CACHE_BACKEND), otherwise a worker may not see the bumps of another and
+answer 304 for stale data: alerts/checks.py reports it, and until it's fixed
+responses are sent without ETags.
+"""
+
+import hashlib
+
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from alerts.cache import cache_is_shared, data_version
+
+
+class DataVersionETagMixin:
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(request, super().list, *args, **kwargs)
+
+    def get_etag(self, request, *parts):
+        """ETag of the response to the request with the current data version,
+        which also varies with the query string, the media type and `parts`"""
+        key = [
+            data_version(request.user.organization_id),
+            request.get_full_path(),
+            request.accepted_media_type,
+            *parts,
+        ]
+        digest = hashlib.md5(repr(key).encode(), usedforsecurity=False).hexdigest()
+        return f'"{digest}"'
+
+    def get_conditional_response(self, request, handler, *args, **kwargs):
+        if not cache_is_shared():
+            return handler(request, *args, **kwargs)
+        etag = self.get_etag(request)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response["ETag"] = etag
+            # Browsers revalidate on every poll instead of reusing the response
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,87 @@
+"""
+Streaming export of alerts as CSV or NDJSON.
+
+Rows are read through a server-side cursor in chunks of
+ALERTS_EXPORT_CHUNK_SIZE and encoded as they are sent, so the memory used by
+the worker doesn't grow with the number of exported alerts.
+
+Under ASGI, Django reads a sync iterator whole before sending it, so
+streaming_content hands it an async iterator that pulls one chunk at a time
+instead.
+"""
+
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from alerts.serializers import ALERT_VALUE_COLUMNS, alert_values, serialize_alert_values
+from backend.renderers import dumps
+
+# Free text columns, escaped so that spreadsheets don't evaluate them as formulas
+CSV_TEXT_COLUMNS = [
+    "beneficiary_name",
+    "beneficiary_description",
+    "beneficiary_type_description",
+    "observations",
+    "type_description",
+]
+
+
+def export_alerts(queryset, fields):
+    """Yields the given fields of the alerts of the queryset as AlertSerializer
+    renders them"""
+    chunk_size = settings.ALERTS_EXPORT_CHUNK_SIZE
+    rows = alert_values(queryset, fields=fields).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield from serialize_alert_values(chunk, fields)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _csv_safe(value):
+    if value and value[0] in "=+-@\t\r":
+        return "'" + value
+    return value
+
+
+def export_csv(queryset, fields=ALERT_VALUE_COLUMNS):
+    """Yields the lines of the CSV export of the alerts of the queryset"""
+    writer = csv.DictWriter(_Echo(), fieldnames=list(fields))
+    yield writer.writeheader()
+    for alert in export_alerts(queryset, fields):
+        for column in CSV_TEXT_COLUMNS:
+            if column in alert:
+                alert[column] = _csv_safe(alert[column])
+        yield writer.writerow(alert)
+
+
+def export_ndjson(queryset, fields=ALERT_VALUE_COLUMNS):
+    """Yields the lines of the NDJSON export of the alerts of the queryset"""
+    for alert in export_alerts(queryset, fields):
+        yield dumps(alert) + b"\n"
+
+
+async def _aiter_lines(lines):
+    # Chunks are read in the thread of the sync code of the request, which
+    # holds the server-side cursor
+    read = sync_to_async(
+        lambda: list(islice(lines, settings.ALERTS_EXPORT_CHUNK_SIZE)),
+        thread_sensitive=True,
+    )
+    while chunk := await read():
+        for line in chunk:
+            yield line
+
+
+def streaming_content(request, lines):
+    """Returns the lines as the content of a StreamingHttpResponse for the
+    Django request, an async iterator over them when served by ASGI"""
+    if isinstance(request, ASGIRequest):
+        return _aiter_lines(lines)
+    return lines
@@ -0,0 +1,68 @@
+from django.utils.translation import gettext_lazy as _
+from django_filters import rest_framework as filters
+from rest_framework import serializers
+
+from alerts.geo import filter_near, in_bbox, parse_bbox, parse_position
+from alerts.models import Alert, Beneficiary
+from alerts.search import search_beneficiaries
+from alerts.utils import normalize_telephone
+
+
+class BeneficiaryFilter(filters.FilterSet):
+    telephone = filters.CharFilter(method="filter_telephone")
+    search = filters.CharFilter(method="filter_search")
+
+    class Meta:
+        model = Beneficiary
+        fields = ["telephone", "name", "surname", "enabled", "search"]
+
+    def filter_telephone(self, queryset, name, value):
+        telephone = normalize_telephone(value)
+        if not telephone:
+            return queryset.none()
+        return queryset.filter(telephone_e164=telephone)
+
+    def filter_search(self, queryset, name, value):
+        return search_beneficiaries(queryset, value)
+
+
+class AlertFilter(filters.FilterSet):
+    # min_longitude,min_latitude,max_longitude,max_latitude of the visible map
+    bbox = filters.CharFilter(method="filter_bbox")
+    # latitude,longitude and radius in meters
+    near = filters.CharFilter(method="filter_near")
+    radius = filters.NumberFilter(method="filter_radius", min_value=0)
+
+    class Meta:
+        model = Alert
+        fields = {
+            "datetime": ["lte", "gte"],
+            "beneficiary_id": ["exact"],
+            "state": ["exact"],
+            "type": ["exact"],
+        }
+
+    def filter_bbox(self, queryset, name, value):
+        try:
+            bbox = parse_bbox(value)
+        except ValueError:
+            raise serializers.ValidationError({name: [_("Coordenadas inválidas.")]})
+        return queryset.filter(in_bbox(*bbox))
+
+    def filter_near(self, queryset, name, value):
+        try:
+            latitude, longitude = parse_position(value)
+            if abs(latitude) > 90:
+                raise ValueError(value)
+        except ValueError:
+            raise serializers.ValidationError({name: [_("Coordenadas inválidas.")]})
+        radius = self.form.cleaned_data.get("radius")
+        if radius is None:
+            raise serializers.ValidationError(
+                {"radius": [_("Se requiere el radio en metros.")]}
+            )
+        return filter_near(queryset, latitude, longitude, float(radius))
+
+    def filter_radius(self, queryset, name, value):
+        # Applied along with near
+        return queryset
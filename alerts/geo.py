@@ -0,0 +1,131 @@
+"""
+Spatial filtering of alerts on plain PostgreSQL or SQLite, without PostGIS.
+
+Every alert stores in `cell` the integer id of the cell of a fixed grid of
+1/CELLS_PER_DEGREE degrees (about 1.1 km) that holds its position, numbered
+row by row from (-90, -180). The index on (organization, cell) turns a
+bounding box into one short index range per grid row it covers; the exact
+bounds, or the distance to a point, are then checked on those candidates only.
+"""
+
+import math
+from functools import reduce
+from operator import or_
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast, Cos, Power, Radians, Sin
+
+CELLS_PER_DEGREE = 100
+ROWS = 180 * CELLS_PER_DEGREE
+COLUMNS = 360 * CELLS_PER_DEGREE
+
+# Beyond this many index ranges a bounding box is scanned as a single range
+MAX_CELL_RANGES = 64
+
+EARTH_RADIUS = 6_371_000  # meters
+
+
+def grid_row(latitude):
+    """Returns the row of the grid holding the latitude"""
+    return min(max(math.floor((float(latitude) + 90) * CELLS_PER_DEGREE), 0), ROWS - 1)
+
+
+def grid_column(longitude):
+    """Returns the column of the grid holding the longitude"""
+    column = math.floor((float(longitude) + 180) * CELLS_PER_DEGREE)
+    return min(max(column, 0), COLUMNS - 1)
+
+
+def grid_cell(latitude, longitude):
+    """Returns the id of the grid cell holding the position"""
+    return grid_row(latitude) * COLUMNS + grid_column(longitude)
+
+
+def cell_ranges(min_latitude, min_longitude, max_latitude, max_longitude):
+    """Returns the (first, last) ranges of the ids of the cells covering the
+    bounding box, which crosses the antimeridian when min_longitude is greater
+    than max_longitude"""
+    first_column, last_column = grid_column(min_longitude), grid_column(max_longitude)
+    if first_column <= last_column:
+        columns = [(first_column, last_column)]
+    else:
+        columns = [(first_column, COLUMNS - 1), (0, last_column)]
+    return grid_ranges(grid_row(min_latitude), grid_row(max_latitude), columns)
+
+
+def grid_ranges(first_row, last_row, columns):
+    """Returns the (first, last) ranges of the ids of the cells of the rows
+    between first_row and last_row and the (first, last) column ranges"""
+    if (last_row - first_row + 1) * len(columns) > MAX_CELL_RANGES:
+        return [(first_row * COLUMNS, last_row * COLUMNS + COLUMNS - 1)]
+    return [
+        (row * COLUMNS + first, row * COLUMNS + last)
+        for row in range(first_row, last_row + 1)
+        for first, last in columns
+    ]
+
+
+def in_cells(ranges):
+    """Q matching the positions in the given ranges of cells"""
+    return reduce(or_, [Q(cell__range=cell_range) for cell_range in ranges])
+
+
+def parse_bbox(value):
+    """Returns the (min_latitude, min_longitude, max_latitude, max_longitude)
+    of a min_longitude,min_latitude,max_longitude,max_latitude string, raising
+    ValueError if it isn't valid"""
+    min_longitude, min_latitude, max_longitude, max_latitude = parse_position(value, 4)
+    if not -90 <= min_latitude <= max_latitude <= 90:
+        raise ValueError(value)
+    return min_latitude, min_longitude, max_latitude, max_longitude
+
+
+def parse_position(value, count=2):
+    """Returns the `count` comma separated coordinates of the string, raising
+    ValueError if they aren't valid"""
+    coordinates = [float(part) for part in value.split(",")]
+    if len(coordinates) != count or not all(
+        abs(coordinate) <= 180 for coordinate in coordinates
+    ):
+        raise ValueError(value)
+    return coordinates
+
+
+def in_bbox(min_latitude, min_longitude, max_latitude, max_longitude):
+    """Q matching the positions inside the bounding box"""
+    ranges = cell_ranges(min_latitude, min_longitude, max_latitude, max_longitude)
+    query = in_cells(ranges) & Q(latitude__gte=min_latitude, latitude__lte=max_latitude)
+    if min_longitude <= max_longitude:
+        return query & Q(longitude__gte=min_longitude, longitude__lte=max_longitude)
+    return query & (Q(longitude__gte=min_longitude) | Q(longitude__lte=max_longitude))
+
+
+def bbox_around(latitude, longitude, radius):
+    """Bounding box (min_latitude, min_longitude, max_latitude, max_longitude)
+    of the circle of `radius` meters around the position"""
+    delta = math.degrees(radius / EARTH_RADIUS)
+    min_latitude, max_latitude = latitude - delta, latitude + delta
+    if min_latitude <= -90 or max_latitude >= 90:
+        return max(min_latitude, -90), -180, min(max_latitude, 90), 180
+    ratio = math.sin(radius / EARTH_RADIUS) / math.cos(math.radians(latitude))
+    if ratio >= 1 or radius >= math.pi * EARTH_RADIUS / 2:
+        return min_latitude, -180, max_latitude, 180
+    delta_longitude = math.degrees(math.asin(ratio))
+    min_longitude = (longitude - delta_longitude + 540) % 360 - 180
+    max_longitude = (longitude + delta_longitude + 540) % 360 - 180
+    return min_latitude, min_longitude, max_latitude, max_longitude
+
+
+def filter_near(queryset, latitude, longitude, radius):
+    """Filters the queryset to the positions within `radius` meters of the
+    given one, by great circle (haversine) distance"""
+    queryset = queryset.filter(in_bbox(*bbox_around(latitude, longitude, radius)))
+    phi, lam = math.radians(latitude), math.radians(longitude)
+    row_phi = Radians(Cast(F("latitude"), FloatField()))
+    row_lam = Radians(Cast(F("longitude"), FloatField()))
+    # Squared sine of half the central angle, compared with the one of the radius
+    sin_phi = Power(Sin((row_phi - Value(phi)) / 2), 2)
+    sin_lam = Power(Sin((row_lam - Value(lam)) / 2), 2)
+    haversine = sin_phi + Value(math.cos(phi)) * Cos(row_phi) * sin_lam
+    limit = math.sin(min(radius / EARTH_RADIUS, math.pi) / 2) ** 2
+    return queryset.alias(haversine=haversine).filter(haversine__lte=limit)
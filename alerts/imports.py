@@ -0,0 +1,109 @@
+"""
+Bulk import of beneficiaries from CSV or JSON, for beneficiaries/import/ and
+the import_beneficiaries command.
+
+Rows are handled in chunks of BENEFICIARY_IMPORT_CHUNK_SIZE. Each row is first
+validated on its own by BeneficiaryImportSerializer, which doesn't query the
+database; then the telephones and type ids of the whole chunk are checked with
+one IN query each, and the valid rows are inserted with a single bulk_create.
+Rows with errors are skipped and reported, the rest of the file is imported.
+"""
+
+import csv
+import io
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from alerts.models import Beneficiary, BeneficiaryType
+from alerts.serializers import BeneficiaryImportSerializer
+from alerts.signals import beneficiaries_created
+
+
+def read_csv(file):
+    """Yields the rows of a CSV file with a header, opened in binary mode,
+    leaving out empty cells so that their fields take their default"""
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig"))
+    for row in reader:
+        yield {key: value for key, value in row.items() if key and value}
+
+
+def _chunks(rows, size):
+    rows = enumerate(rows, 1)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def import_beneficiaries(organization, rows):
+    """Creates the beneficiaries of the organization given by the rows
+
+    Returns the number of beneficiaries created and the errors of the rows
+    that were skipped, along with their position starting at 1.
+    """
+    created = 0
+    errors = []
+    for chunk in _chunks(rows, settings.BENEFICIARY_IMPORT_CHUNK_SIZE):
+        chunk_created, chunk_errors = _import_chunk(organization, chunk)
+        created += chunk_created
+        errors += chunk_errors
+    return {"created": created, "errors": errors}
+
+
+def _import_chunk(organization, chunk):
+    errors = {}
+    valid = []
+    # A single serializer, building its fields once instead of once per row
+    serializer = BeneficiaryImportSerializer()
+    for row, data in chunk:
+        try:
+            validated_data = serializer.run_validation(data)
+        except ValidationError as exc:
+            errors[row] = as_serializer_error(exc)
+            continue
+        beneficiary = Beneficiary(organization=organization, **validated_data)
+        beneficiary.normalize()
+        valid.append((row, beneficiary))
+
+    # Telephones are unique across organizations, as in BeneficiarySerializer
+    telephones = {beneficiary.telephone_e164 for row, beneficiary in valid}
+    taken = set(
+        Beneficiary.objects.filter(telephone_e164__in=telephones).values_list(
+            "telephone_e164", flat=True
+        )
+    )
+    type_ids = {beneficiary.type_id for row, beneficiary in valid} - {None}
+    types = set()
+    if type_ids:
+        types = set(
+            BeneficiaryType.objects.filter(
+                organization=organization, id__in=type_ids
+            ).values_list("id", flat=True)
+        )
+
+    beneficiaries = []
+    for row, beneficiary in valid:
+        row_errors = {}
+        if beneficiary.telephone_e164 in taken:
+            row_errors["telephone"] = [
+                _("El teléfono se encuentra actualmente en uso por otro beneficiario.")
+            ]
+        if beneficiary.type_id is not None and beneficiary.type_id not in types:
+            row_errors["type_id"] = [_("El tipo de beneficiario es inválido.")]
+        if row_errors:
+            errors[row] = row_errors
+        else:
+            # Later rows of the chunk can't take the telephone either
+            taken.add(beneficiary.telephone_e164)
+            beneficiaries.append(beneficiary)
+
+    if beneficiaries:
+        with transaction.atomic():
+            Beneficiary.objects.bulk_create(beneficiaries)
+            beneficiaries_created.send(sender=Beneficiary, beneficiaries=beneficiaries)
+    return len(beneficiaries), [
+        {"row": row, "errors": errors[row]} for row in sorted(errors)
+    ]
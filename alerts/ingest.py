@@ -0,0 +1,389 @@
+"""
+Write-behind persistence of alerts received by the Twilio webhook.
+
+With ALERTS_INGEST_MODE = "batched" the webhook validates the SMS, queues an
+unsaved Alert and answers Twilio right away. A background thread per worker
+drains the queue, inserting up to ALERTS_INGEST_BATCH_SIZE alerts with a single
+bulk_create at most ALERTS_INGEST_MAX_LATENCY seconds after the first of them
+was queued, and broadcasts them through the `alerts_created` signal.
+
+Durability: when ALERTS_INGEST_JOURNAL_DIR is set, every queued alert is first
+appended (and fsynced) to a journal file owned by the worker process, which is
+truncated whenever the queue has been fully persisted. A worker holds an
+exclusive lock on its journal while alive, so journals left behind by a
+crashed worker are found unlocked and replayed by the next batcher that
+starts. Replays are idempotent because alerts, and the positions of messages
+folded into them, are unique on message_sid.
+
+A batch that fails to insert is retried ALERTS_INGEST_RETRIES times with
+backoff, then inserted one alert at a time so that a single bad alert can't
+hold back the queue. Alerts that still fail are logged and dropped from the
+queue, and kept in an `alerts-<pid>.rejected` file of the journal directory,
+in the journal format, to be inspected and replayed by hand.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from glob import glob
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+
+from alerts.coalesce import coalesce_alerts, received_message_sids, save_positions
+from alerts.models import Alert, Beneficiary
+from alerts.rollup import rollup_keys, update_rollups
+from alerts.signals import alerts_created
+from alerts.utils import normalize_telephone
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FIELDS = [
+    "beneficiary_id",
+    "organization_id",
+    "datetime",
+    "latitude",
+    "longitude",
+    "state",
+    "message_sid",
+]
+
+
+def alert_to_record(alert):
+    record = {field: getattr(alert, field) for field in JOURNAL_FIELDS}
+    record["datetime"] = alert.datetime.isoformat()
+    record["latitude"] = str(alert.latitude)
+    record["longitude"] = str(alert.longitude)
+    return record
+
+
+def alert_from_record(record):
+    alert = Alert(**record)
+    alert.datetime = parse_datetime(record["datetime"])
+    return alert
+
+
+def _insert_alerts(alerts):
+    """Coalesces and inserts the given alerts along with their positions,
+    returning the inserted ones"""
+    with transaction.atomic():
+        pending, updated = coalesce_alerts(alerts)
+        created = Alert.objects.bulk_create(pending)
+        save_positions(updated + created)
+        # bulk_create skips post_save, which counts the alerts saved one by one
+        update_rollups(added=rollup_keys(created))
+    return created
+
+
+def insert_alerts(alerts):
+    """Inserts the given unsaved alerts, skipping the ones whose message_sid
+    was already received and coalescing repeated ones. Returns the inserted
+    ones."""
+    seen = set(received_message_sids([alert.message_sid for alert in alerts]))
+    pending = []
+    for alert in alerts:
+        if alert.message_sid:
+            if alert.message_sid in seen:
+                continue
+            seen.add(alert.message_sid)
+        pending.append(alert)
+
+    try:
+        created = _insert_alerts(pending)
+    except IntegrityError:
+        # A concurrent insert took one of the message_sids, fall back to one by one
+        created = []
+        for alert in pending:
+            try:
+                created += _insert_alerts([alert])
+            except IntegrityError:
+                pass
+    return created
+
+
+def persist_alerts(alerts):
+    """Inserts the given unsaved alerts as insert_alerts does, and sends
+    `alerts_created` with the inserted ones"""
+    created = insert_alerts(alerts)
+    if created:
+        alerts_created.send(sender=Alert, alerts=created)
+    return created
+
+
+def ingest_readings(organization_id, readings):
+    """Creates the alerts of validated readings uploaded by a device or gateway
+
+    `readings` are dicts with telephone, latitude, longitude and optionally
+    timestamp and message_sid. Telephones are resolved against the enabled
+    beneficiaries of the organization with a single query and alerts are inserted
+    with a single bulk_create. Returns one result per reading, with a status of
+    "created", "coalesced", "duplicate" (its message_sid was already received) or
+    "error", and the id of the alert that holds it.
+    """
+    now = timezone.now()
+    telephones = [normalize_telephone(reading["telephone"]) for reading in readings]
+    beneficiary_ids = dict(
+        Beneficiary.objects.filter(
+            organization_id=organization_id,
+            enabled=True,
+            telephone_e164__in=set(telephones) - {""},
+        ).values_list("telephone_e164", "id")
+    )
+    message_sids = [reading.get("message_sid") or "" for reading in readings]
+    received = {
+        message_sid: alert_id if alert_organization_id == organization_id else None
+        for message_sid, (alert_id, alert_organization_id) in received_message_sids(
+            message_sids
+        ).items()
+    }
+
+    results = [None] * len(readings)
+    alerts = {}
+    repeated = {}
+    for index, reading in enumerate(readings):
+        message_sid = message_sids[index]
+        beneficiary_id = beneficiary_ids.get(telephones[index])
+        if message_sid in received:
+            results[index] = {"status": "duplicate", "id": received[message_sid]}
+        elif message_sid in repeated:
+            results[index] = {"status": "duplicate"}
+            repeated[message_sid].append(index)
+        elif beneficiary_id is None:
+            results[index] = {
+                "status": "error",
+                "errors": {
+                    "telephone": [
+                        _("El beneficiario no existe o se encuentra desactivado.")
+                    ]
+                },
+            }
+        else:
+            alerts[index] = Alert(
+                beneficiary_id=beneficiary_id,
+                datetime=reading.get("timestamp") or now,
+                latitude=reading["latitude"],
+                longitude=reading["longitude"],
+                state="N",
+                organization_id=organization_id,
+                message_sid=message_sid,
+            )
+            if message_sid:
+                repeated[message_sid] = [index]
+
+    with transaction.atomic():
+        pending, updated = coalesce_alerts(list(alerts.values()))
+        created = Alert.objects.bulk_create(pending)
+        save_positions(updated + created)
+        update_rollups(added=rollup_keys(created))
+
+    for index, alert in alerts.items():
+        if alert.pk:
+            results[index] = {"status": "created", "id": alert.pk}
+        else:
+            results[index] = {"status": "coalesced", "id": alert.folded_into.pk}
+        for other in repeated.get(alert.message_sid, [])[1:]:
+            results[other]["id"] = results[index]["id"]
+
+    if created:
+        alerts_created.send(sender=Alert, alerts=created)
+    return results
+
+
+class AlertBatcher:
+    def __init__(
+        self, queue_size, batch_size, max_latency, journal_dir=None, retries=5
+    ):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.retries = retries
+        self.journal_dir = journal_dir
+        self._journal = None
+        self._lock = threading.Lock()
+        self._thread = None
+        # Alerts queued or being inserted, the journal is kept until it drops to 0
+        self._pending = 0
+
+    def start(self):
+        """Replays orphaned journals and starts the background writer"""
+        if self.journal_dir:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            path = os.path.join(self.journal_dir, f"alerts-{os.getpid()}.journal")
+            self._journal = open(path, "a+", encoding="utf-8")
+            fcntl.flock(self._journal, fcntl.LOCK_EX)
+            self.replay()
+        self._thread = threading.Thread(
+            target=self.run, name="alert-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+    def submit(self, alert):
+        """Queues an unsaved alert. Returns False if the queue is full, in which
+        case the caller must persist the alert itself."""
+        with self._lock:
+            try:
+                self.queue.put_nowait(alert)
+            except queue.Full:
+                return False
+            self._pending += 1
+            if self._journal:
+                self._journal.write(json.dumps(alert_to_record(alert)) + "\n")
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+        return True
+
+    def collect(self):
+        """Blocks until an alert is queued and returns it along with the ones
+        queued within `max_latency` seconds, up to `batch_size`"""
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.collect()
+            self.persist(batch)
+            self.done(len(batch))
+
+    def persist(self, batch):
+        """Inserts the batch, retrying it with backoff and then alert by alert,
+        rejecting the alerts that can't be inserted, and sends `alerts_created`
+        with the inserted ones"""
+        delay = self.max_latency
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+            close_old_connections()
+            try:
+                created = insert_alerts(batch)
+                break
+            except Exception:
+                logger.exception("Error persisting %s queued alerts", len(batch))
+        else:
+            created = []
+            for alert in batch:
+                close_old_connections()
+                try:
+                    created += insert_alerts([alert])
+                except Exception:
+                    logger.exception("Rejecting queued alert %s", alert.message_sid)
+                    self.reject(alert)
+
+        # Already committed, a failing receiver mustn't insert them again
+        if created:
+            for receiver, response in alerts_created.send_robust(
+                sender=Alert, alerts=created
+            ):
+                if isinstance(response, Exception):
+                    logger.error(
+                        "Error handling %s inserted alerts in %r",
+                        len(created),
+                        receiver,
+                        exc_info=response,
+                    )
+
+    def reject(self, alert):
+        """Sets aside an alert that can't be inserted"""
+        record = json.dumps(alert_to_record(alert))
+        if not self.journal_dir:
+            logger.error("Rejected alert: %s", record)
+            return
+        path = os.path.join(self.journal_dir, f"alerts-{os.getpid()}.rejected")
+        with open(path, "a", encoding="utf-8") as rejected:
+            rejected.write(record + "\n")
+            rejected.flush()
+            os.fsync(rejected.fileno())
+
+    def flush(self):
+        """Persists everything queued so far in the calling thread"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        created = persist_alerts(batch) if batch else []
+        self.done(len(batch))
+        return created
+
+    def done(self, count):
+        """Records that `count` alerts were persisted, truncating the journal
+        once nothing is pending"""
+        with self._lock:
+            self._pending -= count
+            if self._journal and self._pending == 0:
+                self._journal.truncate(0)
+                self._journal.flush()
+
+    def replay(self):
+        """Persists the alerts of journals whose worker is no longer running"""
+        # A crashed worker may have had the same pid as this one
+        self._journal.seek(0)
+        self.replay_journal(self._journal)
+        self._journal.truncate(0)
+
+        for path in glob(os.path.join(self.journal_dir, "alerts-*.journal")):
+            if path == self._journal.name:
+                continue
+            with open(path, encoding="utf-8") as journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Owned by a live worker
+                self.replay_journal(journal)
+                os.remove(path)
+
+    def replay_journal(self, journal):
+        alerts = []
+        for line in journal:
+            try:
+                alerts.append(alert_from_record(json.loads(line)))
+            except ValueError:
+                # The last line may be incomplete if the worker died while writing it
+                logger.warning("Skipping unreadable line of %s", journal.name)
+        for start in range(0, len(alerts), self.batch_size):
+            end = start + self.batch_size
+            persist_alerts(alerts[start:end])
+        if alerts:
+            logger.warning("Replayed %s alerts from %s", len(alerts), journal.name)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Returns the batcher of this worker process, starting it on first use"""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = AlertBatcher(
+                settings.ALERTS_INGEST_QUEUE_SIZE,
+                settings.ALERTS_INGEST_BATCH_SIZE,
+                settings.ALERTS_INGEST_MAX_LATENCY,
+                settings.ALERTS_INGEST_JOURNAL_DIR,
+                settings.ALERTS_INGEST_RETRIES,
+            )
+            _batcher.start()
+        return _batcher
@@ -0,0 +1,64 @@
+"""
+Extraction of the coordinates sent in the body of a panic button SMS.
+
+Handsets and trackers send the position in several formats, e.g.:
+
+    https://maps.google.com/?q=-34.6037,-58.3816
+    https://www.google.com/maps/search/?api=1&query=-34.6037%2C-58.3816
+    https://www.google.com/maps/@-34.6037,-58.3816,15z
+    https://www.google.com/maps/place/Obelisco/@-34.6037,-58.3816,17z/data=...
+    geo:-34.6037,-58.3816?z=17
+    lat:-34.6037 lon:-58.3816
+    Ayuda! -34.6037, -58.3816
+"""
+
+import re
+from decimal import Decimal
+from typing import NamedTuple
+
+
+class Location(NamedTuple):
+    latitude: Decimal
+    longitude: Decimal
+
+
+_NUMBER = r"([-+]?\d{1,3}(?:\.\d+)?)"
+_DECIMAL = r"([-+]?\d{1,3}\.\d+)"
+_URL_SEPARATOR = r"\s*(?:,|%2C)(?:\s|\+|%20)*"
+
+LOCATION_PATTERNS = [
+    # geo URI (RFC 5870)
+    re.compile(r"\bgeo:" + _NUMBER + r"\s*,\s*" + _NUMBER, re.IGNORECASE),
+    # Query parameters of Google Maps links and their maps.app.goo.gl expansions
+    re.compile(
+        r"[?&](?:q|query|ll|daddr|destination)=(?:loc:)?"
+        + _NUMBER
+        + _URL_SEPARATOR
+        + _NUMBER,
+        re.IGNORECASE,
+    ),
+    # Map center of google.com/maps/@lat,lng,zoom and /maps/place/.../@lat,lng,zoom
+    re.compile(r"/@" + _NUMBER + r"," + _NUMBER),
+    # Labeled values, as sent by some trackers: "lat:-34.6037 lon:-58.3816"
+    re.compile(
+        r"\blat(?:itude)?\s*[:=]\s*"
+        + _NUMBER
+        + r"[^\d+-]{1,20}?\b(?:lng|lon|long|longitude)\s*[:=]\s*"
+        + _NUMBER,
+        re.IGNORECASE,
+    ),
+    # Bare pair, both with decimals so phone numbers or times don't match
+    re.compile(r"(?<![\w.])" + _DECIMAL + r"\s*[,;\s]\s*" + _DECIMAL + r"(?![\w.])"),
+]
+
+
+def parse_location(body):
+    """Returns the first valid Location found in the body, or None"""
+    if not body:
+        return None
+    for pattern in LOCATION_PATTERNS:
+        for match in pattern.finditer(body):
+            latitude, longitude = Decimal(match[1]), Decimal(match[2])
+            if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+                return Location(latitude, longitude)
+    return None
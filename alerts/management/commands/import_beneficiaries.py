@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from alerts.imports import import_beneficiaries, read_csv
+from users.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the beneficiaries of an organization from a CSV file with a "
+        "header, or from a JSON file holding a list, and reports the rows that "
+        "were skipped. Beneficiaries are inserted in chunks, so the ones "
+        "before an interruption are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file, by its extension")
+        parser.add_argument(
+            "--organization",
+            type=int,
+            required=True,
+            help="Id of the organization the beneficiaries belong to",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            organization = Organization.objects.get(pk=options["organization"])
+        except Organization.DoesNotExist:
+            raise CommandError(f"Organization {options['organization']} not found")
+
+        with open(options["path"], "rb") as file:
+            if options["path"].lower().endswith(".json"):
+                rows = json.load(file)
+            else:
+                rows = read_csv(file)
+            result = import_beneficiaries(organization, rows)
+
+        for error in result["errors"]:
+            errors = json.dumps(error["errors"], default=str, ensure_ascii=False)
+            self.stderr.write(f"Row {error['row']}: {errors}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {result['created']} beneficiaries, "
+                f"skipped {len(result['errors'])} rows"
+            )
+        )
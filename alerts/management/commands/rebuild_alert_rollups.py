@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from alerts.rollup import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recounts the hourly alert rollups behind /alerts-stats/ from the alerts "
+        "table. Run it once after migrating to load existing alerts; alerts "
+        "changed while it runs may be miscounted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--organization",
+            type=int,
+            help="Only rebuild the rollups of the organization with this id",
+        )
+
+    def handle(self, *args, **options):
+        created = rebuild_rollups(options["organization"])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} alert rollups"))
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0008_alter_beneficiary_company"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="alert",
+            index=models.Index(
+                fields=["organization", "-datetime", "-id"],
+                name="alert_org_datetime_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="alert",
+            index=models.Index(
+                fields=["organization", "state"], name="alert_org_state_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="alert",
+            index=models.Index(
+                condition=models.Q(("state__in", ["N", "A"])),
+                fields=["organization", "-datetime"],
+                name="alert_open_org_datetime_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="beneficiary",
+            index=models.Index(
+                condition=models.Q(("enabled", True)),
+                fields=["telephone"],
+                name="beneficiary_enabled_tel_idx",
+            ),
+        ),
+    ]
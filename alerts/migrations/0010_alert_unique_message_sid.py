@@ -0,0 +1,20 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0009_alert_beneficiary_indexes"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="alert",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("message_sid", ""), _negated=True),
+                fields=("message_sid",),
+                name="alert_unique_message_sid",
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+from alerts.utils import normalize_telephone
+
+BATCH_SIZE = 1000
+
+
+def fill_telephone_e164(apps, schema_editor):
+    Beneficiary = apps.get_model("alerts", "Beneficiary")
+    last_id = 0
+    while True:
+        batch = list(
+            Beneficiary.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "telephone")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for beneficiary in batch:
+            beneficiary.telephone_e164 = normalize_telephone(beneficiary.telephone)
+        Beneficiary.objects.bulk_update(batch, ["telephone_e164"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0010_alert_unique_message_sid"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="beneficiary",
+            name="telephone_e164",
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.RunPython(fill_telephone_e164, migrations.RunPython.noop),
+        # Created after the backfill so it is built once instead of updated per row
+        migrations.AlterField(
+            model_name="beneficiary",
+            name="telephone_e164",
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+        migrations.RemoveIndex(
+            model_name="beneficiary",
+            name="beneficiary_enabled_tel_idx",
+        ),
+    ]
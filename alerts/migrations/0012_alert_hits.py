@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0011_beneficiary_telephone_e164"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alert",
+            name="hits",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
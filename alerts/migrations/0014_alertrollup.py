@@ -0,0 +1,80 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:00
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_user_role"),
+        ("alerts", "0013_alertposition"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AlertRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField()),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[("N", "New"), ("A", "Attended"), ("C", "Closed")],
+                        max_length=1,
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "beneficiary_type",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="alerts.beneficiarytype",
+                        verbose_name="beneficiary type",
+                    ),
+                ),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="users.organization",
+                        verbose_name="organization",
+                    ),
+                ),
+                (
+                    "type",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="alerts.alerttype",
+                        verbose_name="type",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="alertrollup",
+            constraint=models.UniqueConstraint(
+                models.F("organization"),
+                models.F("hour"),
+                django.db.models.functions.comparison.Coalesce(
+                    models.F("type"), models.Value(0)
+                ),
+                django.db.models.functions.comparison.Coalesce(
+                    models.F("beneficiary_type"), models.Value(0)
+                ),
+                models.F("state"),
+                name="alert_rollup_unique_key",
+            ),
+        ),
+    ]
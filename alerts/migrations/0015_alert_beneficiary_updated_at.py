@@ -0,0 +1,36 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0014_alertrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alert",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="beneficiary",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="alert",
+            index=models.Index(
+                fields=["organization", "updated_at", "id"],
+                name="alert_org_updated_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="beneficiary",
+            index=models.Index(
+                fields=["organization", "updated_at", "id"],
+                name="beneficiary_org_updated_idx",
+            ),
+        ),
+    ]
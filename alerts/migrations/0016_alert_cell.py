@@ -0,0 +1,46 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+from alerts.geo import grid_cell
+
+BATCH_SIZE = 1000
+
+
+def fill_cell(apps, schema_editor):
+    Alert = apps.get_model("alerts", "Alert")
+    last_id = 0
+    while True:
+        batch = list(
+            Alert.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "latitude", "longitude")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for alert in batch:
+            alert.cell = grid_cell(alert.latitude, alert.longitude)
+        Alert.objects.bulk_update(batch, ["cell"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0015_alert_beneficiary_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alert",
+            name="cell",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(fill_cell, migrations.RunPython.noop),
+        # Created after the backfill so it is built once instead of updated per row
+        migrations.AddIndex(
+            model_name="alert",
+            index=models.Index(
+                fields=["organization", "cell"], name="alert_org_cell_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+from alerts.utils import normalize_text
+
+BATCH_SIZE = 1000
+
+
+def fill_search_fields(apps, schema_editor):
+    Beneficiary = apps.get_model("alerts", "Beneficiary")
+    last_id = 0
+    while True:
+        batch = list(
+            Beneficiary.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "name", "surname")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for beneficiary in batch:
+            name, surname = beneficiary.name, beneficiary.surname
+            beneficiary.search_name = normalize_text(f"{name} {surname}")[:129]
+            beneficiary.search_surname = normalize_text(f"{surname} {name}")[:129]
+        Beneficiary.objects.bulk_update(batch, ["search_name", "search_surname"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0016_alert_cell"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="beneficiary",
+            name="search_name",
+            field=models.CharField(blank=True, max_length=129),
+        ),
+        migrations.AddField(
+            model_name="beneficiary",
+            name="search_surname",
+            field=models.CharField(blank=True, max_length=129),
+        ),
+        migrations.RunPython(fill_search_fields, migrations.RunPython.noop),
+        # Created after the backfill so they are built once instead of updated per row
+        migrations.AddIndex(
+            model_name="beneficiary",
+            index=models.Index(
+                fields=["organization", "search_name"],
+                name="beneficiary_search_name_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="beneficiary",
+            index=models.Index(
+                fields=["organization", "search_surname"],
+                name="beneficiary_search_surn_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="beneficiary",
+            index=models.Index(
+                fields=["organization", "telephone"], name="beneficiary_org_tel_idx"
+            ),
+        ),
+    ]
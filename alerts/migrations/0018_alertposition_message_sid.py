@@ -0,0 +1,25 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0017_beneficiary_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="alertposition",
+            name="message_sid",
+            field=models.CharField(blank=True, max_length=34),
+        ),
+        migrations.AddConstraint(
+            model_name="alertposition",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("message_sid", ""), _negated=True),
+                fields=("message_sid",),
+                name="alert_position_unique_sid",
+            ),
+        ),
+    ]
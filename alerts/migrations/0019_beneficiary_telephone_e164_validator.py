@@ -0,0 +1,22 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+import alerts.utils
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0018_alertposition_message_sid"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="beneficiary",
+            name="telephone",
+            field=models.CharField(
+                max_length=32,
+                validators=[alerts.utils.only_int, alerts.utils.e164_telephone],
+            ),
+        ),
+    ]
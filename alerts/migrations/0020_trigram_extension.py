@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 16:05
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Creating the extension takes privileges the application's database user
+    # usually lacks. When it was already created by a DBA, as described in the
+    # README, this migration doesn't run any statement.
+    dependencies = [
+        ("alerts", "0019_beneficiary_telephone_e164_validator"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.2 on 2026-10-18 16:05
+
+from django.db import migrations
+
+TRIGRAM_INDEX = "beneficiary_search_trgm_idx"
+
+
+def create_trigram_index(apps, schema_editor):
+    # Matches inside words on PostgreSQL, see alerts/search.py
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON alerts_beneficiary "
+        "USING gin (search_name gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {TRIGRAM_INDEX}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("alerts", "0020_trigram_extension"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 
-from alerts.utils import only_int
+from alerts.geo import grid_cell
+from alerts.utils import e164_telephone, normalize_telephone, normalize_text, only_int
 from users.models import Organization, User
 
 
@@ -19,6 +22,15 @@ class BeneficiaryType(models.Model):
         super().save(*args, **kwargs)
 
 
+class BeneficiaryQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # Beneficiary.save() isn't called for them
+        objs = list(objs)
+        for beneficiary in objs:
+            beneficiary.normalize()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class Beneficiary(models.Model):
     COMPANY_CHOICES = [
         ("CLA", "Claro"),
@@ -31,8 +43,13 @@ class Beneficiary(models.Model):
     name = models.CharField(max_length=64, null=False, blank=False)
     surname = models.CharField(max_length=64, null=False, blank=False)
     telephone = models.CharField(
-        max_length=32, null=False, blank=False, validators=[only_int]
+        max_length=32,
+        null=False,
+        blank=False,
+        validators=[only_int, e164_telephone],
     )
+    # Filled on save, used to match the sender of incoming SMS
+    telephone_e164 = models.CharField(max_length=16, blank=True, db_index=True)
     company = models.CharField(
         max_length=3, choices=COMPANY_CHOICES, default="OTH", blank=True
     )
@@ -50,8 +67,62 @@ class Beneficiary(models.Model):
         null=True,
         verbose_name=_("type"),
     )
+    # Read by the delta sync of beneficiaries/changes/
+    updated_at = models.DateTimeField(auto_now=True)
+    # Filled on save, "name surname" and "surname name" as matched by
+    # ?search=, see alerts/search.py
+    search_name = models.CharField(max_length=129, blank=True)
+    search_surname = models.CharField(max_length=129, blank=True)
+
+    objects = BeneficiaryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["organization", "updated_at", "id"],
+                name="beneficiary_org_updated_idx",
+            ),
+            models.Index(
+                fields=["organization", "search_name"],
+                name="beneficiary_search_name_idx",
+            ),
+            models.Index(
+                fields=["organization", "search_surname"],
+                name="beneficiary_search_surn_idx",
+            ),
+            models.Index(
+                fields=["organization", "telephone"],
+                name="beneficiary_org_tel_idx",
+            ),
+        ]
+
+    # Fields derived by normalize() from each of the fields they depend on
+    NORMALIZED_FIELDS = {
+        "telephone": ["telephone_e164"],
+        "name": ["search_name", "search_surname"],
+        "surname": ["search_name", "search_surname"],
+    }
+
+    def normalize(self):
+        """Fills the fields derived from the telephone, name and surname"""
+        self.telephone_e164 = normalize_telephone(self.telephone)
+        self.search_name = normalize_text(f"{self.name} {self.surname}")[:129]
+        self.search_surname = normalize_text(f"{self.surname} {self.name}")[:129]
 
     def save(self, *args, **kwargs):
+        self.normalize()
+        update_fields = kwargs.get("update_fields")
+        if update_fields:
+            # updated_at too, read by the delta sync of beneficiaries/changes/
+            kwargs["update_fields"] = {
+                *update_fields,
+                *(
+                    derived
+                    for field in update_fields
+                    for derived in self.NORMALIZED_FIELDS.get(field, [])
+                ),
+                "updated_at",
+            }
         super().save(*args, **kwargs)
 
 
@@ -69,6 +140,15 @@ class AlertType(models.Model):
         super().save(*args, **kwargs)
 
 
+class AlertQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # Alert.save() isn't called for them
+        objs = list(objs)
+        for alert in objs:
+            alert.cell = grid_cell(alert.latitude, alert.longitude)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class Alert(models.Model):
     message_sid = models.CharField(max_length=34, blank=True)  # Used to Twilio
 
@@ -90,9 +170,14 @@ class Alert(models.Model):
 
     longitude = models.DecimalField(max_digits=10, decimal_places=8)
     latitude = models.DecimalField(max_digits=10, decimal_places=8)
+    # Filled on save, grid cell of the position used by the spatial filters,
+    # see alerts/geo.py
+    cell = models.IntegerField(null=True)
     state = models.CharField(
         max_length=1, choices=ALERT_STATUS, null=False, default="N"
     )
+    # Messages folded into this alert, see alerts/coalesce.py
+    hits = models.PositiveIntegerField(default=1)
     operator = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -112,9 +197,77 @@ class Alert(models.Model):
         null=False,
         verbose_name=_("organization"),
     )
+    # Read by the delta sync of alerts/changes/, queryset updates must set it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = AlertQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["organization", "-datetime", "-id"],
+                name="alert_org_datetime_idx",
+            ),
+            models.Index(fields=["organization", "state"], name="alert_org_state_idx"),
+            models.Index(
+                fields=["organization", "updated_at", "id"],
+                name="alert_org_updated_idx",
+            ),
+            models.Index(fields=["organization", "cell"], name="alert_org_cell_idx"),
+            models.Index(
+                fields=["organization", "-datetime"],
+                condition=Q(state__in=["N", "A"]),
+                name="alert_open_org_datetime_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["message_sid"],
+                condition=~Q(message_sid=""),
+                name="alert_unique_message_sid",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value
+            for name, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        self._set_loaded_values(fields)
+
+    def _set_loaded_values(self, fields=None):
+        """Records the values of the fields, all the loaded ones by default, as
+        the ones in the database. The rollup signals compare them on save
+        instead of reading the row again, see alerts/signals.py."""
+        if fields is None:
+            deferred = self.get_deferred_fields()
+            attnames = [
+                field.attname
+                for field in self._meta.concrete_fields
+                if field.attname not in deferred
+            ]
+        else:
+            attnames = [self._meta.get_field(name).attname for name in fields]
+        loaded_values = self.__dict__.setdefault("_loaded_values", {})
+        loaded_values.update((attname, getattr(self, attname)) for attname in attnames)
 
     def save(self, *args, **kwargs):
+        self.cell = grid_cell(self.latitude, self.longitude)
+        update_fields = kwargs.get("update_fields")
+        if update_fields:
+            # updated_at too, read by the delta sync of alerts/changes/
+            kwargs["update_fields"] = {*update_fields, "updated_at"}
+            if {"latitude", "longitude"} & set(update_fields):
+                kwargs["update_fields"].add("cell")
         super().save(*args, **kwargs)
+        self._set_loaded_values(kwargs.get("update_fields"))
 
     @property
     def telephone(self):
@@ -123,3 +276,83 @@ class Alert(models.Model):
     @telephone.setter
     def telephone(self, value):
         pass
+
+
+class AlertPosition(models.Model):
+    """Position received for an alert, its rows make up the alert's track
+
+    Append only. Kept compact for write throughput: double precision
+    coordinates and no index besides the (alert, timestamp) one and the unique
+    one on the message_sid of the message that carried the position, which
+    makes retries of messages folded into an alert safe.
+    """
+
+    alert = models.ForeignKey(
+        Alert,
+        on_delete=models.CASCADE,
+        null=False,
+        related_name="positions",
+        verbose_name=_("alert"),
+        db_index=False,  # Covered by alert_position_track_idx
+    )
+    timestamp = models.DateTimeField(null=False)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    message_sid = models.CharField(max_length=34, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["alert", "timestamp"], name="alert_position_track_idx"
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["message_sid"],
+                condition=~Q(message_sid=""),
+                name="alert_position_unique_sid",
+            ),
+        ]
+
+
+class AlertRollup(models.Model):
+    """Number of alerts of an organization per hour, type, beneficiary type and
+    state, kept up to date by alerts/rollup.py"""
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        null=False,
+        verbose_name=_("organization"),
+        db_index=False,  # Covered by alert_rollup_unique_key
+    )
+    # Start (UTC) of the hour of the datetime of the alerts
+    hour = models.DateTimeField(null=False)
+    type = models.ForeignKey(
+        AlertType,
+        on_delete=models.CASCADE,
+        null=True,
+        verbose_name=_("type"),
+    )
+    # Current type of the beneficiary of the alerts
+    beneficiary_type = models.ForeignKey(
+        BeneficiaryType,
+        on_delete=models.CASCADE,
+        null=True,
+        verbose_name=_("beneficiary type"),
+    )
+    state = models.CharField(max_length=1, choices=Alert.ALERT_STATUS, null=False)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULL types are coalesced so that they are unique as well
+            models.UniqueConstraint(
+                F("organization"),
+                F("hour"),
+                Coalesce(F("type"), Value(0)),
+                Coalesce(F("beneficiary_type"), Value(0)),
+                F("state"),
+                name="alert_rollup_unique_key",
+            ),
+        ]
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class AlertCursorPagination(CursorPagination):
+    """Keyset pagination over (datetime, id), newest first
+
+    Each page is fetched with a `WHERE datetime < <cursor>` condition instead of
+    an OFFSET, so deep pages cost the same as the first one and no COUNT(*) is run.
+    """
+
+    ordering = ("-datetime", "-id")
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
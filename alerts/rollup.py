@@ -0,0 +1,171 @@
+"""
+Hourly counts of alerts backing /alerts-stats/.
+
+AlertRollup holds the number of alerts per (organization, hour, type,
+beneficiary type, state). Rows are adjusted in the same transaction as the
+alerts they count: +1 when an alert is created, -1/+1 when its state, type or
+datetime changes and -1 when it's deleted, while changing the type of a
+beneficiary moves the counts of its alerts (see alerts/signals.py). Stats
+then read a few indexed rows instead of scanning the alerts table. Existing data is
+loaded, or recounted after a drift, with `manage.py rebuild_alert_rollups`.
+"""
+
+from collections import Counter, namedtuple
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+
+from alerts.models import Alert, AlertRollup, Beneficiary
+
+RollupKey = namedtuple(
+    "RollupKey", ["organization_id", "hour", "type_id", "beneficiary_type_id", "state"]
+)
+
+# Alert fields that make up its rollup key, along with its beneficiary's type
+ROLLUP_FIELDS = ["organization_id", "datetime", "type_id", "beneficiary_id", "state"]
+# The same fields, as they can be given in the update_fields of save()
+ROLLUP_UPDATE_FIELDS = {*ROLLUP_FIELDS, "organization", "type", "beneficiary"}
+
+
+def truncate_hour(datetime):
+    """The start of the UTC hour of the datetime, as rollups are keyed"""
+    return datetime.astimezone(dt_timezone.utc).replace(
+        minute=0, second=0, microsecond=0
+    )
+
+
+def round_up_hour(datetime):
+    """The start of the UTC hour following the datetime, or the datetime itself
+    when it starts an hour"""
+    hour = truncate_hour(datetime)
+    return hour if hour == datetime else hour + timedelta(hours=1)
+
+
+def rollup_keys(alerts):
+    """Returns the RollupKey of each of the given alerts"""
+    # The type of the beneficiaries already loaded, the rest in one query
+    beneficiary_types = {
+        alert.beneficiary.pk: alert.beneficiary.type_id
+        for alert in alerts
+        if Alert.beneficiary.is_cached(alert)
+    }
+    missing = {alert.beneficiary_id for alert in alerts} - beneficiary_types.keys()
+    if missing:
+        beneficiary_types.update(
+            Beneficiary.objects.filter(pk__in=missing).values_list("id", "type_id")
+        )
+    return [
+        RollupKey(
+            alert.organization_id,
+            truncate_hour(alert.datetime),
+            alert.type_id,
+            beneficiary_types.get(alert.beneficiary_id),
+            alert.state,
+        )
+        for alert in alerts
+    ]
+
+
+def update_rollups(added=(), removed=()):
+    """Counts an alert for each of the `added` keys and discounts one for each
+    of the `removed` ones"""
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    _apply(deltas)
+
+
+def _apply(deltas):
+    # Always in the same order, so concurrent transactions don't deadlock
+    for key, delta in sorted(deltas.items(), key=lambda item: _sort_key(item[0])):
+        if delta:
+            _add(key, delta)
+
+
+def _sort_key(key):
+    return [(value is None, value or 0) for value in key]
+
+
+def _add(key, delta):
+    rows = AlertRollup.objects.filter(**key._asdict())
+    if rows.update(count=F("count") + delta):
+        return
+    try:
+        with transaction.atomic():
+            AlertRollup.objects.create(**key._asdict(), count=delta)
+    except IntegrityError:
+        # Created by a concurrent transaction meanwhile
+        rows.update(count=F("count") + delta)
+
+
+def _counts(alerts):
+    """Rows with the RollupKey fields and count of the alerts of the queryset"""
+    return (
+        alerts.annotate(hour=TruncHour("datetime", tzinfo=dt_timezone.utc))
+        .values("organization_id", "hour", "type_id", "beneficiary__type_id", "state")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+
+
+def _key(row):
+    return RollupKey(
+        row["organization_id"],
+        row["hour"],
+        row["type_id"],
+        row["beneficiary__type_id"],
+        row["state"],
+    )
+
+
+def move_beneficiary_rollups(beneficiary_id, previous_type_id):
+    """Moves the counts of the alerts of the beneficiary from its previous type
+    to its current one"""
+    deltas = Counter()
+    for row in _counts(Alert.objects.filter(beneficiary_id=beneficiary_id)):
+        key = _key(row)
+        deltas[key._replace(beneficiary_type_id=previous_type_id)] -= row["count"]
+        deltas[key] += row["count"]
+    _apply(deltas)
+
+
+def merge_rollups(field, value):
+    """Moves the counts of the rollups whose `field` (type_id or
+    beneficiary_type_id) is `value` to the ones without it, as happens to the
+    alerts and beneficiaries when the type is deleted"""
+    rows = AlertRollup.objects.filter(**{field: value})
+    deltas = Counter()
+    for row in rows:
+        key = RollupKey(
+            row.organization_id,
+            row.hour,
+            row.type_id,
+            row.beneficiary_type_id,
+            row.state,
+        )
+        deltas[key._replace(**{field: None})] += row.count
+    rows.delete()
+    _apply(deltas)
+
+
+def rebuild_rollups(organization_id=None):
+    """Recounts the rollups of the organization, or of every one, from the
+    alerts table. Returns the number of rollups created."""
+    alerts = Alert.objects.all()
+    rollups = AlertRollup.objects.all()
+    if organization_id is not None:
+        alerts = alerts.filter(organization_id=organization_id)
+        rollups = rollups.filter(organization_id=organization_id)
+
+    with transaction.atomic():
+        rollups.delete()
+        created = AlertRollup.objects.bulk_create(
+            [
+                AlertRollup(**_key(row)._asdict(), count=row["count"])
+                for row in _counts(alerts)
+            ],
+            batch_size=1000,
+        )
+    return len(created)
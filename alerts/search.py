@@ -0,0 +1,57 @@
+"""
+Search of beneficiaries by name, surname or telephone (?search=).
+
+Names are matched against search_name ("name surname") and search_surname
+("surname name"), both normalized with alerts.utils.normalize_text, so that
+"per", "Pérez ju" and "juan p" all find Juan Pérez. Each match is a prefix
+range over an (organization, column) index, whose cost doesn't grow with the
+number of beneficiaries of the organization. Numbers are also matched as
+prefixes of the telephone.
+
+On PostgreSQL, when a term has 3 or more characters, the terms also match
+anywhere in search_name and in any order, backed by a pg_trgm GIN index (see
+migrations 0020 and 0021).
+"""
+
+import re
+from functools import reduce
+from operator import and_
+
+from django.db import connections
+from django.db.models import Q
+
+from alerts.utils import normalize_text
+
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _prefix(field, value):
+    """Q of the rows whose field starts with value, as a range the index can
+    scan (startswith alone isn't indexable on every backend and collation)"""
+    upper = value[:-1] + chr(ord(value[-1]) + 1)
+    return Q(
+        **{
+            f"{field}__gte": value,
+            f"{field}__lt": upper,
+            f"{field}__startswith": value,
+        }
+    )
+
+
+def search_beneficiaries(queryset, value):
+    """Filters the queryset to the beneficiaries matching the search"""
+    text = normalize_text(value)
+    if not text:
+        return queryset
+
+    query = _prefix("search_name", text) | _prefix("search_surname", text)
+    digits = re.sub(r"\D", "", value)
+    if digits and re.fullmatch(r"[\d\s()+-]+", value):
+        query |= _prefix("telephone", digits) | _prefix("telephone_e164", f"+{digits}")
+
+    terms = text.split()
+    if connections[queryset.db].vendor == "postgresql" and any(
+        len(term) >= TRIGRAM_MIN_LENGTH for term in terms
+    ):
+        query |= reduce(and_, [Q(search_name__contains=term) for term in terms])
+    return queryset.filter(query)
@@ -1,9 +1,58 @@
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from alerts.cache import resolve_beneficiary
+from alerts.clusters import MAX_BLOCKS, cluster_blocks, cluster_size
+from alerts.coalesce import coalesce_alerts, save_positions
+from alerts.geo import parse_bbox
+from alerts.models import Alert, AlertPosition, AlertType, Beneficiary, BeneficiaryType
+from alerts.transitions import TRANSITIONS
+from alerts.utils import e164_telephone, normalize_telephone, only_int
+
+
+def _field_list(value):
+    return [field.strip() for field in value.split(",") if field.strip()]
+
 
-from alerts.models import Alert, AlertType, Beneficiary, BeneficiaryType
-from alerts.utils import only_int
+def sparse_fields(request, available):
+    """Names of `available` to render for the request: the ones listed in
+    ?fields= (all of them by default) minus the ones listed in ?omit="""
+    requested = _field_list(request.query_params.get("fields", ""))
+    omitted = _field_list(request.query_params.get("omit", ""))
+    invalid = [field for field in requested + omitted if field not in available]
+    if invalid:
+        raise serializers.ValidationError(
+            {
+                "fields": [
+                    _("Campos inválidos: %(fields)s") % {"fields": ", ".join(invalid)}
+                ]
+            }
+        )
+    return [
+        field
+        for field in available
+        if (not requested or field in requested) and field not in omitted
+    ]
+
+
+class SparseFieldsMixin:
+    """Renders only the fields selected with ?fields= and ?omit= on GET
+    requests, while writes keep validating and returning every field"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is not None and request.method in SAFE_METHODS:
+            selected = sparse_fields(request, self.Meta.fields)
+            for field in self.Meta.fields:
+                if field not in selected:
+                    self.fields.pop(field)
 
 
 class BeneficiaryTypeSerializer(serializers.ModelSerializer):
@@ -98,12 +147,12 @@ class AlertTypeSerializer(serializers.ModelSerializer):
         return alert_type
 
 
-class BeneficiarySerializer(serializers.ModelSerializer):
+class BeneficiarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     name = serializers.CharField(max_length=64, required=True)
     surname = serializers.CharField(max_length=64, required=True)
     telephone = serializers.CharField(
-        max_length=32, required=True, validators=[only_int]
+        max_length=32, required=True, validators=[only_int, e164_telephone]
     )
     company = serializers.ChoiceField(
         choices=Beneficiary.COMPANY_CHOICES, default="OTH", required=False
@@ -129,7 +178,7 @@ class BeneficiarySerializer(serializers.ModelSerializer):
         if "telephone" in data:
             try:
                 existing_beneficiary = Beneficiary.objects.filter(
-                    telephone=data["telephone"]
+                    telephone_e164=normalize_telephone(data["telephone"])
                 )
                 if self.instance:
                     existing_beneficiary = existing_beneficiary.exclude(
@@ -188,7 +237,26 @@ class BeneficiarySerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class AlertSerializer(serializers.ModelSerializer):
+class BeneficiaryImportSerializer(serializers.Serializer):
+    """A beneficiary of a bulk import, validated without querying the database
+    (see alerts/imports.py)"""
+
+    name = serializers.CharField(max_length=64)
+    surname = serializers.CharField(max_length=64)
+    telephone = serializers.CharField(
+        max_length=32, validators=[only_int, e164_telephone]
+    )
+    company = serializers.ChoiceField(
+        choices=Beneficiary.COMPANY_CHOICES, default="OTH", required=False
+    )
+    enabled = serializers.BooleanField(default=True)
+    description = serializers.CharField(
+        max_length=512, allow_blank=True, default="", required=False
+    )
+    type_id = serializers.IntegerField(allow_null=True, required=False)
+
+
+class AlertSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     message_sid = serializers.CharField(
         max_length=34,
@@ -208,6 +276,7 @@ class AlertSerializer(serializers.ModelSerializer):
     state = serializers.ChoiceField(
         choices=Alert.ALERT_STATUS, required=False, default="N"
     )
+    hits = serializers.IntegerField(read_only=True)
     operator_id = serializers.IntegerField(allow_null=True, required=False)
     observations = serializers.CharField(
         max_length=512, required=False, allow_null=True, allow_blank=True
@@ -241,6 +310,7 @@ class AlertSerializer(serializers.ModelSerializer):
             "latitude",
             "longitude",
             "state",
+            "hits",
             "operator_id",
             "observations",
             "type_id",
@@ -248,26 +318,203 @@ class AlertSerializer(serializers.ModelSerializer):
             "message_sid",
         ]
 
+    def build(self, validated_data):
+        """Returns the unsaved alert for the beneficiary of the telephone"""
+        beneficiary = resolve_beneficiary(validated_data["telephone"])
+        if not beneficiary.enabled:
+            raise serializers.ValidationError(
+                _("El beneficiario no existe o se encuentra desactivado.")
+            )
+
+        return Alert(
+            beneficiary_id=beneficiary.beneficiary_id,
+            datetime=timezone.now(),
+            latitude=validated_data["latitude"],
+            longitude=validated_data["longitude"],
+            state="N",
+            organization_id=beneficiary.organization_id,
+            message_sid=validated_data.get("message_sid") or "",
+        )
+
     def create(self, validated_data):
-        existing_beneficiary = None
+        alert = self.build(validated_data)
+        with transaction.atomic():
+            pending, updated = coalesce_alerts([alert])
+            if updated:
+                alert = updated[0]
+            else:
+                alert.save(force_insert=True)
+            save_positions([alert])
+        return alert
+
+
+# Column read for each field of AlertSerializer, in the order of its output
+ALERT_VALUE_COLUMNS = {
+    "id": "id",
+    "datetime": "datetime",
+    "datetime_attended": "datetime_attended",
+    "datetime_closed": "datetime_closed",
+    "beneficiary_id": "beneficiary_id",
+    "beneficiary_name": "beneficiary__name",
+    "beneficiary_description": "beneficiary__description",
+    "beneficiary_type_description": "beneficiary__type__description",
+    "telephone": "beneficiary__telephone",
+    "latitude": "latitude",
+    "longitude": "longitude",
+    "state": "state",
+    "hits": "hits",
+    "operator_id": "operator_id",
+    "observations": "observations",
+    "type_id": "type_id",
+    "type_description": "type__description",
+    "message_sid": "message_sid",
+}
+
+
+def alert_values(queryset, *extra, fields=None):
+    """Rows of the alerts of the queryset with the columns of ALERT_VALUE_COLUMNS
+    for the given fields (all of them by default) and the `extra` ones. Only the
+    tables of those columns are joined."""
+    if fields is None:
+        fields = ALERT_VALUE_COLUMNS
+    return queryset.values(*[ALERT_VALUE_COLUMNS[field] for field in fields], *extra)
+
+
+def alert_relations(fields):
+    """Relations to select_related to render the given fields of alerts"""
+    columns = [ALERT_VALUE_COLUMNS[field] for field in fields]
+    return sorted({column.rpartition("__")[0] for column in columns if "__" in column})
+
+
+def serialize_alert_values(rows, fields=None):
+    """Same output as AlertSerializer(many=True).data for rows of alert_values
+    with the same fields
+
+    Builds the dicts straight from the rows, without instantiating models or
+    running the fields of AlertSerializer for each of them.
+    """
+    if fields is None:
+        fields = ALERT_VALUE_COLUMNS
+    to_datetime = serializers.DateTimeField().to_representation
+    converters = {
+        "datetime": to_datetime,
+        "datetime_attended": to_datetime,
+        "datetime_closed": to_datetime,
+        "latitude": str,
+        "longitude": str,
+    }
+    plain = [(field, ALERT_VALUE_COLUMNS[field]) for field in fields]
+    converted = [
+        (field, ALERT_VALUE_COLUMNS[field], converters[field])
+        for field in fields
+        if field in converters
+    ]
+    optional = "beneficiary_type_description" in fields
+    data = []
+    for row in rows:
+        item = {field: row[column] for field, column in plain}
+        for field, column, convert in converted:
+            item[field] = convert(row[column])
+        # AlertSerializer skips it for beneficiaries without type
+        if optional and item["beneficiary_type_description"] is None:
+            del item["beneficiary_type_description"]
+        data.append(item)
+    return data
+
+
+class AlertPositionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AlertPosition
+        fields = ["id", "timestamp", "latitude", "longitude"]
+
+
+class RoundedDecimalField(serializers.DecimalField):
+    """DecimalField that rounds extra decimal places instead of rejecting
+    them, as the database does"""
+
+    def validate_precision(self, value):
+        exponent = Decimal(1).scaleb(-self.decimal_places)
         try:
-            existing_beneficiary = Beneficiary.objects.get(
-                telephone=validated_data["telephone"],
-                enabled=True,
+            value = value.quantize(exponent, ROUND_HALF_EVEN)
+        except InvalidOperation:
+            self.fail("max_digits", max_digits=self.max_digits)
+        return super().validate_precision(value)
+
+
+class AlertReadingSerializer(serializers.Serializer):
+    """A reading uploaded in bulk by a tracker or SMS gateway"""
+
+    telephone = serializers.CharField(
+        max_length=32, required=True, validators=[only_int]
+    )
+    # Same precision as the columns of Alert
+    latitude = RoundedDecimalField(
+        max_digits=10, decimal_places=8, min_value=-90, max_value=90
+    )
+    longitude = RoundedDecimalField(
+        max_digits=10, decimal_places=8, min_value=-180, max_value=180
+    )
+    timestamp = serializers.DateTimeField(required=False)
+    message_sid = serializers.CharField(
+        max_length=34, required=False, allow_null=True, allow_blank=True
+    )
+
+
+class AlertTransitionSerializer(serializers.Serializer):
+    """Alerts to move to the given state together, see alerts/transitions.py"""
+
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    state = serializers.ChoiceField(choices=list(TRANSITIONS))
+
+    def validate_ids(self, value):
+        if len(value) > settings.ALERTS_TRANSITION_MAX_ITEMS:
+            raise serializers.ValidationError(
+                _("Se admiten hasta %(count)s alertas por solicitud")
+                % {"count": settings.ALERTS_TRANSITION_MAX_ITEMS}
             )
-        except Beneficiary.DoesNotExist:
+        return value
+
+
+class AlertStatsQuerySerializer(serializers.Serializer):
+    # Dimensions that can be grouped by, and their AlertRollup field
+    GROUPS = {
+        "hour": "hour",
+        "state": "state",
+        "type": "type_id",
+        "beneficiary_type": "beneficiary_type_id",
+    }
+
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    group_by = serializers.CharField(
+        required=False, allow_blank=True, default="hour,state,type,beneficiary_type"
+    )
+
+    def validate_group_by(self, value):
+        groups = [group.strip() for group in value.split(",") if group.strip()]
+        invalid = [group for group in groups if group not in self.GROUPS]
+        if invalid:
             raise serializers.ValidationError(
-                _("El beneficiario no existe o se encuentra desactivado.")
+                _("Agrupamiento inválido: %(groups)s") % {"groups": ", ".join(invalid)}
             )
+        return [self.GROUPS[group] for group in groups]
+
+
+class AlertClustersQuerySerializer(serializers.Serializer):
+    # min_longitude,min_latitude,max_longitude,max_latitude of the visible map
+    bbox = serializers.CharField()
+    zoom = serializers.IntegerField(min_value=0, max_value=22)
+
+    def validate_bbox(self, value):
+        try:
+            return parse_bbox(value)
+        except ValueError:
+            raise serializers.ValidationError(_("Coordenadas inválidas."))
 
-        if existing_beneficiary:
-            alert = Alert.objects.create(
-                beneficiary=existing_beneficiary,
-                datetime=timezone.now(),
-                latitude=validated_data["latitude"],
-                longitude=validated_data["longitude"],
-                state="N",
-                organization=existing_beneficiary.organization,
+    def validate(self, data):
+        size = cluster_size(data["zoom"])
+        if len(cluster_blocks(*data["bbox"], size)) > MAX_BLOCKS:
+            raise serializers.ValidationError(
+                {"bbox": [_("El área es demasiado grande para el nivel de zoom.")]}
             )
-        alert.save()
-        return alert
+        return data
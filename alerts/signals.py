@@ -1,21 +1,221 @@
+from functools import partial
+
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
 
-from alerts.models import Alert
-from alerts.serializers import AlertSerializer
+from alerts.cache import bump_data_version, invalidate_beneficiary
+from alerts.coalesce import alerts_coalesced
+from alerts.models import Alert, AlertType, Beneficiary, BeneficiaryType
+from alerts.rollup import (
+    ROLLUP_FIELDS,
+    ROLLUP_UPDATE_FIELDS,
+    merge_rollups,
+    move_beneficiary_rollups,
+    rollup_keys,
+    update_rollups,
+)
+from alerts.serializers import alert_values, serialize_alert_values
+from alerts.summary import invalidate_summary, refresh_summary
+from alerts.transitions import alerts_transitioned
 
+# Sent with `alerts` after inserting alerts with bulk_create, which skips
+# post_save. Their rollups are updated by the sender, in the same transaction.
+alerts_created = Signal()
+# Sent with `beneficiaries` after importing beneficiaries with bulk_create
+beneficiaries_created = Signal()
 
-@receiver(signal=post_save, sender=Alert)
-def alert_save_signal(sender, instance, created, **kwargs):
-    if created:
-        serializer = AlertSerializer(instance)
-        channel_layer = get_channel_layer()
+
+def broadcast_alerts(alerts):
+    """Sends the given alerts to the websocket group of their organization"""
+    # Load the beneficiaries and types in one query instead of one per relation
+    queryset = Alert.objects.filter(pk__in=[alert.pk for alert in alerts])
+    rows = list(alert_values(queryset.order_by("datetime", "id"), "organization_id"))
+    channel_layer = get_channel_layer()
+    for row, message in zip(rows, serialize_alert_values(rows)):
         async_to_sync(channel_layer.group_send)(
-            f"{instance.organization.id}",
+            f"{row['organization_id']}",
             {
                 "type": "alert_message",
-                "message": serializer.data,
+                "message": message,
             },
         )
+
+
+def broadcast_changes(alerts):
+    """Sends the given updated alerts to the websocket group of their
+    organization in a single alerts_changed message"""
+    queryset = Alert.objects.filter(pk__in=[alert.pk for alert in alerts])
+    rows = list(alert_values(queryset.order_by("datetime", "id"), "organization_id"))
+    organizations = {}
+    for row, message in zip(rows, serialize_alert_values(rows)):
+        organizations.setdefault(row["organization_id"], []).append(message)
+    channel_layer = get_channel_layer()
+    for organization_id, messages in organizations.items():
+        async_to_sync(channel_layer.group_send)(
+            f"{organization_id}",
+            {
+                "type": "alerts_changed",
+                "message": {"event": "alerts_changed", "alerts": messages},
+            },
+        )
+
+
+def alerts_changed(alerts):
+    """Updates the data version and summary of the organizations of the given
+    created, updated or deleted alerts once the current transaction commits"""
+    organizations = {}
+    for alert in alerts:
+        organizations.setdefault(alert.organization_id, []).append(alert.pk)
+    transaction.on_commit(partial(_alerts_changed, organizations), robust=True)
+
+
+def _alerts_changed(organizations):
+    for organization_id, alert_ids in organizations.items():
+        bump_data_version(organization_id)
+        refresh_summary(organization_id, alert_ids)
+
+
+@receiver(signal=post_save, sender=Alert)
+def alert_save_signal(sender, instance, created, **kwargs):
+    # Not before, the transaction creating it may still be rolled back
+    if created:
+        transaction.on_commit(partial(broadcast_alerts, [instance]), robust=True)
+
+
+@receiver(signal=alerts_created, sender=Alert)
+def alerts_created_signal(sender, alerts, **kwargs):
+    # Their rollups were updated along with the insert, see alerts/ingest.py
+    alerts_changed(alerts)
+    broadcast_alerts(alerts)
+
+
+def saves_rollup_fields(update_fields):
+    """Whether a save() with the given update_fields can change the rollup key
+    of the alert"""
+    return update_fields is None or bool(ROLLUP_UPDATE_FIELDS & set(update_fields))
+
+
+def stored_alert(alert):
+    """Returns the alert with the rollup fields it has in the database"""
+    values = Alert.objects.filter(pk=alert.pk).values(*ROLLUP_FIELDS).first()
+    return Alert(**values) if values else None
+
+
+def loaded_alert(alert):
+    """Returns the alert with the rollup fields it had when loaded or last
+    saved, or as it is in the database if some weren't loaded"""
+    loaded_values = getattr(alert, "_loaded_values", {})
+    if all(field in loaded_values for field in ROLLUP_FIELDS):
+        return Alert(**{field: loaded_values[field] for field in ROLLUP_FIELDS})
+    return stored_alert(alert)
+
+
+@receiver(signal=pre_save, sender=Alert)
+def alert_pre_save_signal(sender, instance, update_fields=None, **kwargs):
+    instance._previous_alert = None
+    if instance.pk and saves_rollup_fields(update_fields):
+        instance._previous_alert = loaded_alert(instance)
+
+
+@receiver(signal=pre_delete, sender=Alert)
+def alert_pre_delete_signal(sender, instance, **kwargs):
+    # Read again, the instance may have been loaded long ago
+    instance._previous_alert = stored_alert(instance)
+
+
+@receiver(signal=post_save, sender=Alert)
+def alert_rollup_signal(sender, instance, created, update_fields=None, **kwargs):
+    if not created and not saves_rollup_fields(update_fields):
+        return
+    previous = getattr(instance, "_previous_alert", None)
+    if created or previous is None:
+        update_rollups(added=rollup_keys([instance]))
+    elif any(
+        getattr(previous, field) != getattr(instance, field) for field in ROLLUP_FIELDS
+    ):
+        previous_key, key = rollup_keys([previous, instance])
+        if previous_key != key:
+            update_rollups(added=[key], removed=[previous_key])
+
+
+@receiver(signal=post_delete, sender=Alert)
+def alert_delete_signal(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_alert", None)
+    update_rollups(removed=rollup_keys([previous or instance]))
+
+
+@receiver(signal=pre_delete, sender=AlertType)
+def alert_type_delete_signal(sender, instance, **kwargs):
+    merge_rollups("type_id", instance.pk)
+
+
+@receiver(signal=pre_delete, sender=BeneficiaryType)
+def beneficiary_type_delete_signal(sender, instance, **kwargs):
+    merge_rollups("beneficiary_type_id", instance.pk)
+
+
+@receiver(signal=alerts_coalesced, sender=Alert)
+def alerts_coalesced_signal(sender, alerts, **kwargs):
+    alerts_changed(alerts)
+
+
+@receiver(signal=alerts_transitioned, sender=Alert)
+def alerts_transitioned_signal(sender, alerts, **kwargs):
+    alerts_changed(alerts)
+    broadcast_changes(alerts)
+
+
+@receiver(signal=[post_save, post_delete], sender=Alert)
+def alert_changed_signal(sender, instance, **kwargs):
+    alerts_changed([instance])
+
+
+@receiver(signal=[post_save, post_delete], sender=Beneficiary)
+@receiver(signal=[post_save, post_delete], sender=AlertType)
+@receiver(signal=[post_save, post_delete], sender=BeneficiaryType)
+def data_changed_signal(sender, instance, **kwargs):
+    bump_data_version(instance.organization_id)
+    invalidate_summary(instance.organization_id)
+
+
+@receiver(signal=pre_save, sender=Beneficiary)
+def beneficiary_pre_save_signal(sender, instance, **kwargs):
+    instance._previous_telephone_e164 = None
+    instance._previous_type_id = instance.type_id
+    if instance.pk:
+        previous = (
+            Beneficiary.objects.filter(pk=instance.pk)
+            .values_list("telephone_e164", "type_id")
+            .first()
+        )
+        if previous:
+            instance._previous_telephone_e164, instance._previous_type_id = previous
+
+
+@receiver(signal=post_save, sender=Beneficiary)
+def beneficiary_save_signal(sender, instance, **kwargs):
+    telephones = {
+        instance.telephone_e164,
+        getattr(instance, "_previous_telephone_e164", None),
+    }
+    invalidate_beneficiary(*(telephone for telephone in telephones if telephone))
+    previous_type_id = getattr(instance, "_previous_type_id", instance.type_id)
+    if previous_type_id != instance.type_id:
+        move_beneficiary_rollups(instance.pk, previous_type_id)
+
+
+@receiver(signal=beneficiaries_created, sender=Beneficiary)
+def beneficiaries_created_signal(sender, beneficiaries, **kwargs):
+    bump_data_version(*{beneficiary.organization_id for beneficiary in beneficiaries})
+    # Drops the cached "no beneficiary" of their telephones
+    invalidate_beneficiary(
+        *{beneficiary.telephone_e164 for beneficiary in beneficiaries}
+    )
+
+
+@receiver(signal=post_delete, sender=Beneficiary)
+def beneficiary_delete_signal(sender, instance, **kwargs):
+    invalidate_beneficiary(instance.telephone_e164)
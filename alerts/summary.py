@@ -0,0 +1,184 @@
+"""
+Rolling 24h summary of the alerts of each organization, served by
+/alerts-summary/ from the shared cache without querying the database. All the
+worker processes must share that cache, as checked by alerts/checks.py.
+
+The summary holds the serialized alerts of the window, newest first. It is
+built from the database on the first read (or after expiring, being evicted or
+invalidated) and then kept up to date incrementally: once a transaction that
+creates, updates or deletes alerts commits, only those alerts are read again
+and appended to a log of deltas. Readers merge the pending deltas into the
+base snapshot, and store the merged snapshot back every
+ALERTS_SUMMARY_COMPACT_AFTER deltas. Alerts that age out of the window are
+dropped when reading. Changes to beneficiaries and types, whose descriptions
+are copied into the rows, invalidate it instead.
+
+No locks are taken. Each build starts a new generation, whose keys are apart
+from the ones of the previous builds; deltas take their position in the log
+with an atomic increment before reading the alerts, so that the last delta of
+an alert always holds its latest state. A delta that isn't stored yet is
+skipped until it is, and a summary with too many of them is built again.
+"""
+
+from datetime import timedelta
+from functools import partial
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from alerts.models import Alert
+from alerts.serializers import alert_values, serialize_alert_values
+
+SUMMARY_WINDOW = timedelta(days=1)
+
+
+def _summary_key(organization_id):
+    """Key of the current generation of the summary of the organization"""
+    return f"alerts-summary:{organization_id}"
+
+
+def _base_key(organization_id, generation):
+    return f"alerts-summary:{organization_id}:{generation}"
+
+
+def _log_key(organization_id, generation, position=None):
+    if position is None:
+        return f"alerts-summary:{organization_id}:{generation}:log"
+    return f"alerts-summary:{organization_id}:{generation}:log:{position}"
+
+
+def _window(organization_id):
+    return Alert.objects.filter(
+        organization_id=organization_id,
+        datetime__gte=timezone.now() - SUMMARY_WINDOW,
+    )
+
+
+def _entries(queryset):
+    """(timestamp, id, serialized alert) of the alerts of the queryset"""
+    rows = list(alert_values(queryset))
+    return [
+        (row["datetime"].timestamp(), row["id"], item)
+        for row, item in zip(rows, serialize_alert_values(rows))
+    ]
+
+
+def _sorted(entries):
+    since = (timezone.now() - SUMMARY_WINDOW).timestamp()
+    entries = [entry for entry in entries if entry[0] >= since]
+    return sorted(entries, key=lambda entry: entry[:2], reverse=True)
+
+
+def _apply(entries, delta):
+    """Replaces the alerts of the delta in the entries, keyed by id"""
+    alert_ids, delta_entries = delta
+    for pk in alert_ids:
+        entries.pop(pk, None)
+    entries.update((entry[1], entry) for entry in delta_entries)
+
+
+def rebuild_summary(organization_id):
+    """Loads the summary of the organization from the database into the cache
+    and returns its entries"""
+    timeout = settings.ALERTS_SUMMARY_TIMEOUT
+    generation = uuid4().hex
+    # Set before reading, so that deltas of alerts changed meanwhile go to the
+    # log of this generation
+    cache.set(_summary_key(organization_id), generation, timeout)
+    entries = _sorted(_entries(_window(organization_id)))
+    cache.set(
+        _base_key(organization_id, generation),
+        {"applied": 0, "entries": entries},
+        timeout,
+    )
+    return entries
+
+
+def _load_summary(organization_id):
+    """Entries of the cached summary of the organization with its pending
+    deltas merged, or None if it has to be built again"""
+    generation = cache.get(_summary_key(organization_id))
+    if generation is None:
+        return None
+    base = cache.get(_base_key(organization_id, generation))
+    length = cache.get(_log_key(organization_id, generation)) or 0
+    if base is None or length < base["applied"]:
+        return None  # Evicted
+    if length - base["applied"] > settings.ALERTS_SUMMARY_MAX_PENDING:
+        return None  # Deltas lost or never stored
+    entries = {entry[1]: entry for entry in base["entries"]}
+    if length == base["applied"]:
+        return entries.values()
+
+    positions = range(base["applied"] + 1, length + 1)
+    deltas = cache.get_many(
+        [_log_key(organization_id, generation, position) for position in positions]
+    )
+    compacted = base["applied"]
+    for position in positions:
+        delta = deltas.get(_log_key(organization_id, generation, position))
+        if delta is None:
+            break
+        _apply(entries, delta)
+        compacted = position
+    if compacted - base["applied"] >= settings.ALERTS_SUMMARY_COMPACT_AFTER:
+        cache.set(
+            _base_key(organization_id, generation),
+            {"applied": compacted, "entries": _sorted(entries.values())},
+            settings.ALERTS_SUMMARY_TIMEOUT,
+        )
+    # Deltas after one that isn't stored yet are served, not compacted
+    for position in range(compacted + 1, length + 1):
+        delta = deltas.get(_log_key(organization_id, generation, position))
+        if delta is not None:
+            _apply(entries, delta)
+    return entries.values()
+
+
+def get_summary(organization_id):
+    """Returns the serialized alerts of the last 24h of the organization, newest
+    first, as AlertSerializer renders them"""
+    entries = _load_summary(organization_id)
+    if entries is None:
+        entries = rebuild_summary(organization_id)
+    return [item for timestamp, pk, item in _sorted(entries)]
+
+
+def refresh_summary(organization_id, alert_ids):
+    """Adds the given alerts, as they are once the current transaction commits,
+    to the summary of the organization"""
+    transaction.on_commit(
+        partial(_refresh_summary, organization_id, set(alert_ids)), robust=True
+    )
+
+
+def _refresh_summary(organization_id, alert_ids):
+    generation = cache.get(_summary_key(organization_id))
+    if generation is None:
+        return  # Built from the database on the next read
+    timeout = settings.ALERTS_SUMMARY_TIMEOUT
+    log_key = _log_key(organization_id, generation)
+    cache.add(log_key, 0, timeout)
+    try:
+        position = cache.incr(log_key)
+    except ValueError:
+        # Evicted right after being added
+        cache.delete(_summary_key(organization_id))
+        return
+    entries = _entries(_window(organization_id).filter(pk__in=alert_ids))
+    cache.set(
+        _log_key(organization_id, generation, position),
+        (sorted(alert_ids), entries),
+        timeout,
+    )
+
+
+def invalidate_summary(organization_id):
+    """Drops the summary of the organization once the current transaction
+    commits, so it's rebuilt on the next read"""
+    transaction.on_commit(
+        partial(cache.delete, _summary_key(organization_id)), robust=True
+    )
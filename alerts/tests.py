@@ -1,21 +1,58 @@
+import csv
+import io
 import json
+import math
+import os
 import random
+import shutil
 import string
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 from urllib.parse import urlencode
 
+import msgpack
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.layers import get_channel_layer
 from channels.routing import URLRouter
 from channels.testing import WebsocketCommunicator
-from django.test import Client
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, Client, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
-
-from alerts.models import Alert, Beneficiary
+from rest_framework_simplejwt.tokens import AccessToken
+
+from alerts.cache import (
+    NO_BENEFICIARY,
+    beneficiaries,
+    recent_message_sids,
+    resolve_beneficiary,
+)
+from alerts.checks import check_shared_cache
+from alerts.geo import COLUMNS, EARTH_RADIUS, ROWS, cell_ranges, grid_cell
+from alerts.ingest import AlertBatcher, insert_alerts
+from alerts.location import Location, parse_location
+from alerts.models import Alert, AlertRollup, AlertType, Beneficiary, BeneficiaryType
+from alerts.rollup import rebuild_rollups
+from alerts.serializers import AlertSerializer, alert_values, serialize_alert_values
+from alerts.signals import alerts_created
+from alerts.summary import get_summary, rebuild_summary
+from alerts.utils import normalize_telephone
 from backend import settings
+from backend.parsers import FastJSONParser, MessagePackParser
+from backend.renderers import FastJSONRenderer, MessagePackRenderer
 from backend.routing import websocket_urlpatterns
 from users.managers import UserManager
-from users.models import User
+from users.models import Organization, User
 
 
 class TestBeneficiaryCreation(APITestCase):
@@ -226,6 +263,170 @@ class TestBeneficiaryCreation(APITestCase):
         beneficiary = Beneficiary.objects.get(id=beneficiary["id"])
         self.assertEqual(beneficiary.enabled, False)
 
+    def test_beneficiary_telephone_too_long(self):
+        self.client.post(
+            self.register_root_url, self.register_root_user_data, format="json"
+        )
+        user = User.objects.get(email=self.register_root_user_data["email"])
+        self.client.force_authenticate(user=user)
+
+        response = self.client.post(
+            self.beneficiaries_url,
+            {**self.register_beneficiary_data, "telephone": "1" * 20},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("telephone", response.data)
+        self.assertFalse(Beneficiary.objects.exists())
+
+    def test_beneficiary_search(self):
+        self.client.post(
+            self.register_root_url, self.register_root_user_data, format="json"
+        )
+        user = User.objects.get(email=self.register_root_user_data["email"])
+        self.client.force_authenticate(user=user)
+        for name, surname, telephone in [
+            ("Juan", "Pérez", "1154047987"),
+            ("José", "Peralta", "1154047988"),
+            ("Ana", "Gómez", "2214047989"),
+        ]:
+            Beneficiary.objects.create(
+                name=name,
+                surname=surname,
+                telephone=telephone,
+                organization=user.organization,
+            )
+
+        def search(value):
+            response = self.client.get(
+                self.beneficiaries_url, {"search": value}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [beneficiary["surname"] for beneficiary in response.data]
+
+        self.assertEqual(search("per"), ["Peralta", "Pérez"])
+        self.assertEqual(search("PÉREZ"), ["Pérez"])
+        self.assertEqual(search("juan p"), ["Pérez"])
+        self.assertEqual(search("perez ju"), ["Pérez"])
+        self.assertEqual(search("jose"), ["Peralta"])
+        self.assertEqual(search("115404"), ["Peralta", "Pérez"])
+        self.assertEqual(search("+54 9 221"), ["Gómez"])
+        self.assertEqual(search("gomez x"), [])
+
+        beneficiary = Beneficiary.objects.get(surname="Gómez")
+        beneficiary.surname = "Ñandú"
+        beneficiary.save(update_fields=["surname"])
+        self.assertEqual(search("nan"), ["Ñandú"])
+
+        with self.settings(BENEFICIARY_SEARCH_MAX_RESULTS=1):
+            self.assertEqual(search("p"), ["Peralta"])
+
+    def test_beneficiary_import(self):
+        self.client.post(
+            self.register_root_url, self.register_root_user_data, format="json"
+        )
+        user = User.objects.get(email=self.register_root_user_data["email"])
+        self.client.force_authenticate(user=user)
+        import_url = reverse("alerts:beneficiary-bulk-import")
+        beneficiary_type = BeneficiaryType.objects.create(
+            description="Adulto mayor", organization=user.organization
+        )
+        Beneficiary.objects.create(
+            name="Ana",
+            surname="Gómez",
+            telephone="1154047987",
+            organization=user.organization,
+        )
+        # Cached as unknown, it must be found once imported
+        self.assertEqual(resolve_beneficiary("1154047990"), NO_BENEFICIARY)
+
+        rows = [
+            {"name": "Juan", "surname": "Pérez", "telephone": "1154047988"},
+            {"name": "José", "surname": "Peralta", "telephone": "abc"},
+            {"name": "Luis", "surname": "Díaz", "telephone": "5491154047987"},
+            {
+                "name": "Eva",
+                "surname": "Sosa",
+                "telephone": "1154047989",
+                "type_id": beneficiary_type.id + 1,
+            },
+            {"name": "Juana", "surname": "Pérez", "telephone": "01154047988"},
+            {
+                "name": "Eva",
+                "surname": "Ríos",
+                "telephone": "1154047990",
+                "type_id": beneficiary_type.id,
+            },
+        ] * 2
+        with self.settings(BENEFICIARY_IMPORT_CHUNK_SIZE=6):
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post(import_url, rows, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 2)
+        # One query for the telephones and one for the types of each chunk, and
+        # a single insert
+        statements = [query["sql"].split()[0] for query in queries]
+        self.assertEqual(statements.count("SELECT"), 2 * 2)
+        self.assertEqual(statements.count("INSERT"), 1)
+        self.assertEqual(
+            [
+                (error["row"], list(error["errors"]))
+                for error in response.data["errors"]
+            ],
+            [
+                (2, ["telephone"]),
+                (3, ["telephone"]),
+                (4, ["type_id"]),
+                (5, ["telephone"]),
+                (7, ["telephone"]),
+                (8, ["telephone"]),
+                (9, ["telephone"]),
+                (10, ["type_id"]),
+                (11, ["telephone"]),
+                (12, ["telephone"]),
+            ],
+        )
+        beneficiary = Beneficiary.objects.get(telephone_e164="+5491154047990")
+        self.assertEqual(beneficiary.type_id, beneficiary_type.id)
+        self.assertEqual(beneficiary.search_name, "eva rios")
+        self.assertEqual(
+            resolve_beneficiary("1154047990").beneficiary_id, beneficiary.id
+        )
+
+        upload = io.BytesIO(
+            "name,surname,telephone,company,type_id\n"
+            "María,López,1154047991,CLA,\n"
+            "Raúl,,1154047992,,\n".encode()
+        )
+        upload.name = "beneficiaries.csv"
+        response = self.client.post(import_url, {"file": upload}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["errors"][0]["row"], 2)
+        self.assertEqual(list(response.data["errors"][0]["errors"]), ["surname"])
+        beneficiary = Beneficiary.objects.get(telephone="1154047991")
+        self.assertEqual((beneficiary.company, beneficiary.type_id), ("CLA", None))
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as file:
+            json.dump(
+                [{"name": "Raúl", "surname": "Paz", "telephone": "1154047992"}], file
+            )
+            file.flush()
+            output = io.StringIO()
+            call_command(
+                "import_beneficiaries",
+                file.name,
+                organization=user.organization.id,
+                stdout=output,
+            )
+        self.assertIn("Created 1 beneficiaries", output.getvalue())
+        self.assertTrue(Beneficiary.objects.filter(surname="Paz").exists())
+
+        with self.settings(BENEFICIARY_IMPORT_MAX_ITEMS=1):
+            response = self.client.post(import_url, rows, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class TestTypesCreation(APITestCase):
     @classmethod
@@ -515,6 +716,10 @@ class TestTwilioWebhook(APITestCase):
         cls.user_manager = UserManager()
 
     def setUp(self):
+        cache.clear()
+        beneficiaries.clear()
+        recent_message_sids.clear()
+
         self.twilio_webhook_url = reverse("alerts:twilio-webhook")
         self.register_root_url = reverse("users:register-admin")
         self.beneficiaries_url = reverse("alerts:beneficiary-list")
@@ -579,6 +784,70 @@ class TestTwilioWebhook(APITestCase):
             alerts[0].beneficiary.telephone, self.register_beneficiary_data["telephone"]
         )
 
+    def post_sms(self, data):
+        return self.client.post(
+            self.twilio_webhook_url,
+            urlencode(data),
+            content_type="application/x-www-form-urlencoded",
+        )
+
+    def register_beneficiary(self):
+        response = self.client.post(
+            self.register_root_url, self.register_root_user_data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        user = User.objects.get(email=self.register_root_user_data["email"])
+        self.client.force_authenticate(user=user)
+        response = self.client.post(
+            self.beneficiaries_url, self.register_beneficiary_data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_twilio_sms_webhook_retry(self):
+        self.register_beneficiary()
+
+        response = self.post_sms(self.twilio_sms_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as context:
+            retry = self.post_sms(self.twilio_sms_data)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.content, response.content)
+        for query in context.captured_queries:
+            self.assertNotIn("alerts_", query["sql"])
+
+        # Si el cache fue vaciado, la restricción única de las posiciones evita
+        # que el reintento se sume a la alerta
+        cache.clear()
+        recent_message_sids.clear()
+        retry = self.post_sms(self.twilio_sms_data)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+
+        alert = Alert.objects.get()
+        self.assertEqual(alert.message_sid, self.twilio_sms_data["MessageSid"])
+        self.assertEqual(alert.hits, 1)
+        self.assertEqual(alert.positions.count(), 1)
+
+        # Lo mismo para un mensaje sumado a la alerta
+        self.post_sms({**self.twilio_sms_data, "MessageSid": "SM2"})
+        cache.clear()
+        recent_message_sids.clear()
+        self.post_sms({**self.twilio_sms_data, "MessageSid": "SM2"})
+        alert.refresh_from_db()
+        self.assertEqual(alert.hits, 2)
+        self.assertEqual(alert.positions.count(), 2)
+
+    def test_twilio_sms_webhook_retry_after_error(self):
+        self.register_beneficiary()
+
+        response = self.post_sms({**self.twilio_sms_data, "Body": "Ayuda"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.post_sms(self.twilio_sms_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Alert.objects.count(), 1)
+
 
 class TestAlertChannels(APITestCase):
     @classmethod
@@ -637,9 +906,34 @@ class TestAlertChannels(APITestCase):
 
         response = await communicator.receive_from()
         assert json.loads(response) == self.register_alert_data
+
+        changes = {"event": "alerts_changed", "alerts": [self.register_alert_data]}
+        await channel_layer.group_send(
+            "1", {"type": "alerts_changed", "message": changes}
+        )
+        assert json.loads(await communicator.receive_from()) == changes
         # Close
         await communicator.disconnect()
 
+        for url, subprotocols in [
+            (f"/ws/alerts/organization-{self.organization_id}/", ["msgpack"]),
+            (f"/ws/alerts/organization-{self.organization_id}/?format=msgpack", None),
+        ]:
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), url, subprotocols=subprotocols
+            )
+            communicator.scope["user"] = self.user
+            connected, subprotocol = await communicator.connect()
+            assert connected
+            assert subprotocol == (subprotocols and "msgpack")
+            await channel_layer.group_send(
+                str(self.organization_id),
+                {"type": "alert_message", "message": self.register_alert_data},
+            )
+            response = await communicator.receive_from()
+            assert msgpack.unpackb(response) == self.register_alert_data
+            await communicator.disconnect()
+
         communicator = WebsocketCommunicator(
             URLRouter(websocket_urlpatterns),
             f"/ws/alerts/organization-{self.organization_id + 1}/",
@@ -649,3 +943,1944 @@ class TestAlertChannels(APITestCase):
         assert not connected
         # Close
         await communicator.disconnect()
+
+
+class AlertsTestCase(APITestCase):
+    """Registers the admin of a new organization, starting with empty caches"""
+
+    def setUp(self):
+        cache.clear()
+        beneficiaries.clear()
+        recent_message_sids.clear()
+
+        self.register_root_url = reverse("users:register-admin")
+        random_password = "".join(
+            random.choice(string.ascii_letters) for i in range(10)
+        )
+        self.register_root_user_data = {
+            "name": "John",
+            "surname": "Smith",
+            "email": "test_user@email.com",
+            "organization_name": "CEIoT",
+            "password": random_password,
+            "password2": random_password,
+        }
+        response = self.client.post(
+            self.register_root_url, self.register_root_user_data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.user = User.objects.get(email=self.register_root_user_data["email"])
+        self.organization = self.user.organization
+
+
+class TestAlertQueries(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alerts_url = reverse("alerts:alert-list")
+        self.alerts_summary_url = reverse("alerts:alerts-summary")
+
+        self.client.force_authenticate(user=self.user)
+
+        organization = self.organization
+        self.beneficiary_type = BeneficiaryType.objects.create(
+            code="SER", description="Sereno", organization=organization
+        )
+        self.alert_type = AlertType.objects.create(
+            code="TEST", description="Prueba de alerta", organization=organization
+        )
+
+    def create_alerts(self, count, datetime=None):
+        organization = self.user.organization
+        for i in range(count):
+            beneficiary = Beneficiary.objects.create(
+                name="John",
+                surname="Smith",
+                telephone=f"11540479{i:02d}",
+                organization=organization,
+                type=self.beneficiary_type,
+            )
+            Alert.objects.create(
+                datetime=datetime or timezone.now(),
+                beneficiary=beneficiary,
+                latitude="-34.757884",
+                longitude="-58.2927029",
+                type=self.alert_type,
+                organization=organization,
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_alert_list_queries_do_not_grow_with_rows(self):
+        self.create_alerts(1)
+        queries = self.count_queries(self.alerts_url)
+
+        self.create_alerts(5)
+        self.assertEqual(self.count_queries(self.alerts_url), queries)
+
+    def test_alerts_summary_queries_do_not_grow_with_rows(self):
+        # Cold summary, built from the database
+        cache.clear()
+        self.create_alerts(1)
+        queries = self.count_queries(self.alerts_summary_url)
+
+        cache.clear()
+        self.create_alerts(5)
+        self.assertEqual(self.count_queries(self.alerts_summary_url), queries)
+
+    def test_values_serialization_matches_alert_serializer(self):
+        self.create_alerts(2)
+        untyped = Beneficiary.objects.create(
+            name="Jane",
+            surname="Smith",
+            telephone="1154047999",
+            description="Sin tipo",
+            organization=self.user.organization,
+        )
+        Alert.objects.create(
+            datetime=timezone.now(),
+            datetime_attended=timezone.now(),
+            beneficiary=untyped,
+            latitude="-34.7",
+            longitude="-58.29",
+            state="A",
+            operator=self.user,
+            observations="En camino",
+            organization=self.user.organization,
+            message_sid="SM1",
+        )
+        Alert.objects.filter(type__isnull=False).update(
+            state="C", datetime_closed=timezone.now()
+        )
+
+        queryset = Alert.objects.order_by("-datetime", "-id")
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(serialize_alert_values(alert_values(queryset))),
+            renderer.render(AlertSerializer(queryset, many=True).data),
+        )
+
+        response = self.client.get(self.alerts_url, format="json")
+        self.assertEqual(
+            renderer.render(response.data["results"]),
+            renderer.render(AlertSerializer(queryset, many=True).data),
+        )
+
+    def test_alert_list_cursor_pagination(self):
+        self.create_alerts(3)
+        self.create_alerts(4, datetime=timezone.now() - timedelta(hours=1))
+
+        ids = []
+        url = f"{self.alerts_url}?page_size=2"
+        with CaptureQueriesContext(connection) as context:
+            while url:
+                response = self.client.get(url, format="json")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                page = json.loads(response.content)
+                self.assertLessEqual(len(page["results"]), 2)
+                ids += [alert["id"] for alert in page["results"]]
+                url = page["next"]
+
+        expected = Alert.objects.order_by("-datetime", "-id").values_list(
+            "id", flat=True
+        )
+        self.assertEqual(ids, list(expected))
+        for query in context.captured_queries:
+            self.assertNotIn("COUNT(", query["sql"].upper())
+
+    @override_settings(ALERTS_EXPORT_CHUNK_SIZE=2)
+    def test_alert_export(self):
+        self.create_alerts(5)
+        Alert.objects.filter(id=Alert.objects.first().id).update(
+            state="A", observations="=HYPERLINK(1)"
+        )
+        queryset = Alert.objects.order_by("-datetime", "-id")
+        expected = json.loads(
+            JSONRenderer().render(AlertSerializer(queryset, many=True).data)
+        )
+
+        response = self.client.get(f"{self.alerts_url}export/ndjson/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        content = b"".join(response.streaming_content)
+        self.assertEqual([json.loads(line) for line in content.splitlines()], expected)
+
+        response = self.client.get(f"{self.alerts_url}export/csv/?state=N")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("alertas.csv", response["Content-Disposition"])
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(
+            [int(row["id"]) for row in rows],
+            [alert["id"] for alert in expected if alert["state"] == "N"],
+        )
+        self.assertEqual(rows[0]["beneficiary_type_description"], "Sereno")
+        self.assertEqual(rows[0]["datetime_attended"], "")
+
+        response = self.client.get(f"{self.alerts_url}export/csv/?state=A")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response).decode())))
+        self.assertEqual(rows[0]["observations"], "'=HYPERLINK(1)")
+
+        response = self.client.get(f"{self.alerts_url}export/xml/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_alert_export_asgi(self):
+        await sync_to_async(self.create_alerts)(5)
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+
+        # Served by ASGI, the rows are pulled in chunks by an async iterator
+        # instead of being read into a list
+        with self.settings(ALERTS_EXPORT_CHUNK_SIZE=2):
+            response = await AsyncClient().get(
+                f"{self.alerts_url}export/ndjson/",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.is_async)
+            lines = [line async for line in response.streaming_content]
+        ids = [json.loads(line)["id"] for line in lines]
+        expected = await sync_to_async(list)(
+            Alert.objects.order_by("-datetime", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_sparse_fieldsets(self):
+        self.create_alerts(3)
+        alert = Alert.objects.first()
+        fields = ["id", "latitude", "longitude", "state"]
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                f"{self.alerts_url}?fields={','.join(fields)}", format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([list(result) for result in results], [fields] * 3)
+        self.assertEqual(results[-1]["latitude"], "-34.75788400")
+        sql = context.captured_queries[-1]["sql"]
+        self.assertNotIn("JOIN", sql)
+        self.assertNotIn('"observations"', sql)
+
+        response = self.client.get(
+            f"{self.alerts_url}?fields=id&page_size=2", format="json"
+        )
+        page = json.loads(response.content)
+        response = self.client.get(page["next"], format="json")
+        self.assertEqual(json.loads(response.content)["results"], [{"id": alert.id}])
+
+        response = self.client.get(
+            f"{self.alerts_url}{alert.id}/?omit=beneficiary_name,type_description",
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("beneficiary_name", response.data)
+        self.assertNotIn("type_description", response.data)
+        self.assertEqual(response.data["beneficiary_type_description"], "Sereno")
+
+        response = self.client.get(f"{self.alerts_url}export/csv/?fields=id,state")
+        content = b"".join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines()[0], "id,state")
+
+        beneficiaries_url = reverse("alerts:beneficiary-list")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                f"{beneficiaries_url}?fields=id,name", format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data[0]), ["id", "name"])
+        self.assertNotIn('"description"', context.captured_queries[-1]["sql"])
+
+        # Writes validate and return every field
+        response = self.client.patch(
+            f"{beneficiaries_url}{alert.beneficiary_id}/?fields=id",
+            {"surname": "Doe"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["surname"], "Doe")
+
+        response = self.client.get(f"{self.alerts_url}?fields=id,secret", format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("secret", str(response.data["fields"][0]))
+
+    def test_message_pack_content_negotiation(self):
+        self.create_alerts(2)
+        response = self.client.get(self.alerts_url, format="json")
+        expected = json.loads(response.content)
+
+        response = self.client.get(self.alerts_url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+        self.assertLess(len(response.content), len(json.dumps(expected)))
+
+        response = self.client.post(
+            reverse("alerts:beneficiary-type-list"),
+            msgpack.packb({"code": "MED", "description": "Médico"}),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(msgpack.unpackb(response.content)["description"], "Médico")
+
+    def test_alert_list_pagination_keeps_filters(self):
+        self.create_alerts(3)
+        Alert.objects.filter(id=Alert.objects.first().id).update(state="A")
+
+        response = self.client.get(
+            f"{self.alerts_url}?page_size=1&state=N", format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page = json.loads(response.content)
+        self.assertEqual(len(page["results"]), 1)
+        self.assertIn("state=N", page["next"])
+
+        response = self.client.get(page["next"], format="json")
+        page = json.loads(response.content)
+        self.assertEqual(len(page["results"]), 1)
+        self.assertEqual(page["results"][0]["state"], "N")
+        self.assertIsNone(page["next"])
+
+
+class TestBeneficiaryCache(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.beneficiaries_url = reverse("alerts:beneficiary-list")
+        self.twilio_webhook_url = reverse("alerts:twilio-webhook")
+
+        self.register_beneficiary_data = {
+            "name": "John",
+            "surname": "Smith",
+            "telephone": "1154047987",
+            "company": "CLA",
+            "description": "Prueba de beneficiario",
+            "enabled": True,
+        }
+        self.twilio_sms_data = {
+            "From": 1154047987,
+            "MessageSid": "SMXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX",
+            "Body": "https://maps.google.com/?q=-34.75755778740859,-58.28999854451876",
+            "NumMedia": 0,
+        }
+
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            self.beneficiaries_url, self.register_beneficiary_data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.beneficiary = json.loads(response.content)
+        self.beneficiary_url = reverse(
+            "alerts:beneficiary-detail", kwargs={"pk": self.beneficiary["id"]}
+        )
+
+    def test_resolve_beneficiary_is_cached(self):
+        ref = resolve_beneficiary("1154047987")
+        self.assertEqual(ref.beneficiary_id, self.beneficiary["id"])
+        self.assertEqual(ref.organization_id, self.user.organization.id)
+        self.assertTrue(ref.enabled)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_beneficiary("1154047987"), ref)
+
+        beneficiaries.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_beneficiary("1154047987"), ref)
+
+        self.assertEqual(resolve_beneficiary("1100000000"), NO_BENEFICIARY)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_beneficiary("1100000000"), NO_BENEFICIARY)
+
+    def test_disabled_beneficiary_stops_matching(self):
+        self.assertTrue(resolve_beneficiary("1154047987").enabled)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(self.beneficiary_url, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(resolve_beneficiary("1154047987"), NO_BENEFICIARY)
+
+        response = self.client.post(
+            self.twilio_webhook_url,
+            urlencode(self.twilio_sms_data),
+            content_type="application/x-www-form-urlencoded",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Alert.objects.count(), 0)
+
+    def test_beneficiary_telephone_filter(self):
+        for telephone in ["1154047987", "+5491154047987", "01154047987"]:
+            response = self.client.get(
+                self.beneficiaries_url, {"telephone": telephone}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                [beneficiary["id"] for beneficiary in json.loads(response.content)],
+                [self.beneficiary["id"]],
+            )
+
+        response = self.client.get(
+            self.beneficiaries_url, {"telephone": "1154047988"}, format="json"
+        )
+        self.assertEqual(json.loads(response.content), [])
+
+    def test_twilio_sms_webhook_e164_sender(self):
+        response = self.client.post(
+            self.twilio_webhook_url,
+            urlencode({**self.twilio_sms_data, "From": "+5491154047987"}),
+            content_type="application/x-www-form-urlencoded",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Alert.objects.get().beneficiary_id, self.beneficiary["id"])
+
+    def test_telephone_change_invalidates_previous_telephone(self):
+        self.assertTrue(resolve_beneficiary("1154047987").enabled)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(
+                self.beneficiary_url, {"telephone": "1154047988"}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Dropped once committed, lookups until then still see the old row
+        self.assertTrue(resolve_beneficiary("1154047987").enabled)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(resolve_beneficiary("1154047987"), NO_BENEFICIARY)
+        self.assertEqual(
+            resolve_beneficiary("1154047988").beneficiary_id, self.beneficiary["id"]
+        )
+
+
+@override_settings(ALERTS_COALESCE_WINDOW=0)
+class TestAlertBatcher(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.twilio_webhook_url = reverse("alerts:twilio-webhook")
+
+        self.beneficiary = Beneficiary.objects.create(
+            name="John",
+            surname="Smith",
+            telephone="1154047987",
+            organization=self.organization,
+        )
+
+        self.journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.journal_dir)
+
+        self.created = []
+        alerts_created.connect(self.on_alerts_created, sender=Alert)
+        self.addCleanup(alerts_created.disconnect, self.on_alerts_created, Alert)
+
+    def on_alerts_created(self, sender, alerts, **kwargs):
+        self.created += alerts
+
+    def build_alert(self, message_sid):
+        return Alert(
+            datetime=timezone.now(),
+            beneficiary=self.beneficiary,
+            latitude="-34.757884",
+            longitude="-58.2927029",
+            organization=self.user.organization,
+            message_sid=message_sid,
+        )
+
+    def journal_lines(self, batcher):
+        with open(batcher._journal.name) as journal:
+            return journal.readlines()
+
+    def test_flush_inserts_queued_alerts_in_bulk(self):
+        batcher = AlertBatcher(10, 10, 0.1, self.journal_dir)
+        batcher._journal = open(f"{self.journal_dir}/alerts-test.journal", "a+")
+        self.addCleanup(batcher.close)
+
+        for message_sid in ["SM1", "SM2", "SM1"]:
+            self.assertTrue(batcher.submit(self.build_alert(message_sid)))
+        self.assertEqual(len(self.journal_lines(batcher)), 3)
+        self.assertEqual(Alert.objects.count(), 0)
+
+        with CaptureQueriesContext(connection) as context:
+            created = batcher.flush()
+        inserts = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith('INSERT INTO "alerts_alert"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(created), 2)
+        self.assertEqual([alert.pk for alert in self.created], [a.pk for a in created])
+        self.assertEqual(Alert.objects.count(), 2)
+        self.assertEqual(self.journal_lines(batcher), [])
+
+    def test_full_queue_is_rejected(self):
+        batcher = AlertBatcher(1, 10, 0.1)
+        self.assertTrue(batcher.submit(self.build_alert("SM1")))
+        self.assertFalse(batcher.submit(self.build_alert("SM2")))
+
+    def test_orphaned_journal_is_replayed(self):
+        crashed = AlertBatcher(10, 10, 0.1, self.journal_dir)
+        crashed._journal = open(f"{self.journal_dir}/alerts-1.journal", "a+")
+        crashed.submit(self.build_alert("SM1"))
+        crashed.submit(self.build_alert("SM2"))
+        crashed.close()
+
+        batcher = AlertBatcher(10, 10, 0.1, self.journal_dir)
+        batcher._journal = open(f"{self.journal_dir}/alerts-2.journal", "a+")
+        self.addCleanup(batcher.close)
+        batcher.replay()
+        batcher.replay()
+
+        self.assertEqual(Alert.objects.count(), 2)
+        self.assertEqual(len(self.created), 2)
+        self.assertFalse(os.path.exists(f"{self.journal_dir}/alerts-1.journal"))
+
+    def test_failing_alert_is_rejected(self):
+        def persist(alerts):
+            if any(alert.message_sid == "SM2" for alert in alerts):
+                raise ValueError("Poisoned alert")
+            return insert_alerts(alerts)
+
+        batcher = AlertBatcher(10, 10, 0.1, self.journal_dir, retries=2)
+        batch = [self.build_alert(sid) for sid in ["SM1", "SM2", "SM3"]]
+        with mock.patch("alerts.ingest.insert_alerts", side_effect=persist) as m:
+            with mock.patch("alerts.ingest.time.sleep") as sleep:
+                with self.assertLogs("alerts.ingest", level="ERROR"):
+                    batcher.persist(batch)
+        # The batch three times, then each alert
+        self.assertEqual(m.call_count, 6)
+        self.assertEqual(sleep.call_count, 2)
+
+        self.assertEqual(
+            set(Alert.objects.values_list("message_sid", flat=True)), {"SM1", "SM3"}
+        )
+        with open(f"{self.journal_dir}/alerts-{os.getpid()}.rejected") as rejected:
+            records = [json.loads(line) for line in rejected]
+        self.assertEqual([record["message_sid"] for record in records], ["SM2"])
+
+    def test_failing_receiver_does_not_retry_the_batch(self):
+        def fail(sender, alerts, **kwargs):
+            raise ConnectionError("Channel layer down")
+
+        alerts_created.connect(fail, sender=Alert)
+        self.addCleanup(alerts_created.disconnect, fail, Alert)
+
+        batcher = AlertBatcher(10, 10, 0.1, self.journal_dir)
+        batch = [self.build_alert(sid) for sid in ["SM1", "SM2"]]
+        with mock.patch("alerts.ingest.insert_alerts", wraps=insert_alerts) as m:
+            with self.assertLogs("alerts.ingest", level="ERROR"):
+                batcher.persist(batch)
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(Alert.objects.count(), 2)
+        # Sent once, and the alerts aren't set aside as rejected
+        self.assertEqual(len(self.created), 2)
+        self.assertFalse(
+            os.path.exists(f"{self.journal_dir}/alerts-{os.getpid()}.rejected")
+        )
+
+    @override_settings(ALERTS_INGEST_MODE="batched")
+    def test_twilio_sms_webhook_batched(self):
+        batcher = AlertBatcher(10, 10, 0.1)
+        twilio_sms_data = {
+            "From": 1154047987,
+            "MessageSid": "SMXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX",
+            "Body": "https://maps.google.com/?q=-34.75755778740859,-58.28999854451876",
+            "NumMedia": 0,
+        }
+        with mock.patch("alerts.views.get_batcher", return_value=batcher):
+            response = self.client.post(
+                self.twilio_webhook_url,
+                urlencode(twilio_sms_data),
+                content_type="application/x-www-form-urlencoded",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Alert.objects.count(), 0)
+
+        batcher.flush()
+        alert = Alert.objects.get()
+        self.assertEqual(alert.beneficiary, self.beneficiary)
+        self.assertEqual(alert.message_sid, twilio_sms_data["MessageSid"])
+        self.assertEqual(self.created, [alert])
+
+
+class TestLocationParser(SimpleTestCase):
+    def test_parse_location_formats(self):
+        bodies = [
+            "https://maps.google.com/?q=-34.6037,-58.3816",
+            "Ayuda! https://maps.google.com/maps?q=-34.6037,+-58.3816&z=17",
+            "https://www.google.com/maps/search/?api=1&query=-34.6037%2C-58.3816",
+            "https://www.google.com/maps/@-34.6037,-58.3816,15z",
+            "https://www.google.com/maps/place/Obelisco/@-34.6037,-58.3816,17z/data=!3m1",
+            "geo:-34.6037,-58.3816?z=17",
+            "SOS lat:-34.6037 lon:-58.3816 bat:85%",
+            "-34.6037, -58.3816",
+        ]
+        for body in bodies:
+            self.assertEqual(
+                parse_location(body),
+                Location(Decimal("-34.6037"), Decimal("-58.3816")),
+                body,
+            )
+
+    def test_parse_location_invalid(self):
+        bodies = [
+            None,
+            "",
+            "Ayuda",
+            "Llamar al 1154047987 a las 12.30",
+            "https://maps.google.com/?q=-134.6037,-58.3816",
+            "geo:-34.6037,-258.3816",
+        ]
+        for body in bodies:
+            self.assertIsNone(parse_location(body), body)
+
+
+class TestTelephoneNormalization(SimpleTestCase):
+    def test_normalize_telephone(self):
+        for telephone in [
+            "1154047987",
+            "01154047987",
+            "+5491154047987",
+            "5491154047987",
+            "541154047987",
+            "+54 9 11 5404-7987",
+            1154047987,
+        ]:
+            self.assertEqual(normalize_telephone(telephone), "+5491154047987")
+
+        # "549" inside the number is kept
+        self.assertEqual(normalize_telephone("2235491234"), "+5492235491234")
+        self.assertEqual(normalize_telephone("+14155552671"), "+14155552671")
+        self.assertEqual(normalize_telephone(""), "")
+        # Longer than E.164 allows, it doesn't fit telephone_e164
+        self.assertEqual(normalize_telephone("1" * 16), "")
+        self.assertEqual(normalize_telephone("1" * 15), "+" + "1" * 15)
+
+
+class TestAlertCoalescing(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.twilio_webhook_url = reverse("alerts:twilio-webhook")
+
+        self.beneficiary = Beneficiary.objects.create(
+            name="John",
+            surname="Smith",
+            telephone="1154047987",
+            organization=self.organization,
+        )
+
+    def post_sms(self, message_sid, latitude, longitude):
+        response = self.client.post(
+            self.twilio_webhook_url,
+            urlencode(
+                {
+                    "From": "+5491154047987",
+                    "MessageSid": message_sid,
+                    "Body": f"https://maps.google.com/?q={latitude},{longitude}",
+                    "NumMedia": 0,
+                }
+            ),
+            content_type="application/x-www-form-urlencoded",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_repeated_sms_update_open_alert(self):
+        self.post_sms("SM1", "-34.757884", "-58.2927029")
+        self.post_sms("SM2", "-34.757999", "-58.2927999")
+
+        alert = Alert.objects.get()
+        self.assertEqual(alert.hits, 2)
+        self.assertEqual(alert.latitude, Decimal("-34.757999"))
+        self.assertEqual(alert.longitude, Decimal("-58.2927999"))
+
+        Alert.objects.update(state="A")
+        self.post_sms("SM3", "-34.757884", "-58.2927029")
+        self.assertEqual(Alert.objects.count(), 2)
+        self.assertEqual(Alert.objects.get(state="N").hits, 1)
+
+    def test_rolled_back_alert_is_not_broadcast(self):
+        self.post_sms("SM1", "-34.757884", "-58.2927029")
+        self.post_sms("SM2", "-34.757999", "-58.2927999")
+        Alert.objects.update(state="C")
+        cache.clear()
+        recent_message_sids.clear()
+
+        # The retry creates an alert, rolled back by the position of SM2
+        with mock.patch("alerts.signals.broadcast_alerts") as broadcast_alerts:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post_sms("SM2", "-34.757999", "-58.2927999")
+        self.assertEqual(Alert.objects.count(), 1)
+        broadcast_alerts.assert_not_called()
+
+    def test_new_emergencies_create_alerts(self):
+        attended = Alert.objects.create(
+            datetime=timezone.now() - timedelta(days=3),
+            beneficiary=self.beneficiary,
+            latitude="-34.757884",
+            longitude="-58.2927029",
+            state="A",
+            organization=self.user.organization,
+        )
+        expired = Alert.objects.create(
+            datetime=timezone.now() - timedelta(minutes=5),
+            beneficiary=self.beneficiary,
+            latitude="-34.757884",
+            longitude="-58.2927029",
+            organization=self.user.organization,
+        )
+
+        # After the window of the new alert, or while only attended ones are
+        # open, messages create and broadcast a new alert
+        with mock.patch("alerts.signals.broadcast_alerts") as broadcast_alerts:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post_sms("SM1", "-34.757999", "-58.2927999")
+        alert = Alert.objects.get(message_sid="SM1")
+        self.assertEqual(broadcast_alerts.call_args.args, ([alert],))
+        self.assertEqual(alert.hits, 1)
+        for old in [attended, expired]:
+            old.refresh_from_db()
+            self.assertEqual(old.hits, 1)
+            self.assertEqual(old.latitude, Decimal("-34.757884"))
+            self.assertEqual(old.positions.count(), 0)
+
+    @override_settings(ALERTS_COALESCE_WINDOW=0)
+    def test_coalescing_disabled(self):
+        self.post_sms("SM1", "-34.757884", "-58.2927029")
+        self.post_sms("SM2", "-34.757999", "-58.2927999")
+        self.assertEqual(Alert.objects.count(), 2)
+
+    def test_batched_alerts_are_coalesced(self):
+        batcher = AlertBatcher(10, 10, 0.1)
+        for message_sid in ["SM1", "SM2", "SM3"]:
+            batcher.submit(
+                Alert(
+                    datetime=timezone.now(),
+                    beneficiary=self.beneficiary,
+                    latitude="-34.757884",
+                    longitude=f"-58.29{message_sid[-1]}",
+                    organization=self.user.organization,
+                    message_sid=message_sid,
+                )
+            )
+        self.assertEqual(len(batcher.flush()), 1)
+        alert = Alert.objects.get()
+        self.assertEqual(alert.hits, 3)
+        self.assertEqual(alert.longitude, Decimal("-58.293"))
+
+        batcher.submit(
+            Alert(
+                datetime=timezone.now(),
+                beneficiary=self.beneficiary,
+                latitude="-34.757884",
+                longitude="-58.294",
+                organization=self.user.organization,
+                message_sid="SM4",
+            )
+        )
+        self.assertEqual(batcher.flush(), [])
+        alert.refresh_from_db()
+        self.assertEqual(alert.hits, 4)
+        self.assertEqual(alert.longitude, Decimal("-58.294"))
+
+        # Replaying messages already folded into the alert changes nothing
+        for message_sid in ["SM2", "SM4"]:
+            batcher.submit(
+                Alert(
+                    datetime=timezone.now(),
+                    beneficiary=self.beneficiary,
+                    latitude="-34.757884",
+                    longitude="-58.299",
+                    organization=self.user.organization,
+                    message_sid=message_sid,
+                )
+            )
+        self.assertEqual(batcher.flush(), [])
+        alert.refresh_from_db()
+        self.assertEqual(alert.hits, 4)
+        self.assertEqual(alert.positions.count(), 4)
+
+
+class TestAlertBulkIngestion(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alerts_bulk_url = reverse("alerts:alerts-bulk")
+
+        self.client.force_authenticate(user=self.user)
+
+        self.beneficiary = Beneficiary.objects.create(
+            name="John",
+            surname="Smith",
+            telephone="1154047987",
+            organization=self.organization,
+        )
+        self.other_beneficiary = Beneficiary.objects.create(
+            name="Jane",
+            surname="Smith",
+            telephone="1154047988",
+            organization=self.organization,
+        )
+
+        self.created = []
+        alerts_created.connect(self.on_alerts_created, sender=Alert)
+        self.addCleanup(alerts_created.disconnect, self.on_alerts_created, Alert)
+
+    def on_alerts_created(self, sender, alerts, **kwargs):
+        self.created += alerts
+
+    def reading(self, telephone, message_sid, **kwargs):
+        return {
+            "telephone": telephone,
+            "latitude": "-34.757884",
+            "longitude": "-58.2927029",
+            "message_sid": message_sid,
+            **kwargs,
+        }
+
+    def post_readings(self, readings):
+        return self.client.post(self.alerts_bulk_url, readings, format="json")
+
+    @override_settings(ALERTS_COALESCE_WINDOW=0)
+    def test_bulk_ingestion_reports_per_item_results(self):
+        timestamp = timezone.now() - timedelta(minutes=5)
+        readings = [
+            self.reading("5491154047987", "SM1", timestamp=timestamp.isoformat()),
+            self.reading("1154047988", "SM2"),
+            self.reading("1154047987", "SM1"),
+            self.reading("1199999999", "SM3"),
+            self.reading("1154047987", "SM4", latitude="-91"),
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = self.post_readings(readings)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        inserts = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith('INSERT INTO "alerts_alert"')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+        results = response.data
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["created", "created", "duplicate", "error", "error"],
+        )
+        self.assertIn("telephone", results[3]["errors"])
+        self.assertIn("latitude", results[4]["errors"])
+
+        first = Alert.objects.get(pk=results[0]["id"])
+        self.assertEqual(first.beneficiary, self.beneficiary)
+        self.assertEqual(first.datetime, timestamp)
+        self.assertEqual(results[2]["id"], first.pk)
+        self.assertEqual(
+            Alert.objects.get(pk=results[1]["id"]).beneficiary,
+            self.other_beneficiary,
+        )
+        self.assertEqual(len(self.created), 2)
+
+    def test_bulk_ingestion_is_idempotent_on_message_sid(self):
+        readings = [
+            self.reading("1154047987", "SM1"),
+            self.reading("1154047988", "SM2"),
+        ]
+        first = self.post_readings(readings).data
+        second = self.post_readings(readings).data
+
+        self.assertEqual(Alert.objects.count(), 2)
+        self.assertEqual([result["status"] for result in second], ["duplicate"] * 2)
+        self.assertEqual(
+            [result["id"] for result in second], [result["id"] for result in first]
+        )
+
+    def test_bulk_ingestion_retry_of_coalesced_readings(self):
+        readings = [
+            self.reading("1154047987", "SM1"),
+            self.reading("1154047987", "SM2", longitude="-58.294"),
+        ]
+        first = self.post_readings(readings).data
+        second = self.post_readings(readings).data
+
+        alert = Alert.objects.get()
+        self.assertEqual([result["status"] for result in second], ["duplicate"] * 2)
+        self.assertEqual(
+            [result["id"] for result in second], [result["id"] for result in first]
+        )
+        self.assertEqual(alert.hits, 2)
+        self.assertEqual(alert.positions.count(), 2)
+
+    def test_bulk_coordinates_are_rounded(self):
+        results = self.post_readings(
+            [
+                self.reading(
+                    "1154047987",
+                    "SM1",
+                    latitude="-34.75755778740859",
+                    longitude="-58.28999854451876",
+                ),
+                self.reading("1154047988", "SM2", longitude="-120.5"),
+            ]
+        ).data
+        self.assertEqual(results[0]["status"], "created")
+        self.assertEqual(results[1]["status"], "error")
+        self.assertIn("longitude", results[1]["errors"])
+
+        alert = Alert.objects.get()
+        self.assertEqual(alert.latitude, Decimal("-34.75755779"))
+        self.assertEqual(alert.longitude, Decimal("-58.28999854"))
+
+    def test_bulk_readings_are_coalesced(self):
+        readings = [
+            self.reading("1154047987", "SM1"),
+            self.reading("1154047987", "SM2", longitude="-58.294"),
+        ]
+        results = self.post_readings(readings).data
+
+        alert = Alert.objects.get()
+        self.assertEqual(
+            results,
+            [
+                {"status": "created", "id": alert.pk},
+                {"status": "coalesced", "id": alert.pk},
+            ],
+        )
+        self.assertEqual(alert.hits, 2)
+        self.assertEqual(alert.longitude, Decimal("-58.294"))
+
+    def test_bulk_readings_after_the_window_create_alerts(self):
+        start = timezone.now() - timedelta(minutes=10)
+        readings = [
+            self.reading("1154047987", f"SM{minutes}", timestamp=timestamp)
+            for minutes, timestamp in [
+                (0, start),
+                (1, start + timedelta(seconds=30)),
+                (5, start + timedelta(minutes=5)),
+            ]
+        ]
+        results = self.post_readings(readings).data
+
+        first, second = Alert.objects.order_by("datetime")
+        self.assertEqual(
+            results,
+            [
+                {"status": "created", "id": first.pk},
+                {"status": "coalesced", "id": first.pk},
+                {"status": "created", "id": second.pk},
+            ],
+        )
+        self.assertEqual((first.hits, second.hits), (2, 1))
+
+    def test_bulk_ingestion_is_scoped_to_organization(self):
+        other_user_data = {
+            **self.register_root_user_data,
+            "email": "other_user@email.com",
+            "organization_name": "Otra",
+        }
+        response = self.client.post(
+            self.register_root_url, other_user_data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.force_authenticate(
+            user=User.objects.get(email=other_user_data["email"])
+        )
+        results = self.post_readings([self.reading("1154047987", "SM1")]).data
+        self.assertEqual(results[0]["status"], "error")
+        self.assertFalse(Alert.objects.exists())
+
+    @override_settings(ALERTS_BULK_MAX_ITEMS=1)
+    def test_bulk_ingestion_validates_payload(self):
+        response = self.post_readings(self.reading("1154047987", "SM1"))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.post_readings(
+            [self.reading("1154047987", "SM1"), self.reading("1154047987", "SM2")]
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(self.alerts_bulk_url, [], format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+
+class TestAlertTrack(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.twilio_webhook_url = reverse("alerts:twilio-webhook")
+        self.alerts_bulk_url = reverse("alerts:alerts-bulk")
+
+        self.beneficiary = Beneficiary.objects.create(
+            name="John",
+            surname="Smith",
+            telephone="1154047987",
+            organization=self.organization,
+        )
+
+    def post_sms(self, message_sid, latitude, longitude):
+        response = self.client.post(
+            self.twilio_webhook_url,
+            urlencode(
+                {
+                    "From": "+5491154047987",
+                    "MessageSid": message_sid,
+                    "Body": f"https://maps.google.com/?q={latitude},{longitude}",
+                    "NumMedia": 0,
+                }
+            ),
+            content_type="application/x-www-form-urlencoded",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def get_track(self, alert, **params):
+        self.client.force_authenticate(user=self.user)
+        url = reverse("alerts:alert-track", args=[alert.pk])
+        return self.client.get(url, params)
+
+    def test_coalesced_messages_are_appended_to_track(self):
+        self.post_sms("SM1", "-34.757884", "-58.2927029")
+        self.post_sms("SM2", "-34.757999", "-58.2927999")
+
+        alert = Alert.objects.get()
+        response = self.get_track(alert)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row["latitude"], row["longitude"]) for row in response.data],
+            [(-34.757884, -58.2927029), (-34.757999, -58.2927999)],
+        )
+
+        response = self.get_track(alert, after=response.data[0]["id"])
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["latitude"], -34.757999)
+
+        # A reading uploaded late, with an older timestamp, is still polled
+        last = response.data[-1]["id"]
+        self.client.post(
+            self.alerts_bulk_url,
+            [
+                {
+                    "telephone": "1154047987",
+                    "latitude": "-34.75",
+                    "longitude": "-58.29",
+                    "timestamp": (timezone.now() - timedelta(hours=1)).isoformat(),
+                    "message_sid": "SM3",
+                }
+            ],
+            format="json",
+        )
+        response = self.get_track(alert, after=last)
+        self.assertEqual([row["latitude"] for row in response.data], [-34.75])
+
+    def test_bulk_readings_are_appended_to_track(self):
+        self.client.force_authenticate(user=self.user)
+        start = timezone.now() - timedelta(minutes=1)
+        readings = [
+            {
+                "telephone": "1154047987",
+                "latitude": "-34.75",
+                "longitude": f"-58.{i}",
+                "timestamp": (start + timedelta(seconds=i)).isoformat(),
+                "message_sid": f"SM{i}",
+            }
+            for i in range(3)
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.alerts_bulk_url, readings, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        inserts = [
+            query
+            for query in context.captured_queries
+            if query["sql"].startswith('INSERT INTO "alerts_alertposition"')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+        alert = Alert.objects.get()
+        self.assertEqual(
+            list(alert.positions.order_by("timestamp").values_list("longitude")),
+            [(-58.0,), (-58.1,), (-58.2,)],
+        )
+
+    def test_track_validation_and_permissions(self):
+        self.post_sms("SM1", "-34.757884", "-58.2927029")
+        alert = Alert.objects.get()
+
+        response = self.get_track(alert, after="ayer")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        other_user_data = {
+            **self.register_root_user_data,
+            "email": "other_user@email.com",
+            "organization_name": "Otra",
+        }
+        self.client.post(self.register_root_url, other_user_data, format="json")
+        self.user = User.objects.get(email=other_user_data["email"])
+        response = self.get_track(alert)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestFastJSON(SimpleTestCase):
+    def payload(self):
+        return {
+            "id": 1,
+            "datetime": timezone.now(),
+            "date": timezone.now().date(),
+            "latitude": Decimal("-34.75788400"),
+            "message": _("Cuerpo del SMS inválido"),
+            "observations": "Señal débil   ✓",
+            "results": [{"status": "created", "id": 2}, None, True, 1.5],
+            3: "non str key",
+        }
+
+    def test_renderer_matches_drf_renderer(self):
+        data = self.payload()
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        with mock.patch("backend.renderers.orjson", None):
+            self.assertEqual(
+                FastJSONRenderer().render(data), JSONRenderer().render(data)
+            )
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=4"),
+            JSONRenderer().render(data, "application/json; indent=4"),
+        )
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_parser(self):
+        content = JSONRenderer().render(self.payload())
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(content)),
+            json.loads(content),
+        )
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"id": 1'))
+
+    def test_message_pack(self):
+        data = self.payload()
+        del data[3]
+        content = MessagePackRenderer().render(data)
+        self.assertEqual(
+            msgpack.unpackb(content), json.loads(JSONRenderer().render(data))
+        )
+        self.assertEqual(
+            MessagePackParser().parse(io.BytesIO(content)), msgpack.unpackb(content)
+        )
+        self.assertEqual(MessagePackRenderer().render(None), b"")
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(io.BytesIO(content[:-3]))
+
+
+class TestDataVersionETags(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alerts_url = reverse("alerts:alert-list")
+
+        self.client.force_authenticate(user=self.user)
+
+        organization = self.organization
+        self.alert_type = AlertType.objects.create(
+            code="TEST", description="Prueba de alerta", organization=organization
+        )
+        self.beneficiary = Beneficiary.objects.create(
+            name="John",
+            surname="Smith",
+            telephone="1154047987",
+            organization=organization,
+        )
+
+    def create_alert(self, organization=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Alert.objects.create(
+                datetime=timezone.now(),
+                beneficiary=self.beneficiary,
+                latitude="-34.757884",
+                longitude="-58.2927029",
+                type=self.alert_type,
+                organization=organization or self.user.organization,
+            )
+
+    def get(self, url, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(url, format="json", **headers)
+
+    def test_not_modified_without_queries(self):
+        self.create_alert()
+        for url in [
+            self.alerts_url,
+            reverse("alerts:alerts-summary"),
+            reverse("alerts:alert-type-list"),
+            reverse("alerts:beneficiary-type-list"),
+            reverse("alerts:beneficiary-list"),
+        ]:
+            response = self.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response["ETag"]
+
+            with self.assertNumQueries(0):
+                response = self.get(url, etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response["ETag"], etag)
+            self.assertEqual(response.content, b"")
+
+    def test_no_etags_without_a_shared_cache(self):
+        etag = self.get(self.alerts_url)["ETag"]
+        # Another worker could still hold the old data version
+        with self.settings(WEB_CONCURRENCY=4):
+            response = self.get(self.alerts_url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_changes_invalidate_etag(self):
+        etag = self.get(self.alerts_url)["ETag"]
+        self.assertNotEqual(self.get(f"{self.alerts_url}?state=N")["ETag"], etag)
+
+        self.create_alert()
+        response = self.get(self.alerts_url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+        etag = response["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alert_type.description = "Otra descripción"
+            self.alert_type.save()
+        response = self.get(self.alerts_url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+
+        # Coalesced messages update the alert without saving it
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer = AlertSerializer(
+                data={
+                    "telephone": "1154047987",
+                    "latitude": "-34.7",
+                    "longitude": "-58.2",
+                }
+            )
+            self.assertTrue(serializer.is_valid())
+            serializer.save()
+        response = self.get(self.alerts_url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["hits"], 2)
+
+    def test_other_organizations_do_not_invalidate_etag(self):
+        etag = self.get(self.alerts_url)["ETag"]
+        other = Organization.objects.create(name="Otra")
+        self.create_alert(organization=other)
+        response = self.get(self.alerts_url, etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class TestAlertsSummary(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alerts_summary_url = reverse("alerts:alerts-summary")
+        self.alerts_bulk_url = reverse("alerts:alerts-bulk")
+
+        self.client.force_authenticate(user=self.user)
+
+        self.beneficiary = Beneficiary.objects.create(
+            name="John",
+            surname="Smith",
+            telephone="1154047987",
+            organization=self.organization,
+        )
+
+    def create_alert(self, datetime, state="N"):
+        return Alert.objects.create(
+            datetime=datetime,
+            beneficiary=self.beneficiary,
+            latitude="-34.757884",
+            longitude="-58.2927029",
+            state=state,
+            organization=self.organization,
+        )
+
+    def get_cached_summary(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.alerts_summary_url, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def assert_summary_consistent(self):
+        """The cached summary is served without queries and matches the one
+        built from the database"""
+        with self.assertNumQueries(0):
+            response = self.client.get(self.alerts_summary_url, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        queryset = Alert.objects.filter(
+            organization=self.organization,
+            datetime__gte=timezone.now() - timedelta(days=1),
+        ).order_by("-datetime", "-id")
+        expected = AlertSerializer(queryset, many=True).data
+        self.assertEqual(
+            JSONRenderer().render(response.data), JSONRenderer().render(expected)
+        )
+        cached = get_summary(self.organization.id)
+        rebuilt = rebuild_summary(self.organization.id)
+        self.assertEqual(cached, [item for timestamp, pk, item in rebuilt])
+        return response.data
+
+    def test_summary_is_updated_incrementally(self):
+        self.create_alert(timezone.now() - timedelta(days=2), state="C")
+        # Cold start, built from the database
+        response = self.client.get(self.alerts_summary_url, format="json")
+        self.assertEqual(response.data, [])
+        self.assert_summary_consistent()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert = self.create_alert(timezone.now() - timedelta(seconds=10))
+        self.assertEqual(len(self.assert_summary_consistent()), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.alerts_bulk_url,
+                [
+                    {
+                        "telephone": "1154047987",
+                        "latitude": "-34.7",
+                        "longitude": "-58.2",
+                        "message_sid": "SM1",
+                    }
+                ],
+                format="json",
+            )
+        self.assertEqual(response.data[0]["status"], "coalesced")
+        self.assertEqual(self.assert_summary_consistent()[0]["hits"], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("alerts:alert-detail", args=[alert.pk]),
+                {"state": "A"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.assert_summary_consistent()[0]["state"], "A")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("alerts:alert-detail", args=[alert.pk]),
+                {"state": "C"},
+                format="json",
+            )
+        self.assertEqual(self.assert_summary_consistent()[0]["state"], "C")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.alerts_bulk_url,
+                [
+                    {
+                        "telephone": "1154047987",
+                        "latitude": "-34.7",
+                        "longitude": "-58.2",
+                        "message_sid": "SM2",
+                    }
+                ],
+                format="json",
+            )
+        self.assertEqual(response.data[0]["status"], "created")
+        self.assertEqual(len(self.assert_summary_consistent()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.beneficiary.name = "Johnny"
+            self.beneficiary.save()
+        self.assertIsNone(cache.get(f"alerts-summary:{self.organization.id}"))
+        self.client.get(self.alerts_summary_url, format="json")
+        summary = self.assert_summary_consistent()
+        self.assertEqual(summary[0]["beneficiary_name"], "Johnny")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert.delete()
+        self.assertEqual(len(self.assert_summary_consistent()), 1)
+
+    @override_settings(ALERTS_SUMMARY_COMPACT_AFTER=2, ALERTS_SUMMARY_MAX_PENDING=3)
+    def test_summary_deltas_are_compacted(self):
+        self.client.get(self.alerts_summary_url, format="json")
+        generation = cache.get(f"alerts-summary:{self.organization.id}")
+        base_key = f"alerts-summary:{self.organization.id}:{generation}"
+
+        # Writers only append their delta, the base is left as it is
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_alert(timezone.now() - timedelta(minutes=3), state="C")
+        self.assertEqual(cache.get(f"{base_key}:log"), 1)
+        self.assertEqual(len(self.get_cached_summary()), 1)
+        self.assertEqual(cache.get(base_key), {"applied": 0, "entries": []})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_alert(timezone.now() - timedelta(minutes=2), state="C")
+        self.assertEqual(len(self.get_cached_summary()), 2)
+        self.assertEqual(cache.get(base_key)["applied"], 2)
+        self.assertEqual(len(cache.get(base_key)["entries"]), 2)
+
+        # A delta not stored yet is skipped, and holds back the compaction
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_alert(timezone.now() - timedelta(minutes=1), state="C")
+            self.create_alert(timezone.now(), state="C")
+        cache.delete(f"{base_key}:log:3")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_alert(timezone.now(), state="C")
+        self.assertEqual(len(self.get_cached_summary()), 4)
+        self.assertEqual(cache.get(base_key)["applied"], 2)
+
+        # Too many pending deltas, built again from the database
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_alert(timezone.now(), state="C")
+        self.assertEqual(len(self.client.get(self.alerts_summary_url).data), 6)
+        self.assertNotEqual(
+            cache.get(f"alerts-summary:{self.organization.id}"), generation
+        )
+        self.assertEqual(len(self.assert_summary_consistent()), 6)
+
+    def test_alerts_age_out_of_summary(self):
+        self.create_alert(timezone.now() - timedelta(hours=23, minutes=59))
+        response = self.client.get(self.alerts_summary_url, format="json")
+        self.assertEqual(len(response.data), 1)
+
+        later = timezone.now() + timedelta(minutes=2)
+        with mock.patch("alerts.summary.timezone.now", return_value=later):
+            with self.assertNumQueries(0):
+                response = self.client.get(self.alerts_summary_url, format="json")
+        self.assertEqual(response.data, [])
+
+
+class TestSharedCacheCheck(SimpleTestCase):
+    def test_process_local_cache_with_several_workers(self):
+        locmem = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        redis = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                "LOCATION": "redis://localhost:6379",
+            }
+        }
+        with self.settings(WEB_CONCURRENCY=4, CACHES=locmem):
+            errors = check_shared_cache(None)
+        self.assertEqual([error.id for error in errors], ["alerts.E001"])
+        with self.settings(WEB_CONCURRENCY=1, CACHES=locmem):
+            self.assertEqual(check_shared_cache(None), [])
+        with self.settings(WEB_CONCURRENCY=4, CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class TestAlertRollups(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alerts_stats_url = reverse("alerts:alerts-stats")
+
+        self.client.force_authenticate(user=self.user)
+
+        self.beneficiary_type = BeneficiaryType.objects.create(
+            code="SER", description="Sereno", organization=self.organization
+        )
+        self.alert_type = AlertType.objects.create(
+            code="TEST", description="Prueba de alerta", organization=self.organization
+        )
+        self.beneficiary = Beneficiary.objects.create(
+            name="John",
+            surname="Smith",
+            telephone="1154047987",
+            organization=self.organization,
+            type=self.beneficiary_type,
+        )
+
+    def create_alert(self, **kwargs):
+        return Alert.objects.create(
+            **{
+                "datetime": timezone.now(),
+                "beneficiary": self.beneficiary,
+                "latitude": "-34.757884",
+                "longitude": "-58.2927029",
+                "organization": self.organization,
+                **kwargs,
+            }
+        )
+
+    def rollups(self):
+        return {
+            (
+                rollup.hour,
+                rollup.type_id,
+                rollup.beneficiary_type_id,
+                rollup.state,
+            ): rollup.count
+            for rollup in AlertRollup.objects.all()
+            if rollup.count
+        }
+
+    def assert_rollups_consistent(self):
+        rollups = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(rollups, self.rollups())
+        return rollups
+
+    def test_rollups_follow_alert_changes(self):
+        alert = self.create_alert()
+        self.create_alert(
+            datetime=timezone.now() - timedelta(hours=3), type=self.alert_type
+        )
+        response = self.client.post(
+            reverse("alerts:alerts-bulk"),
+            [{"telephone": "1154047987", "latitude": "-34.7", "longitude": "-58.2"}],
+            format="json",
+        )
+        self.assertEqual(response.data[0]["status"], "coalesced")
+        self.assertEqual(sum(self.assert_rollups_consistent().values()), 2)
+
+        url = reverse("alerts:alert-detail", args=[alert.pk])
+        response = self.client.patch(url, {"state": "A"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.patch(
+            url, {"type_id": self.alert_type.pk}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            (self.alert_type.pk, self.beneficiary_type.pk, "A"),
+            [key[1:] for key in self.assert_rollups_consistent()],
+        )
+
+        other_type = BeneficiaryType.objects.create(
+            code="VEC", description="Vecino", organization=self.organization
+        )
+        self.beneficiary.type = other_type
+        self.beneficiary.save()
+        self.assert_rollups_consistent()
+
+        self.alert_type.delete()
+        other_type.delete()
+        rollups = self.assert_rollups_consistent()
+        self.assertEqual({key[1:3] for key in rollups}, {(None, None)})
+
+        alert.delete()
+        self.assertEqual(sum(self.assert_rollups_consistent().values()), 1)
+
+    def test_bulk_rollups_are_updated_with_the_insert(self):
+        # Even if handling alerts_created afterwards fails
+        with mock.patch("alerts.ingest.alerts_created") as alerts_created:
+            response = self.client.post(
+                reverse("alerts:alerts-bulk"),
+                [
+                    {
+                        "telephone": "1154047987",
+                        "latitude": "-34.7",
+                        "longitude": "-58.2",
+                    }
+                ],
+                format="json",
+            )
+        self.assertEqual(response.data[0]["status"], "created")
+        self.assertTrue(alerts_created.send.called)
+        self.assertEqual(sum(self.assert_rollups_consistent().values()), 1)
+
+    def test_alert_saves_do_not_read_it_again(self):
+        alert = Alert.objects.get(pk=self.create_alert().pk)
+
+        def selects():
+            return [
+                query["sql"]
+                for query in context.captured_queries
+                if query["sql"].startswith("SELECT")
+            ]
+
+        with CaptureQueriesContext(connection) as context:
+            alert.observations = "Sin novedad"
+            alert.save(update_fields=["observations"])
+            alert.save()
+        self.assertEqual(selects(), [])
+
+        # Only the type of the beneficiary, for the new rollup key
+        with CaptureQueriesContext(connection) as context:
+            alert.state = "A"
+            alert.save()
+        self.assertEqual(len(selects()), 1)
+        self.assertIn("alerts_beneficiary", selects()[0])
+        self.assertEqual(sum(self.assert_rollups_consistent().values()), 1)
+
+        alert.refresh_from_db()
+        alert.state = "C"
+        alert.save(update_fields=["state"])
+        self.assertEqual([key[-1] for key in self.assert_rollups_consistent()], ["C"])
+
+    def test_alert_stats(self):
+        self.create_alert()
+        self.create_alert(state="C", type=self.alert_type)
+        self.create_alert(state="C", type=self.alert_type)
+        self.create_alert(datetime=timezone.now() - timedelta(days=2))
+
+        response = self.client.get(f"{self.alerts_stats_url}?group_by=state,type")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            [
+                {"state": "C", "type_id": self.alert_type.pk, "count": 2},
+                {"state": "N", "type_id": None, "count": 1},
+            ],
+        )
+
+        since = (timezone.now() - timedelta(days=3)).isoformat()
+        response = self.client.get(
+            self.alerts_stats_url, {"since": since, "group_by": ""}
+        )
+        self.assertEqual(response.data, [{"count": 4}])
+
+        response = self.client.get(self.alerts_stats_url)
+        self.assertEqual(sum(row["count"] for row in response.data), 3)
+        self.assertEqual(
+            set(response.data[0]),
+            {"hour", "state", "type_id", "beneficiary_type_id", "count"},
+        )
+
+        response = self.client.get(self.alerts_stats_url, {"group_by": "operator"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_alert_stats_include_partial_hours(self):
+        self.create_alert(datetime=timezone.now() - timedelta(hours=23, minutes=59))
+        response = self.client.get(self.alerts_stats_url, {"group_by": ""})
+        self.assertEqual(response.data, [{"count": 1}])
+
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        start = hour - timedelta(hours=5)
+        self.create_alert(datetime=start + timedelta(minutes=45))
+        response = self.client.get(
+            self.alerts_stats_url,
+            {
+                "since": (start + timedelta(minutes=30)).isoformat(),
+                "until": (start + timedelta(minutes=50)).isoformat(),
+                "group_by": "",
+            },
+        )
+        self.assertEqual(response.data, [{"count": 1}])
+
+    def test_rebuild_command(self):
+        self.create_alert()
+        self.create_alert(type=self.alert_type)
+        rollups = self.rollups()
+
+        AlertRollup.objects.all().delete()
+        call_command("rebuild_alert_rollups", stdout=io.StringIO())
+        self.assertEqual(self.rollups(), rollups)
+
+    def test_bulk_transition(self):
+        alerts = [self.create_alert() for i in range(3)]
+        attended = self.create_alert(state="A")
+        other = Organization.objects.create(name="Otra")
+        foreign = self.create_alert(
+            organization=other,
+            beneficiary=Beneficiary.objects.create(
+                name="Jane", surname="Doe", telephone="1154047988", organization=other
+            ),
+        )
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(str(self.organization.id), channel)
+
+        url = reverse("alerts:alert-transition")
+        ids = [alert.pk for alert in alerts] + [attended.pk, foreign.pk]
+        # The transition and the rollups of the alerts, with one UPDATE
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {"ids": ids, "state": "A"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["updated"], [alert.pk for alert in alerts])
+        self.assertEqual(response.data["skipped"], [attended.pk, foreign.pk])
+        self.assertEqual(
+            sum(query["sql"].startswith('UPDATE "alerts_alert"') for query in queries),
+            1,
+        )
+        for alert in Alert.objects.filter(pk__in=response.data["updated"]):
+            self.assertEqual((alert.state, alert.operator_id), ("A", self.user.pk))
+            self.assertIsNotNone(alert.datetime_attended)
+        self.assertEqual(Alert.objects.get(pk=foreign.pk).state, "N")
+        self.assertEqual(
+            {key[-1]: count for key, count in self.assert_rollups_consistent().items()},
+            {"A": 4, "N": 1},
+        )
+
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event["type"], "alerts_changed")
+        self.assertEqual(event["message"]["event"], "alerts_changed")
+        self.assertEqual(
+            [(alert["id"], alert["state"]) for alert in event["message"]["alerts"]],
+            [(alert.pk, "A") for alert in alerts],
+        )
+
+        response = self.client.post(
+            url, {"ids": [alerts[0].pk, attended.pk], "state": "C"}, format="json"
+        )
+        self.assertEqual(response.data["updated"], [alerts[0].pk, attended.pk])
+        self.assertIsNotNone(Alert.objects.get(pk=attended.pk).datetime_closed)
+        response = self.client.post(
+            url, {"ids": [alerts[1].pk], "state": "N"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.settings(ALERTS_TRANSITION_MAX_ITEMS=1):
+            response = self.client.post(url, {"ids": ids, "state": "C"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(ALERTS_CHANGES_LAG=0, ALERTS_CHANGES_MAX_ITEMS=2)
+class TestAlertChanges(AlertsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alerts_url = reverse("alerts:alert-list")
+        self.alert_changes_url = reverse("alerts:alert-changes")
+        self.beneficiary_changes_url = reverse("alerts:beneficiary-changes")
+
+        self.client.force_authenticate(user=self.user)
+
+        organization = self.organization
+        self.alerts = []
+        for i in range(3):
+            beneficiary = Beneficiary.objects.create(
+                name="John",
+                surname="Smith",
+                telephone=f"11540479{i:02d}",
+                organization=organization,
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                alert = Alert.objects.create(
+                    datetime=timezone.now(),
+                    beneficiary=beneficiary,
+                    latitude="-34.757884",
+                    longitude="-58.2927029",
+                    organization=organization,
+                )
+            self.alerts.append(alert)
+
+    def changes(self, url, cursor=None, **params):
+        if cursor:
+            params["since"] = cursor
+        response = self.client.get(url, params, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)
+
+    def test_alert_changes(self):
+        page = self.changes(self.alert_changes_url)
+        self.assertEqual(
+            [alert["id"] for alert in page["results"]],
+            [alert.id for alert in self.alerts[:2]],
+        )
+        self.assertTrue(page["more"])
+        self.assertEqual(
+            page["results"][0],
+            json.loads(
+                JSONRenderer().render(
+                    AlertSerializer(Alert.objects.get(id=self.alerts[0].id)).data
+                )
+            ),
+        )
+
+        page = self.changes(self.alert_changes_url, page["cursor"])
+        self.assertEqual(
+            [alert["id"] for alert in page["results"]], [self.alerts[2].id]
+        )
+        self.assertFalse(page["more"])
+        cursor = page["cursor"]
+        self.assertEqual(self.changes(self.alert_changes_url, cursor)["results"], [])
+
+        alert = self.alerts[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"{self.alerts_url}{alert.id}/", {"state": "A"}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page = self.changes(self.alert_changes_url, cursor, fields="id,state")
+        self.assertEqual(page["results"], [{"id": alert.id, "state": "A"}])
+
+    def test_beneficiary_changes(self):
+        page = self.changes(self.beneficiary_changes_url)
+        page = self.changes(self.beneficiary_changes_url, page["cursor"])
+        self.assertFalse(page["more"])
+        cursor = page["cursor"]
+
+        beneficiary = self.alerts[0].beneficiary
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse("alerts:beneficiary-list") + f"{beneficiary.id}/"
+            )
+        page = self.changes(self.beneficiary_changes_url, cursor)
+        self.assertEqual(len(page["results"]), 1)
+        self.assertEqual(page["results"][0]["id"], beneficiary.id)
+        self.assertFalse(page["results"][0]["enabled"])
+
+    def test_saves_with_update_fields_are_changes(self):
+        cursor = self.changes(self.alert_changes_url)["cursor"]
+        cursor = self.changes(self.alert_changes_url, cursor)["cursor"]
+        self.assertEqual(self.changes(self.alert_changes_url, cursor)["results"], [])
+
+        alert = Alert.objects.get(id=self.alerts[0].id)
+        alert.state = "A"
+        alert.save(update_fields=["state"])
+        page = self.changes(self.alert_changes_url, cursor, fields="id,state")
+        self.assertEqual(page["results"], [{"id": alert.id, "state": "A"}])
+
+        cursor = self.changes(self.beneficiary_changes_url)["cursor"]
+        cursor = self.changes(self.beneficiary_changes_url, cursor)["cursor"]
+        beneficiary = alert.beneficiary
+        beneficiary.name = "Johnny"
+        beneficiary.save(update_fields=["name"])
+        page = self.changes(self.beneficiary_changes_url, cursor, fields="id,name")
+        self.assertEqual(page["results"], [{"id": beneficiary.id, "name": "Johnny"}])
+
+    def test_recent_changes_are_sent_again(self):
+        with override_settings(ALERTS_CHANGES_LAG=60, ALERTS_CHANGES_MAX_ITEMS=10):
+            page = self.changes(self.alert_changes_url)
+            self.assertEqual(len(page["results"]), 3)
+            page = self.changes(self.alert_changes_url, page["cursor"])
+            self.assertEqual(len(page["results"]), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.alert_changes_url, {"since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestAlertGeoFilters(AlertsTestCase):
+    locations = [
+        (-34.654905, -58.6497804),
+        (-34.676289, -58.378931),
+        (-34.6497796, -58.51051807),
+        (-34.6326636, -58.692194399),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.alerts_url = reverse("alerts:alert-list")
+        self.client.force_authenticate(user=self.user)
+
+        self.alerts = []
+        for i, (latitude, longitude) in enumerate(self.locations):
+            beneficiary = Beneficiary.objects.create(
+                name="John",
+                surname="Smith",
+                telephone=f"11540479{i:02d}",
+                organization=self.organization,
+            )
+            self.alerts.append(
+                Alert.objects.create(
+                    datetime=timezone.now(),
+                    beneficiary=beneficiary,
+                    latitude=latitude,
+                    longitude=longitude,
+                    organization=self.organization,
+                )
+            )
+
+    def ids(self, **params):
+        response = self.client.get(self.alerts_url, params, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(alert["id"] for alert in json.loads(response.content)["results"])
+
+    def distance(self, a, b):
+        phi_a, phi_b = math.radians(a[0]), math.radians(b[0])
+        haversine = (
+            math.sin((phi_b - phi_a) / 2) ** 2
+            + math.cos(phi_a)
+            * math.cos(phi_b)
+            * math.sin(math.radians(b[1] - a[1]) / 2) ** 2
+        )
+        return 2 * EARTH_RADIUS * math.asin(math.sqrt(haversine))
+
+    def test_near(self):
+        for center in self.locations:
+            for radius in [100, 5000, 15000, 30000]:
+                expected = sorted(
+                    alert.id
+                    for alert, location in zip(self.alerts, self.locations)
+                    if self.distance(center, location) <= radius
+                )
+                near = ",".join(str(coordinate) for coordinate in center)
+                self.assertEqual(self.ids(near=near, radius=radius), expected)
+
+        response = self.client.get(self.alerts_url, {"near": "-34.6,-58.6"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.alerts_url, {"near": "-95,-58", "radius": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bbox(self):
+        self.assertEqual(
+            self.ids(bbox="-58.7,-34.66,-58.5,-34.6"),
+            sorted(self.alerts[i].id for i in [0, 2, 3]),
+        )
+        self.assertEqual(self.ids(bbox="-58.4,-34.7,-58.3,-34.6"), [self.alerts[1].id])
+        self.assertEqual(len(self.ids(bbox="-80,-60,-40,0")), 4)
+        self.assertEqual(self.ids(bbox="170,-35,-170,-34"), [])
+
+        response = self.client.get(self.alerts_url, {"bbox": "-58.4,-34.6,-58.3"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cell_is_kept_up_to_date(self):
+        alert = self.alerts[0]
+        self.assertEqual(alert.cell, grid_cell(*self.locations[0]))
+
+        alert.latitude, alert.longitude = self.locations[1]
+        alert.save(update_fields=["latitude", "longitude"])
+        alert.refresh_from_db()
+        self.assertEqual(alert.cell, grid_cell(*self.locations[1]))
+
+        created = Alert.objects.bulk_create(
+            [
+                Alert(
+                    datetime=timezone.now(),
+                    beneficiary=alert.beneficiary,
+                    latitude="-34.6",
+                    longitude="-58.4",
+                    organization=self.organization,
+                )
+            ]
+        )
+        self.assertEqual(
+            Alert.objects.get(id=created[0].id).cell, grid_cell(-34.6, -58.4)
+        )
+
+    def test_cell_ranges(self):
+        self.assertEqual(grid_cell(-90, -180), 0)
+        self.assertEqual(grid_cell(90, 180), ROWS * COLUMNS - 1)
+        ranges = cell_ranges(-34.7, -58.7, -34.6, -58.3)
+        self.assertEqual(len(ranges), 11)
+        cell = grid_cell(-34.654905, -58.6497804)
+        self.assertTrue(any(first <= cell <= last for first, last in ranges))
+        # Across the antimeridian, two ranges per row
+        self.assertEqual(len(cell_ranges(0, 179.99, 0.005, -179.99)), 2)
+        # Too many rows, scanned as a single range
+        self.assertEqual(len(cell_ranges(-60, -80, 0, -40)), 1)
+
+    def test_clusters(self):
+        clusters_url = reverse("alerts:alert-clusters")
+        bbox = "-59,-35,-58,-34"
+
+        response = self.client.get(clusters_url, {"bbox": bbox, "zoom": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["count"], 4)
+        self.assertAlmostEqual(
+            response.data[0]["latitude"],
+            sum(latitude for latitude, longitude in self.locations) / 4,
+            places=5,
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(clusters_url, {"bbox": bbox, "zoom": 11})
+        self.assertEqual(sum(cluster["count"] for cluster in response.data), 4)
+        self.assertGreater(len(response.data), 1)
+        self.assertGreater(len(context.captured_queries), 0)
+        with CaptureQueriesContext(connection) as context:
+            cached = self.client.get(clusters_url, {"bbox": bbox, "zoom": 11})
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(len(context.captured_queries), 0)
+
+        response = self.client.get(
+            clusters_url, {"bbox": bbox, "zoom": 11, "state": "A"}
+        )
+        self.assertEqual(response.data, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Alert.objects.create(
+                datetime=timezone.now(),
+                beneficiary=self.alerts[0].beneficiary,
+                latitude=self.locations[1][0],
+                longitude=self.locations[1][1],
+                organization=self.organization,
+            )
+        response = self.client.get(clusters_url, {"bbox": bbox, "zoom": 11})
+        self.assertEqual(sum(cluster["count"] for cluster in response.data), 5)
+
+        response = self.client.get(
+            clusters_url, {"bbox": "-60,-36,-57,-33", "zoom": 22}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(clusters_url, {"bbox": bbox})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,59 @@
+"""
+Bulk state transitions of alerts for alerts/transition/.
+
+Alerts go from New to Attended to Closed, as enforced by AlertViewSet.update.
+Transitioning many alerts takes a single conditional UPDATE, which only
+changes the ones still in the state the transition starts from, so an alert
+attended or closed meanwhile by another operator is skipped instead of being
+overwritten. The changed alerts are then broadcast to the websocket consumers
+in one `alerts_changed` message, see alerts/signals.py.
+"""
+
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from alerts.models import Alert
+from alerts.rollup import rollup_keys, update_rollups
+
+# State each target state is reached from, and the field set to the time of
+# the transition
+TRANSITIONS = {
+    "A": ("N", "datetime_attended"),
+    "C": ("A", "datetime_closed"),
+}
+
+# Sent with `alerts` after changing their state with update(), which skips
+# post_save
+alerts_transitioned = Signal()
+
+
+def transition_alerts(organization_id, ids, state, operator):
+    """Moves the alerts of the organization with the given ids to the state,
+    by `operator` when attending them
+
+    Returns the ids of the alerts that were changed; the others don't exist or
+    aren't in the state the transition starts from.
+    """
+    expected, field = TRANSITIONS[state]
+    now = timezone.now()
+    values = {"state": state, field: now, "updated_at": now}
+    if state == "A":
+        values["operator"] = operator
+
+    with transaction.atomic():
+        # Locked so that the rollups of exactly these alerts can be moved
+        alerts = list(
+            Alert.objects.select_for_update()
+            .filter(organization_id=organization_id, pk__in=ids, state=expected)
+            .only("organization_id", "datetime", "type_id", "beneficiary_id", "state")
+        )
+        if not alerts:
+            return []
+        Alert.objects.filter(
+            pk__in=[alert.pk for alert in alerts], state=expected
+        ).update(**values)
+        keys = rollup_keys(alerts)
+        update_rollups(added=[key._replace(state=state) for key in keys], removed=keys)
+    alerts_transitioned.send(sender=Alert, alerts=alerts)
+    return [alert.pk for alert in alerts]
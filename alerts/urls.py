@@ -2,7 +2,9 @@ from django.urls import path
 from rest_framework.routers import DefaultRouter
 
 from alerts.views import (
+    AlertBulkView,
     AlertsSummaryView,
+    AlertStatsView,
     AlertTypeViewSet,
     AlertViewSet,
     BeneficiaryTypeViewSet,
@@ -27,7 +29,9 @@ router.register(r"alert-types", AlertTypeViewSet, basename="alert-type")
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
     path("twilio-webhook/", TwilioWebhookView.as_view(), name="twilio-webhook"),
+    path("alerts-bulk/", AlertBulkView.as_view(), name="alerts-bulk"),
     path("alerts-summary/", AlertsSummaryView.as_view(), name="alerts-summary"),
+    path("alerts-stats/", AlertStatsView.as_view(), name="alerts-stats"),
     path("dummy-alert/", FakeAlertAPIView.as_view(), name="dummy-alert"),
     path("dummy-error/", FakeErrorAPIView.as_view(), name="dummy-error"),
 ]
@@ -1,3 +1,6 @@
+import re
+import unicodedata
+
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
@@ -17,3 +20,53 @@ class EnablePartialUpdateMixin:
 def only_int(value):
     if value.isdigit() is False:
         raise ValidationError(_("Solo se permiten números."))
+
+
+# Argentina. Mobile numbers carry a 9 between the country code and the area code
+# when dialled from abroad, which is how Twilio reports the sender.
+COUNTRY_CODE = "54"
+MOBILE_PREFIX = "9"
+NATIONAL_NUMBER_LENGTH = 10
+# Digits of an E.164 number, after the +
+E164_MAX_DIGITS = 15
+
+
+def normalize_telephone(value):
+    """Returns the E.164 form of a mobile telephone, e.g. +5491154047987
+
+    Accepts national numbers, with or without the trunk 0 (1154047987,
+    01154047987), and international ones, with or without the mobile 9
+    (+5491154047987, 541154047987). Other numbers are returned as + and their digits.
+    Returns "" when there are no digits or more than E.164 allows.
+    """
+    digits = re.sub(r"\D", "", str(value))
+    if not digits:
+        return ""
+    if len(digits) == NATIONAL_NUMBER_LENGTH + 1 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == NATIONAL_NUMBER_LENGTH:
+        return f"+{COUNTRY_CODE}{MOBILE_PREFIX}{digits}"
+    if len(digits) == len(COUNTRY_CODE) + NATIONAL_NUMBER_LENGTH and digits.startswith(
+        COUNTRY_CODE
+    ):
+        return f"+{COUNTRY_CODE}{MOBILE_PREFIX}{digits[len(COUNTRY_CODE):]}"
+    if len(digits) > E164_MAX_DIGITS:
+        return ""
+    return f"+{digits}"
+
+
+def e164_telephone(value):
+    if not normalize_telephone(value):
+        raise ValidationError(
+            _("El teléfono debe tener como máximo %(count)s dígitos.")
+            % {"count": E164_MAX_DIGITS}
+        )
+
+
+def normalize_text(value):
+    """Returns the text in lowercase, without accents nor repeated spaces, as
+    matched by the searches, e.g. "  José  Pérez" -> "jose perez"
+    """
+    decomposed = unicodedata.normalize("NFKD", str(value))
+    text = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(text.casefold().split())
@@ -1,34 +1,67 @@
+import csv
+import time
 from datetime import datetime, timedelta
 from http.client import METHOD_NOT_ALLOWED
 from random import choice, randrange
 from string import digits
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 from django_twilio.decorators import twilio_view
-from rest_framework import status, viewsets
+from rest_framework import serializers, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.generics import GenericAPIView
 from rest_framework.parsers import FormParser
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from twilio.twiml.messaging_response import MessagingResponse
 
-from alerts.models import Alert, AlertType, Beneficiary, BeneficiaryType
+from alerts.cache import claim_message_sid, release_message_sid
+from alerts.changes import ChangesMixin
+from alerts.clusters import get_clusters
+from alerts.etags import DataVersionETagMixin
+from alerts.export import export_csv, export_ndjson, streaming_content
+from alerts.filters import AlertFilter, BeneficiaryFilter
+from alerts.imports import import_beneficiaries, read_csv
+from alerts.ingest import get_batcher, ingest_readings
+from alerts.location import parse_location
+from alerts.models import Alert, AlertRollup, AlertType, Beneficiary, BeneficiaryType
+from alerts.pagination import AlertCursorPagination
 from alerts.permissions import IsSameOrganization
+from alerts.rollup import round_up_hour, truncate_hour
 from alerts.serializers import (
+    ALERT_VALUE_COLUMNS,
+    AlertClustersQuerySerializer,
+    AlertPositionSerializer,
+    AlertReadingSerializer,
     AlertSerializer,
+    AlertStatsQuerySerializer,
+    AlertTransitionSerializer,
     AlertTypeSerializer,
     BeneficiarySerializer,
     BeneficiaryTypeSerializer,
+    alert_relations,
+    alert_values,
+    serialize_alert_values,
+    sparse_fields,
 )
+from alerts.summary import get_summary
+from alerts.transitions import transition_alerts
 from alerts.utils import EnablePartialUpdateMixin
 
 
-class BeneficiaryTypeViewSet(EnablePartialUpdateMixin, viewsets.ModelViewSet):
+class BeneficiaryTypeViewSet(
+    DataVersionETagMixin, EnablePartialUpdateMixin, viewsets.ModelViewSet
+):
     permission_classes = [
         IsSameOrganization,
     ]
@@ -44,7 +77,9 @@ class BeneficiaryTypeViewSet(EnablePartialUpdateMixin, viewsets.ModelViewSet):
         return queryset
 
 
-class AlertTypeViewSet(EnablePartialUpdateMixin, viewsets.ModelViewSet):
+class AlertTypeViewSet(
+    DataVersionETagMixin, EnablePartialUpdateMixin, viewsets.ModelViewSet
+):
     permission_classes = [
         IsSameOrganization,
     ]
@@ -111,7 +146,9 @@ class FakeAlertAPIView(APIView):
         return HttpResponse(status=200)
 
 
-class BeneficiaryViewSet(EnablePartialUpdateMixin, viewsets.ModelViewSet):
+class BeneficiaryViewSet(
+    ChangesMixin, DataVersionETagMixin, EnablePartialUpdateMixin, viewsets.ModelViewSet
+):
     """
     A viewset that provides the standard actions for beneficiaries
     """
@@ -123,15 +160,60 @@ class BeneficiaryViewSet(EnablePartialUpdateMixin, viewsets.ModelViewSet):
     serializer_class = BeneficiarySerializer
 
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ["telephone", "name", "surname", "enabled"]
+    filterset_class = BeneficiaryFilter
 
     def get_queryset(self):
         user = self.request.user
         queryset = self.filter_queryset(
             Beneficiary.objects.filter(organization=user.organization).order_by("id")
         )
+        if self.action in ("list", "retrieve", "changes"):
+            # Only the columns of the fields requested with ?fields= or ?omit=
+            fields = sparse_fields(self.request, BeneficiarySerializer.Meta.fields)
+            if self.action == "changes":
+                fields.append("updated_at")
+            queryset = queryset.only(*fields)
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(request, self.list_beneficiaries)
+
+    def list_beneficiaries(self, request):
+        queryset = self.get_queryset()
+        if request.query_params.get("search"):
+            queryset = queryset.order_by("search_surname", "id")[
+                : settings.BENEFICIARY_SEARCH_MAX_RESULTS
+            ]
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def bulk_import(self, request):
+        """
+        Creates the beneficiaries of a JSON list, or of a CSV file uploaded as
+        `file`, and answers with how many were created and the errors of the
+        rows that were skipped
+        """
+        upload = request.FILES.get("file")
+        try:
+            rows = list(read_csv(upload)) if upload else request.data
+        except (UnicodeDecodeError, csv.Error):
+            return Response(
+                _("El archivo CSV es inválido"), status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(rows, list):
+            return Response(
+                _("Se requiere una lista de beneficiarios o un archivo CSV"),
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(rows) > settings.BENEFICIARY_IMPORT_MAX_ITEMS:
+            return Response(
+                _("Se admiten hasta %(count)s beneficiarios por solicitud")
+                % {"count": settings.BENEFICIARY_IMPORT_MAX_ITEMS},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(import_beneficiaries(request.user.organization, rows))
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         instance.enabled = False
@@ -149,7 +231,9 @@ class BeneficiaryViewSet(EnablePartialUpdateMixin, viewsets.ModelViewSet):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class AlertViewSet(EnablePartialUpdateMixin, viewsets.ModelViewSet):
+class AlertViewSet(
+    ChangesMixin, DataVersionETagMixin, EnablePartialUpdateMixin, viewsets.ModelViewSet
+):
     """
     A viewset that provides the standard actions for beneficiaries
     """
@@ -159,22 +243,47 @@ class AlertViewSet(EnablePartialUpdateMixin, viewsets.ModelViewSet):
     ]
 
     serializer_class = AlertSerializer
+    pagination_class = AlertCursorPagination
 
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = {
-        "datetime": ["lte", "gte"],
-        "beneficiary_id": ["exact"],
-        "state": ["exact"],
-        "type": ["exact"],
-    }
+    filterset_class = AlertFilter
 
     def get_queryset(self):
         user = self.request.user
         queryset = self.filter_queryset(
-            Alert.objects.filter(organization=user.organization)
-        ).order_by("-datetime")
+            Alert.objects.filter(organization=user.organization).select_related(
+                *alert_relations(self.get_fields())
+            )
+        ).order_by("-datetime", "-id")
         return queryset
 
+    def get_fields(self):
+        """Fields rendered for the request, ?fields= and ?omit= apply to GET"""
+        if self.request.method not in SAFE_METHODS:
+            return AlertSerializer.Meta.fields
+        return sparse_fields(self.request, AlertSerializer.Meta.fields)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(request, self.list_values)
+
+    def list_values(self, request):
+        fields = self.get_fields()
+        # The cursor of the pagination is taken from the datetime of the rows
+        extra = [] if "datetime" in fields else ["datetime"]
+        queryset = alert_values(self.get_queryset(), *extra, fields=fields)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize_alert_values(page, fields))
+        return Response(serialize_alert_values(queryset, fields))
+
+    def serialize_changes(self, queryset):
+        fields = self.get_fields()
+        columns = [ALERT_VALUE_COLUMNS[field] for field in fields]
+        extra = [column for column in ("id", "updated_at") if column not in columns]
+        rows = list(alert_values(queryset, *extra, fields=fields))
+        keys = [(row["updated_at"], row["id"]) for row in rows]
+        return serialize_alert_values(rows, fields), keys
+
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=True)
@@ -235,6 +344,101 @@ class AlertViewSet(EnablePartialUpdateMixin, viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         raise METHOD_NOT_ALLOWED(request.method)
 
+    @action(detail=False, url_path="export/(?P<export_format>csv|ndjson)")
+    def export(self, request, export_format=None):
+        """
+        Every alert matching the filters of the list, streamed as CSV or NDJSON
+        """
+        queryset, fields = self.get_queryset(), self.get_fields()
+        if export_format == "csv":
+            content = export_csv(queryset, fields)
+            content_type = "text/csv; charset=utf-8"
+        else:
+            content, content_type = (
+                export_ndjson(queryset, fields),
+                "application/x-ndjson",
+            )
+        response = StreamingHttpResponse(
+            streaming_content(request._request, content), content_type=content_type
+        )
+        response[
+            "Content-Disposition"
+        ] = f'attachment; filename="alertas.{export_format}"'
+        return response
+
+    @action(detail=False)
+    def clusters(self, request):
+        """
+        Count and centroid of the alerts of each cluster of the map at the
+        ?zoom= level within ?bbox=, filtered like the list
+        """
+        return self.get_conditional_response(request, self.list_clusters)
+
+    def list_clusters(self, request):
+        serializer = AlertClustersQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+
+        # Clusters are cached in blocks that extend beyond the bbox
+        params = request.query_params.copy()
+        for name in ("bbox", "zoom", "fields", "omit"):
+            params.pop(name, None)
+        filterset = AlertFilter(
+            params,
+            queryset=Alert.objects.filter(organization=request.user.organization),
+            request=request,
+        )
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        clusters = get_clusters(
+            filterset.qs,
+            request.user.organization_id,
+            params.lists(),
+            query["bbox"],
+            query["zoom"],
+        )
+        return Response(clusters)
+
+    @action(detail=False, methods=["post"])
+    def transition(self, request):
+        """
+        Moves the alerts with the given `ids` to `state`, A (attended) from N
+        or C (closed) from A, answering with the ids that were changed and the
+        ones skipped because they weren't in the state the transition starts
+        from
+        """
+        serializer = AlertTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids, state = (
+            serializer.validated_data["ids"],
+            serializer.validated_data["state"],
+        )
+        updated = transition_alerts(
+            request.user.organization_id, ids, state, request.user
+        )
+        return Response(
+            {
+                "updated": sorted(updated),
+                "skipped": sorted(set(ids) - set(updated)),
+            }
+        )
+
+    @action(detail=True)
+    def track(self, request, pk=None):
+        """
+        Positions received for the alert, oldest first. With ?after=<id> only
+        the ones received after the position with that id, so the map can poll
+        for new positions, including late readings with older timestamps
+        """
+        alert = self.get_object()
+        positions = alert.positions.order_by("timestamp", "id")
+        after = request.query_params.get("after")
+        if after:
+            after = serializers.IntegerField().run_validation(after)
+            positions = positions.filter(id__gt=after)
+        serializer = AlertPositionSerializer(positions, many=True)
+        return Response(serializer.data)
+
 
 class TwilioWebhookView(APIView):
     authentication_classes = []
@@ -250,7 +454,7 @@ class TwilioWebhookView(APIView):
     def post(self, request, format=None):
         try:
             message_sid = request.data["MessageSid"]
-            # El cuerpo debe tener el formato https://maps.google.com/?q=<lat>,<lng>
+            # El cuerpo debe incluir la ubicación, ver formatos en alerts/location.py
             body = request.data["Body"]
             telephone = request.data["From"]
         except KeyError:
@@ -259,36 +463,99 @@ class TwilioWebhookView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if body and "https://maps.google.com/?q=" in body:
+        # Twilio reintenta el webhook con el mismo MessageSid ante un timeout
+        if not claim_message_sid(message_sid):
+            return HttpResponse(MessagingResponse())
+
+        try:
+            response = self.create_alert(body, telephone, message_sid)
+        except Exception:
+            release_message_sid(message_sid)
+            raise
+        if response.status_code != status.HTTP_200_OK:
+            release_message_sid(message_sid)
+        return response
+
+    def create_alert(self, body, telephone, message_sid):
+        location = parse_location(body)
+        if location is None:
+            return Response(
+                _("Cuerpo del SMS inválido"), status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data = {
+            "latitude": str(location.latitude),
+            "longitude": str(location.longitude),
+            # ^\+[1-9]\d{1,14}$ es el formato del teléfono
+            "telephone": telephone.lstrip("+"),
+            "message_sid": message_sid,
+        }
+        serializer = AlertSerializer(data=data)
+        if serializer.is_valid():
+            if settings.ALERTS_INGEST_MODE == "batched":
+                alert = serializer.build(serializer.validated_data)
+                if get_batcher().submit(alert):
+                    return HttpResponse(MessagingResponse())
             try:
-                partition = body.split("https://maps.google.com/?q=")
-                latitude, longitude = partition[1].split(",")
-                data = {
-                    "latitude": latitude,
-                    "longitude": longitude,
-                    # ^\+[1-9]\d{1,14}$ es el formato del teléfono
-                    "telephone": telephone.replace("+", "").replace("549", ""),
-                    "message_sid": message_sid,
-                }
-                serializer = AlertSerializer(data=data)
-                if serializer.is_valid():
+                with transaction.atomic():
                     serializer.save()
-                    return HttpResponse(MessagingResponse())
-                else:
-                    return Response(
-                        _("Error creando alerta"), status=status.HTTP_400_BAD_REQUEST
-                    )
-            except ValueError:
-                return Response(
-                    _("Datos del SMS inválidos"), status=status.HTTP_400_BAD_REQUEST
-                )
+            except IntegrityError:
+                # La alerta del mensaje ya fue creada por un intento anterior
+                pass
+            return HttpResponse(MessagingResponse())
         else:
             return Response(
-                _("Cuerpo del SMS inválido"), status=status.HTTP_400_BAD_REQUEST
+                _("Error creando alerta"), status=status.HTTP_400_BAD_REQUEST
             )
 
 
-class AlertsSummaryView(GenericAPIView):
+class AlertBulkView(APIView):
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def post(self, request, format=None):
+        """Creates the alerts of the readings buffered by a tracker or gateway
+
+        Answers with one result per reading, in the same order.
+        """
+        if not isinstance(request.data, list):
+            return Response(
+                _("Se requiere una lista de lecturas"),
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(request.data) > settings.ALERTS_BULK_MAX_ITEMS:
+            return Response(
+                _("Se admiten hasta %(count)s lecturas por solicitud")
+                % {"count": settings.ALERTS_BULK_MAX_ITEMS},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = [None] * len(request.data)
+        readings = {}
+        for index, item in enumerate(request.data):
+            serializer = AlertReadingSerializer(data=item)
+            if serializer.is_valid():
+                readings[index] = serializer.validated_data
+            else:
+                results[index] = {"status": "error", "errors": serializer.errors}
+
+        try:
+            ingested = ingest_readings(
+                request.user.organization_id, list(readings.values())
+            )
+        except IntegrityError:
+            # Otra solicitud insertó uno de los message_sid, reintentar es seguro
+            return Response(
+                _("Lecturas recibidas en simultáneo, reintente"),
+                status=status.HTTP_409_CONFLICT,
+            )
+        for index, result in zip(readings, ingested):
+            results[index] = result
+        return Response(results)
+
+
+class AlertsSummaryView(DataVersionETagMixin, GenericAPIView):
     permission_classes = [
         IsAuthenticated,
     ]
@@ -296,12 +563,53 @@ class AlertsSummaryView(GenericAPIView):
     serializer_class = AlertSerializer
 
     def get(self, request):
-        user = self.request.user
-        queryset = self.filter_queryset(
-            Alert.objects.filter(
-                organization=user.organization,
-                datetime__gte=datetime.now() - timedelta(days=1),
-            ).order_by("-datetime")
+        return self.get_conditional_response(request, self.get_summary)
+
+    def get_etag(self, request, *parts):
+        # The 24h window slides even when no alert changes
+        return super().get_etag(request, int(time.time() // 60), *parts)
+
+    def get_summary(self, request):
+        return Response(get_summary(request.user.organization_id))
+
+
+class AlertStatsView(DataVersionETagMixin, APIView):
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request):
+        return self.get_conditional_response(request, self.get_stats)
+
+    def get_stats(self, request):
+        """
+        Number of alerts per hour, state, type and beneficiary type (or the
+        ?group_by= subset of them) of the hours starting from ?since= (24h ago
+        by default) until ?until=, including the hours they fall within
+        """
+        serializer = AlertStatsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+
+        since = query.get("since", timezone.now() - timedelta(days=1))
+        rollups = AlertRollup.objects.filter(
+            organization_id=request.user.organization_id,
+            hour__gte=truncate_hour(since),
         )
-        serializer = AlertSerializer(queryset, many=True)
-        return Response(serializer.data)
+        if "until" in query:
+            rollups = rollups.filter(hour__lt=round_up_hour(query["until"]))
+
+        fields = query["group_by"]
+        if not fields:
+            return Response([rollups.aggregate(count=Coalesce(Sum("count"), 0))])
+        rows = list(
+            rollups.values(*fields)
+            .annotate(count=Sum("count"))
+            .filter(count__gt=0)
+            .order_by(*fields)
+        )
+        to_datetime = serializers.DateTimeField().to_representation
+        for row in rows:
+            if "hour" in row:
+                row["hour"] = to_datetime(row["hour"])
+        return Response(rows)
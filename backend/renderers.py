@@ -0,0 +1,69 @@
+"""
+JSON rendering backed by orjson, several times faster than the json module on
+large alert lists. Falls back to DRF's json based encoding when orjson is not
+installed or can't encode a value (e.g. integers over 64 bits).
+
+Clients on slow links may ask for MessagePack instead with
+`Accept: application/msgpack` (or ?format=msgpack), which encodes the same
+data in a more compact binary form.
+"""
+
+import json
+
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Same output as DRF's JSONRenderer with its default (compact, unicode) settings
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """Encodes data as JSON bytes, handling the types DRF's JSONEncoder does"""
+    if orjson is not None:
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except TypeError:
+            pass
+        else:
+            # Keep the output a strict javascript subset, as DRF does
+            if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+                ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028")
+                ret = ret.replace(b"\xe2\x80\xa9", b"\\u2029")
+            return ret
+    ret = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+    return ret.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        # Pretty printing, e.g. for the browsable API, is left to DRF
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+def packb(data):
+    """Encodes data as MessagePack, handling the types DRF's JSONEncoder does"""
+    return msgpack.packb(data, default=_encoder.default)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return packb(data)
@@ -140,6 +140,41 @@ if os.getenv("CHANNEL_BACKEND", DEFAULT_CHANNEL_LAYER) != DEFAULT_CHANNEL_LAYER:
         (os.getenv("REDIS_HOST", None), os.getenv("REDIS_PORT", None))
     ]
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+DEFAULT_CACHE_BACKEND = "django.core.cache.backends.locmem.LocMemCache"
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", DEFAULT_CACHE_BACKEND),
+    },
+}
+
+if os.getenv("CACHE_BACKEND", DEFAULT_CACHE_BACKEND) != DEFAULT_CACHE_BACKEND:
+    CACHES["default"]["LOCATION"] = "redis://{}:{}".format(
+        os.getenv("REDIS_HOST", None), os.getenv("REDIS_PORT", None)
+    )
+
+# Worker processes serving the app, as run by gunicorn_config.py or uvicorn
+# --workers. With more than one the cache must be shared by all of them (see
+# alerts/checks.py), the default LocMemCache isn't: until it is, ETags are
+# left out of the responses.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+# Telephone -> beneficiary resolution used on SMS ingestion. Entries live in
+# the shared cache and in a small LRU local to each worker; the local copy of
+# other workers may lag a Beneficiary change by at most the local timeout.
+BENEFICIARY_CACHE_TIMEOUT = int(os.getenv("BENEFICIARY_CACHE_TIMEOUT", 300))
+BENEFICIARY_LOCAL_CACHE_SIZE = int(os.getenv("BENEFICIARY_LOCAL_CACHE_SIZE", 1024))
+BENEFICIARY_LOCAL_CACHE_TIMEOUT = float(os.getenv("BENEFICIARY_LOCAL_CACHE_TIMEOUT", 2))
+# Matches returned by the ?search= of the beneficiaries list
+BENEFICIARY_SEARCH_MAX_RESULTS = int(os.getenv("BENEFICIARY_SEARCH_MAX_RESULTS", 50))
+# Rows validated and inserted together by the bulk import of beneficiaries,
+# and rows accepted by a single request to beneficiaries/import/
+BENEFICIARY_IMPORT_CHUNK_SIZE = int(os.getenv("BENEFICIARY_IMPORT_CHUNK_SIZE", 1000))
+BENEFICIARY_IMPORT_MAX_ITEMS = int(os.getenv("BENEFICIARY_IMPORT_MAX_ITEMS", 50000))
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -178,6 +213,18 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticated",
     ],
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
+    # orjson backed JSON and MessagePack, see backend/renderers.py
+    "DEFAULT_RENDERER_CLASSES": [
+        "backend.renderers.FastJSONRenderer",
+        "backend.renderers.MessagePackRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "backend.parsers.FastJSONParser",
+        "backend.parsers.MessagePackParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 # Internationalization
@@ -196,6 +243,54 @@ APPEND_SLASH = True
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", None)
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", None)
 DJANGO_TWILIO_FORGERY_PROTECTION = not DEBUG
+# Twilio retries a webhook that timed out with the same MessageSid; retries
+# received within this many seconds are answered without creating an alert.
+TWILIO_MESSAGE_SID_TIMEOUT = int(os.getenv("TWILIO_MESSAGE_SID_TIMEOUT", 86400))
+TWILIO_LOCAL_MESSAGE_SIDS_SIZE = int(os.getenv("TWILIO_LOCAL_MESSAGE_SIDS_SIZE", 4096))
+
+# "sync" inserts each alert received by the Twilio webhook within the request.
+# "batched" queues it and inserts queued alerts in bulk from a background thread
+# (see alerts/ingest.py), adding up to ALERTS_INGEST_MAX_LATENCY seconds before
+# the alert is stored and broadcast. Set ALERTS_INGEST_JOURNAL_DIR to a
+# persistent directory so alerts queued by a crashed worker are not lost. A
+# failing batch is retried ALERTS_INGEST_RETRIES times, then alert by alert.
+ALERTS_INGEST_MODE = os.getenv("ALERTS_INGEST_MODE", "sync")
+ALERTS_INGEST_QUEUE_SIZE = int(os.getenv("ALERTS_INGEST_QUEUE_SIZE", 10000))
+ALERTS_INGEST_BATCH_SIZE = int(os.getenv("ALERTS_INGEST_BATCH_SIZE", 200))
+ALERTS_INGEST_MAX_LATENCY = float(os.getenv("ALERTS_INGEST_MAX_LATENCY", 0.25))
+ALERTS_INGEST_JOURNAL_DIR = os.getenv("ALERTS_INGEST_JOURNAL_DIR", None)
+ALERTS_INGEST_RETRIES = int(os.getenv("ALERTS_INGEST_RETRIES", 5))
+
+# Messages of a beneficiary whose new alert was created less than this many
+# seconds before update that alert instead of creating another one (0 disables).
+ALERTS_COALESCE_WINDOW = int(os.getenv("ALERTS_COALESCE_WINDOW", 60))
+
+# The rolling 24h summary of each organization lives in the cache (see
+# alerts/summary.py) and is rebuilt from the database at least this often.
+ALERTS_SUMMARY_TIMEOUT = int(os.getenv("ALERTS_SUMMARY_TIMEOUT", 3600))
+# Changes are appended to it as deltas, which readers merge and store back once
+# this many are pending. Past ALERTS_SUMMARY_MAX_PENDING it's rebuilt instead.
+ALERTS_SUMMARY_COMPACT_AFTER = int(os.getenv("ALERTS_SUMMARY_COMPACT_AFTER", 20))
+ALERTS_SUMMARY_MAX_PENDING = int(os.getenv("ALERTS_SUMMARY_MAX_PENDING", 1000))
+
+# Rows fetched per round trip by the streaming exports of alerts/export/
+ALERTS_EXPORT_CHUNK_SIZE = int(os.getenv("ALERTS_EXPORT_CHUNK_SIZE", 2000))
+
+# Maximum number of readings accepted by a single request to alerts-bulk/
+ALERTS_BULK_MAX_ITEMS = int(os.getenv("ALERTS_BULK_MAX_ITEMS", 500))
+
+# Maximum number of alerts changed by a single request to alerts/transition/
+ALERTS_TRANSITION_MAX_ITEMS = int(os.getenv("ALERTS_TRANSITION_MAX_ITEMS", 1000))
+
+# The changes/ endpoints answer up to ALERTS_CHANGES_MAX_ITEMS rows per request.
+# Their cursors stay ALERTS_CHANGES_LAG seconds behind the present, so rows
+# written by transactions that were still running are sent on the next poll.
+ALERTS_CHANGES_MAX_ITEMS = int(os.getenv("ALERTS_CHANGES_MAX_ITEMS", 1000))
+ALERTS_CHANGES_LAG = float(os.getenv("ALERTS_CHANGES_LAG", 5))
+
+# Blocks of map clusters of alerts/clusters/ are cached for at most this many
+# seconds, see alerts/clusters.py
+ALERTS_CLUSTERS_TIMEOUT = int(os.getenv("ALERTS_CLUSTERS_TIMEOUT", 600))
 
 
 # Static files (CSS, JavaScript, Images)
@@ -0,0 +1,67 @@
+"""
+Query plans and latency of the hot alert and beneficiary queries, with and
+without the indexes declared in `Alert.Meta` and `Beneficiary.Meta`.
+
+    python -m benchmarks.bench_alert_indexes --alerts 1000000
+"""
+
+import argparse
+
+from benchmarks.utils import benchmark_database, measure, seed_alerts, setup
+
+
+def queries(organization):
+    from alerts.models import Alert, Beneficiary
+
+    alerts = Alert.objects.filter(organization=organization)
+    return {
+        "alert list": alerts.order_by("-datetime", "-id")[:100],
+        "open alerts": alerts.filter(state__in=["N", "A"]).order_by("-datetime")[:100],
+        "alerts by state": alerts.filter(state="A").order_by("-datetime")[:100],
+        "beneficiary by telephone": Beneficiary.objects.filter(
+            telephone_e164="+5491100000042", enabled=True
+        ),
+    }
+
+
+def run(connection, organization, label):
+    print(f"\n=== {label} ===")
+    for name, queryset in queries(organization).items():
+        best, median = measure(lambda: list(queryset.all()), repeat=10)
+        print(f"\n--- {name}: best {best:.2f} ms, median {median:.2f} ms")
+        print(queryset.explain())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, default=1_000_000)
+    parser.add_argument("--organizations", type=int, default=10)
+    args = parser.parse_args()
+
+    setup()
+
+    from alerts.models import Alert, Beneficiary
+
+    with benchmark_database() as connection:
+        organizations = seed_alerts(args.alerts, organizations=args.organizations)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        indexes = [(Alert, index) for index in Alert._meta.indexes] + [
+            (Beneficiary, index) for index in Beneficiary._meta.indexes
+        ]
+        with connection.schema_editor() as schema_editor:
+            for model, index in indexes:
+                schema_editor.remove_index(model, index)
+        run(connection, organizations[0], "without indexes")
+
+        with connection.schema_editor() as schema_editor:
+            for model, index in indexes:
+                schema_editor.add_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        run(connection, organizations[0], "with indexes")
+
+
+if __name__ == "__main__":
+    main()
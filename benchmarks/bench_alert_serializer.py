@@ -0,0 +1,52 @@
+"""
+Time to serialize a list of alerts with AlertSerializer over model instances
+(select_related) and with serialize_alert_values over .values() rows, checking
+that both render the same JSON.
+
+    python -m benchmarks.bench_alert_serializer --alerts 10000
+"""
+
+import argparse
+
+from benchmarks.utils import benchmark_database, measure, seed_alerts, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, default=10_000)
+    args = parser.parse_args()
+
+    setup()
+
+    from rest_framework.renderers import JSONRenderer
+
+    from alerts.models import Alert
+    from alerts.serializers import AlertSerializer, alert_values, serialize_alert_values
+
+    with benchmark_database():
+        seed_alerts(args.alerts, organizations=1)
+        queryset = Alert.objects.order_by("-datetime", "-id")
+
+        def model_serializer():
+            alerts = queryset.select_related("beneficiary", "beneficiary__type", "type")
+            return AlertSerializer(alerts, many=True).data
+
+        def values_serializer():
+            return serialize_alert_values(alert_values(queryset))
+
+        renderer = JSONRenderer()
+        same = renderer.render(model_serializer()) == renderer.render(
+            values_serializer()
+        )
+        print(f"{args.alerts} alerts, identical JSON: {same}")
+
+        for name, func in [
+            ("AlertSerializer", model_serializer),
+            ("serialize_alert_values", values_serializer),
+        ]:
+            best, median = measure(func)
+            print(f"{name:>24}: best {best:.2f} ms, median {median:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
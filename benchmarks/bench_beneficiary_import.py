@@ -0,0 +1,67 @@
+"""
+Time to load beneficiaries with the bulk import of alerts/imports.py against
+creating them one by one with BeneficiarySerializer, as POST beneficiaries/
+does. The serializer path is timed on a sample and extrapolated.
+
+    python -m benchmarks.bench_beneficiary_import --rows 50000 --sample 1000
+"""
+
+import argparse
+import time
+from types import SimpleNamespace
+
+from benchmarks.utils import benchmark_database, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--sample", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup()
+
+    from alerts.imports import import_beneficiaries
+    from alerts.models import BeneficiaryType
+    from alerts.serializers import BeneficiarySerializer
+    from users.models import Organization
+
+    def rows(count, offset):
+        return [
+            {
+                "name": f"Nombre {i}",
+                "surname": f"Apellido {i}",
+                "telephone": f"11{offset + i:08d}",
+                "description": "",
+                "type_id": beneficiary_type.id,
+            }
+            for i in range(count)
+        ]
+
+    with benchmark_database():
+        organization = Organization.objects.create(name="Benchmark")
+        beneficiary_type = BeneficiaryType.objects.create(
+            code="SER", description="Sereno", organization=organization
+        )
+        user = SimpleNamespace(organization=organization)
+        context = {"request": SimpleNamespace(method="POST", user=user)}
+
+        start = time.perf_counter()
+        for data in rows(args.sample, 0):
+            serializer = BeneficiarySerializer(data=data, context=context)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        serializer_time = (time.perf_counter() - start) / args.sample * args.rows
+
+        start = time.perf_counter()
+        result = import_beneficiaries(organization, rows(args.rows, args.sample))
+        import_time = time.perf_counter() - start
+        assert result["created"] == args.rows, result["errors"][:5]
+
+    print(f"{args.rows} beneficiaries")
+    print(f"  serializer: {serializer_time:>8.1f} s (from {args.sample} rows)")
+    print(f"      import: {import_time:>8.1f} s")
+
+
+if __name__ == "__main__":
+    main()
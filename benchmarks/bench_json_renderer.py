@@ -0,0 +1,56 @@
+"""
+Rendering and parsing throughput of backend.renderers.FastJSONRenderer and
+backend.parsers.FastJSONParser (orjson) against DRF's json based JSONRenderer
+and JSONParser, on a page of serialized alerts.
+
+    python -m benchmarks.bench_json_renderer --alerts 10000
+"""
+
+import argparse
+import io
+
+from benchmarks.utils import benchmark_database, measure, seed_alerts, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, default=10_000)
+    args = parser.parse_args()
+
+    setup()
+
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+
+    from alerts.models import Alert
+    from alerts.serializers import alert_values, serialize_alert_values
+    from backend.parsers import FastJSONParser
+    from backend.renderers import FastJSONRenderer
+
+    with benchmark_database():
+        seed_alerts(args.alerts, organizations=1)
+        queryset = Alert.objects.order_by("-datetime", "-id")
+        data = serialize_alert_values(alert_values(queryset))
+
+    content = JSONRenderer().render(data)
+    print(f"{args.alerts} alerts, {len(content) / 1024:.0f} KiB")
+    print(f"identical JSON: {FastJSONRenderer().render(data) == content}")
+
+    for name, renderer in [
+        ("JSONRenderer", JSONRenderer()),
+        ("FastJSONRenderer", FastJSONRenderer()),
+    ]:
+        best, median = measure(lambda: renderer.render(data), repeat=10)
+        print(f"{name:>18}: best {best:.2f} ms, median {median:.2f} ms")
+    for name, json_parser in [
+        ("JSONParser", JSONParser()),
+        ("FastJSONParser", FastJSONParser()),
+    ]:
+        best, median = measure(
+            lambda: json_parser.parse(io.BytesIO(content)), repeat=10
+        )
+        print(f"{name:>18}: best {best:.2f} ms, median {median:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
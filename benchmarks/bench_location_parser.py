@@ -0,0 +1,70 @@
+"""
+Throughput of alerts.location.parse_location over a corpus of SMS bodies sent
+by real handsets and trackers, compared with the previous split based parser,
+which only understood https://maps.google.com/?q=<lat>,<lng>.
+
+    python -m benchmarks.bench_location_parser
+"""
+
+import timeit
+
+from alerts.location import parse_location
+
+CORPUS = [
+    "https://maps.google.com/?q=-34.75755778740859,-58.28999854451876",
+    "Necesito ayuda! Mi ubicacion: https://maps.google.com/?q=-34.654905,-58.6497804",
+    "https://maps.google.com/maps?q=-34.6037,+-58.3816&z=17",
+    "https://www.google.com/maps/search/?api=1&query=-34.6037%2C-58.3816",
+    "https://www.google.com/maps/@-34.6326636,-58.692194399,15z",
+    "https://www.google.com/maps/place/Obelisco/@-34.6037389,-58.3815704,17z/"
+    "data=!3m1!4b1!4m6!3m5!1s0x95bccacb9f8ff113:0x22ff7a6e5f5c5e0!8m2!3d-34.6037!4d-58.38",
+    "https://www.google.com/maps?ll=-34.676289,-58.378931&z=16&t=m",
+    "geo:-34.6497796,-58.51051807?z=17",
+    "geo:-34.6497796,-58.51051807;u=35",
+    "SOS lat:-34.6037 lon:-58.3816 spd:0 bat:85%",
+    "LAT=-34.6037, LONG=-58.3816",
+    "Ayuda! -34.6037, -58.3816",
+    "-34.757884 -58.2927029",
+    "Llamar al 1154047987 a las 12.30",
+    "Ayuda",
+]
+
+
+def legacy_parse_location(body):
+    if body and "https://maps.google.com/?q=" in body:
+        try:
+            latitude, longitude = body.split("https://maps.google.com/?q=")[1].split(
+                ","
+            )
+            return latitude, longitude
+        except ValueError:
+            return None
+    return None
+
+
+def main():
+    for name, parser in [
+        ("legacy", legacy_parse_location),
+        ("parse_location", parse_location),
+    ]:
+        accepted = sum(parser(body) is not None for body in CORPUS)
+        number = 2000
+        seconds = min(
+            timeit.repeat(
+                lambda: [parser(body) for body in CORPUS], number=number, repeat=5
+            )
+        )
+        per_body = seconds / (number * len(CORPUS)) * 1_000_000
+        print(
+            f"{name:>16}: accepted {accepted}/{len(CORPUS)} bodies, "
+            f"{per_body:.2f} us per body"
+        )
+
+    print()
+    for body in CORPUS:
+        seconds = min(timeit.repeat(lambda: parse_location(body), number=2000))
+        print(f"{seconds / 2000 * 1_000_000:8.2f} us  {parse_location(body)}  {body}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Size and encoding time of MessagePack against JSON (orjson), both for a page
+of serialized alerts as rendered by the REST API and for the single alert
+messages sent to the websocket consumers.
+
+    python -m benchmarks.bench_msgpack --alerts 1000
+"""
+
+import argparse
+import gzip
+
+from benchmarks.utils import benchmark_database, measure, seed_alerts, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--alerts", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup()
+
+    import msgpack
+
+    from alerts.models import Alert
+    from alerts.serializers import alert_values, serialize_alert_values
+    from backend.renderers import dumps, packb
+
+    with benchmark_database():
+        seed_alerts(args.alerts, organizations=1)
+        queryset = Alert.objects.order_by("-datetime", "-id")
+        data = serialize_alert_values(alert_values(queryset))
+
+    for label, payload in [
+        (f"page of {args.alerts} alerts", data),
+        ("websocket message", data[0]),
+    ]:
+        print(label)
+        for name, encode, decode in [
+            ("JSON", dumps, None),
+            ("MessagePack", packb, msgpack.unpackb),
+        ]:
+            content = encode(payload)
+            if decode is not None:
+                assert decode(content) == payload
+            compressed = len(gzip.compress(content))
+            best, median = measure(lambda: encode(payload), repeat=20)
+            print(
+                f"{name:>12}: {len(content):>9} bytes ({compressed:>8} gzipped), "
+                f"encode best {best:.3f} ms, median {median:.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks are run from the repository root as modules, for example:
+
+    python -m benchmarks.bench_alert_indexes --alerts 1000000
+
+They create (and afterwards destroy) their own test database using the
+connection configured in ``backend.settings``, so they never touch real data.
+Use a PostgreSQL database to get numbers representative of production.
+"""
+
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from random import Random
+
+import django
+
+
+def setup():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    django.setup()
+
+
+@contextmanager
+def benchmark_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, repeat=5):
+    """Returns the best and median wall time of `func`, in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), statistics.median(timings)
+
+
+def seed_alerts(alerts, organizations=10, beneficiaries=1000, batch_size=10000):
+    """Creates organizations, types, beneficiaries and `alerts` alerts spread
+    over the last year. Returns the list of organizations."""
+    from django.utils import timezone
+
+    from alerts.models import Alert, AlertType, Beneficiary, BeneficiaryType
+    from alerts.utils import normalize_telephone
+    from users.models import Organization
+
+    rng = Random(0)
+    now = timezone.now()
+
+    orgs = Organization.objects.bulk_create(
+        [Organization(name=f"Org {i}") for i in range(organizations)]
+    )
+    beneficiary_types = BeneficiaryType.objects.bulk_create(
+        [
+            BeneficiaryType(code="SER", description="Sereno", organization=org)
+            for org in orgs
+        ]
+    )
+    alert_types = AlertType.objects.bulk_create(
+        [
+            AlertType(code="TEST", description="Prueba de alerta", organization=org)
+            for org in orgs
+        ]
+    )
+    people = Beneficiary.objects.bulk_create(
+        [
+            Beneficiary(
+                name="Juan",
+                surname="Perez",
+                telephone=f"11{i:08d}",
+                telephone_e164=normalize_telephone(f"11{i:08d}"),
+                description="beneficiario",
+                enabled=rng.random() > 0.1,
+                organization=orgs[i % organizations],
+                type=beneficiary_types[i % organizations],
+            )
+            for i in range(beneficiaries)
+        ],
+        batch_size=batch_size,
+    )
+
+    pending = []
+    for i in range(alerts):
+        beneficiary = people[rng.randrange(beneficiaries)]
+        index = orgs.index(beneficiary.organization)
+        # Almost every alert in a real table is closed, only the last ones are open
+        state = "C" if i < alerts * 0.98 else rng.choice(["N", "A"])
+        pending.append(
+            Alert(
+                datetime=now - timedelta(seconds=(alerts - i) * 30),
+                beneficiary=beneficiary,
+                latitude=f"{-34.6 + rng.uniform(-0.2, 0.2):.8f}",
+                longitude=f"{-58.4 + rng.uniform(-0.2, 0.2):.8f}",
+                state=state,
+                type=alert_types[index],
+                organization=beneficiary.organization,
+            )
+        )
+        if len(pending) >= batch_size:
+            Alert.objects.bulk_create(pending)
+            pending = []
+    Alert.objects.bulk_create(pending)
+    return orgs
@@ -1,4 +1,8 @@
-workers = 4
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+# Read by the settings, see alerts/checks.py
+os.environ["WEB_CONCURRENCY"] = str(workers)
 bind = "0.0.0.0:8000"
 chdir = "/opt/gpstracker-backend/"
 module = "app.wsgi:application"